@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+asyncio用の軽量HTTP/1.1クライアント（Keep-Aliveコネクションプール付き）
+負荷試験・ベンチマークスクリプトから標準ライブラリのみで利用する
+"""
+
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+
+def parse_server_timing(header):
+    """Server-Timing ヘッダー（"translate;dur=812.3, search;dur=95"）を {名前: ミリ秒} にする"""
+    stages = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key.strip() == "dur":
+                try:
+                    stages[name] = float(value.strip().strip('"'))
+                except ValueError:
+                    pass
+    return stages
+
+
+class HTTPResponse:
+    """HTTPレスポンス（ステータス・ヘッダー・本文・タイミング）"""
+
+    def __init__(self, status, headers, body, ttfb_ms, elapsed_ms):
+        self.status = status
+        self.headers = headers  # ヘッダー名は小文字
+        self.body = body
+        self.ttfb_ms = ttfb_ms  # リクエスト送信からステータス行受信まで
+        self.elapsed_ms = elapsed_ms  # リクエスト送信から本文受信完了まで
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    @property
+    def server_timing(self):
+        return parse_server_timing(self.headers.get("server-timing"))
+
+
+class ConnectionPool:
+    """単一オリジン向けのKeep-Aliveコネクションプール
+
+    同時接続数は max_connections で制限し、使い終わった接続は再利用する。
+    """
+
+    def __init__(self, base_url, max_connections=10, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._ssl = ssl.create_default_context() if self.scheme == "https" else None
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self.connections_opened = 0
+
+    async def _open(self):
+        self.connections_opened += 1
+        return await asyncio.open_connection(
+            self.host, self.port, ssl=self._ssl,
+            server_hostname=self.host if self._ssl else None,
+        )
+
+    async def _acquire(self):
+        await self._semaphore.acquire()
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        try:
+            return await asyncio.wait_for(self._open(), self.timeout)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def _release(self, conn, reusable):
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        self._semaphore.release()
+
+    async def request(self, method, path, body=None, headers=None, on_chunk=None):
+        """リクエストを送信しレスポンスを返す
+
+        on_chunk を指定すると本文をチャンク単位で渡し、HTTPResponse.body は空になる
+        （大きな本文をメモリに溜めずに処理するため）。
+        """
+        conn = await self._acquire()
+        reusable = False
+        try:
+            response, reusable = await asyncio.wait_for(
+                self._exchange(conn, method, path, body, headers or {}, on_chunk),
+                self.timeout,
+            )
+            return response
+        finally:
+            self._release(conn, reusable)
+
+    async def _exchange(self, conn, method, path, body, headers, on_chunk):
+        reader, writer = conn
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        lines = [f"{method} {self.base_path}{path} HTTP/1.1", f"Host: {self.host}"]
+        merged = {"Connection": "keep-alive", "User-Agent": "skb-async-http"}
+        merged.update(headers)
+        if body is not None:
+            merged["Content-Length"] = str(len(body))
+        lines.extend(f"{name}: {value}" for name, value in merged.items())
+        request_bytes = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+        start = time.perf_counter()
+        writer.write(request_bytes)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("接続がサーバーによって閉じられました")
+        ttfb_ms = (time.perf_counter() - start) * 1000
+        status = int(status_line.split()[1])
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        chunks = []
+        sink = on_chunk or chunks.append
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+
+        if method == "HEAD" or status in (204, 304):
+            pass
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                sink(await reader.readexactly(size))
+                await reader.readline()
+        elif "content-length" in response_headers:
+            remaining = int(response_headers["content-length"])
+            while remaining > 0:
+                data = await reader.read(min(remaining, 65536))
+                if not data:
+                    raise ConnectionError("本文の受信中に接続が閉じられました")
+                sink(data)
+                remaining -= len(data)
+        else:
+            # 長さ不明: 接続終了まで読み込む
+            keep_alive = False
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                sink(data)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        response = HTTPResponse(status, response_headers, b"".join(chunks), ttfb_ms, elapsed_ms)
+        return response, keep_alive
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+チャンク分割戦略のベンチマーク
+crawled_pages のテキストを、文字数ベース（document-processor.ts の RecursiveCharacterTextSplitter 相当）、
+日本語の文境界を考慮した分割、トークン数ベースの分割の各設定で分割し、
+ローカルの決定的embedding（local_embedder.py）で検索したときの recall@k と、
+ページあたりのチャンク数・保存バイト数・embedding呼び出し数を比較する。
+
+評価用の質問は各ページの文から自動生成し、その文を（ほぼ）丸ごと含むチャンクが
+top-k に入れば正解とする。文がチャンク境界で分断されると正解にならないため、分割方法の差が表れる。
+
+使い方:
+  python chunking_benchmark.py --pages crawled_pages.json          # pages:getAllPages のエクスポート
+  python chunking_benchmark.py --convex-url http://127.0.0.1:3210   # Convex（または代替サーバー）から取得
+  python chunking_benchmark.py                                      # 合成ページで実行
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+
+import numpy as np
+import requests
+
+from embedding_store import iter_documents
+from local_embedder import EMBEDDING_DIM, LocalEmbedder
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]  # document-processor.ts と同じ
+EMBED_BATCH_SIZE = 100  # embedDocuments（batchEmbedContents）の1回あたりの上限
+BYTES_PER_DIMENSION = 8  # documents.embedding は v.float64()
+SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]*(?:[。！？!?]+|\n+|$)")
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|[ぁ-ゖ]+|[ァ-ヺー]+|[一-龯々〆]|\S")
+SPAN_COVERAGE = 0.8  # 正解の文のうちチャンクに含まれている必要がある割合
+
+
+def recursive_character_split(text, chunk_size=1000, chunk_overlap=200, separators=DEFAULT_SEPARATORS):
+    """LangChain の RecursiveCharacterTextSplitter と同じ手順で分割する
+
+    優先度の高い区切り文字で分け、chunk_size を超える断片はより細かい区切り文字で再帰的に分け、
+    chunk_overlap 文字分の断片を重ねながら chunk_size 以下のチャンクにまとめる。
+    """
+    separator = separators[-1]
+    remaining = []
+    for i, candidate in enumerate(separators):
+        if candidate == "" or candidate in text:
+            separator = candidate
+            remaining = separators[i + 1:]
+            break
+
+    splits = [s for s in (text.split(separator) if separator else list(text)) if s]
+    chunks = []
+    good_splits = []
+    for split in splits:
+        if len(split) < chunk_size:
+            good_splits.append(split)
+            continue
+        if good_splits:
+            chunks.extend(_merge_splits(good_splits, separator, chunk_size, chunk_overlap))
+            good_splits = []
+        if remaining:
+            chunks.extend(recursive_character_split(split, chunk_size, chunk_overlap, remaining))
+        else:
+            chunks.append(split)
+    if good_splits:
+        chunks.extend(_merge_splits(good_splits, separator, chunk_size, chunk_overlap))
+    return chunks
+
+
+def _merge_splits(splits, separator, chunk_size, chunk_overlap):
+    chunks = []
+    current = []
+    total = 0
+    for split in splits:
+        length = len(split)
+        if current and total + length + len(separator) > chunk_size:
+            chunk = separator.join(current).strip()
+            if chunk:
+                chunks.append(chunk)
+            # 重なり分だけ末尾の断片を残す
+            while total > chunk_overlap or (current and total + length + len(separator) > chunk_size):
+                total -= len(current[0]) + (len(separator) if len(current) > 1 else 0)
+                current.pop(0)
+        current.append(split)
+        total += length + (len(separator) if len(current) > 1 else 0)
+    chunk = separator.join(current).strip()
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def split_sentences(text):
+    """日本語の句点・感嘆符・疑問符・改行で文に分ける
+
+    区切り文字は文に含め、段落間の改行も1つの断片として残す（連結すると元のテキストに戻る）。
+    """
+    return [s for s in SENTENCE_PATTERN.findall(text) if s]
+
+
+def sentence_split(text, chunk_size=1000, chunk_overlap=200):
+    """文の途中で切らずに chunk_size 文字以下へ詰め、末尾 chunk_overlap 文字以内の文を次のチャンクに重ねる
+
+    1文だけで chunk_size を超える場合は文字数で分割する。
+    """
+    chunks = []
+    current = []
+    total = 0
+    for sentence in split_sentences(text):
+        if len(sentence) > chunk_size:
+            if current:
+                chunks.append("".join(current).strip())
+                current, total = [], 0
+            chunks.extend(recursive_character_split(sentence, chunk_size, chunk_overlap))
+            continue
+        if current and total + len(sentence) > chunk_size:
+            chunks.append("".join(current).strip())
+            overlap = []
+            overlap_total = 0
+            for previous in reversed(current):
+                if overlap_total + len(previous) > chunk_overlap or overlap_total + len(previous) + len(sentence) > chunk_size:
+                    break
+                overlap.insert(0, previous)
+                overlap_total += len(previous)
+            current, total = overlap, overlap_total
+        current.append(sentence)
+        total += len(sentence)
+    if current:
+        chunks.append("".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+def token_split(text, chunk_tokens=256, overlap_tokens=32):
+    """近似トークン（英数字の単語・ひらがな列・カタカナ列・漢字1文字・記号）の固定ウィンドウで分割する"""
+    spans = [m.span() for m in TOKEN_PATTERN.finditer(text)]
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_tokens]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_tokens >= len(spans):
+            break
+    return chunks
+
+
+CHUNKERS = {
+    "character": recursive_character_split,
+    "sentence": sentence_split,
+    "token": token_split,
+}
+
+DEFAULT_GRID = [
+    ("character", 1000, 200),  # document-processor.ts の現在の既定値（基準）
+    ("character", 500, 100),
+    ("character", 1500, 200),
+    ("character", 1000, 0),
+    ("sentence", 500, 100),
+    ("sentence", 1000, 0),
+    ("sentence", 1000, 200),
+    ("sentence", 1500, 200),
+    ("token", 256, 32),
+    ("token", 512, 64),
+]
+
+
+def locate_chunks(text, chunks):
+    """各チャンクの元テキスト内での (start, end) を求める（LangChainのメタデータと同じくindexOfで探す）"""
+    spans = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start < 0:
+            start = text.find(chunk)
+        if start < 0:
+            spans.append(None)
+            continue
+        spans.append((start, start + len(chunk)))
+        cursor = start + 1
+    return spans
+
+
+def synthesize_pages(count=40, seed=0):
+    """ゲーム攻略サイト風の日本語ページを生成する（実データがない場合の評価用）"""
+    rng = random.Random(seed)
+    items = ["炎の剣", "氷の盾", "雷の杖", "風の弓", "大地の鎧", "光の指輪", "闇の外套", "水の槍", "星の冠", "月の靴"]
+    stats = ["攻撃力", "防御力", "会心率", "素早さ", "最大HP", "魔力", "命中率", "回避率"]
+    materials = ["強化石", "精錬鉱", "魔晶石", "古代の欠片", "竜の鱗", "妖精の粉"]
+    places = ["北の洞窟", "砂漠の遺跡", "港町の商店", "天空の塔", "迷いの森", "地下水路"]
+    templates = [
+        "{item}の{stat}は強化段階{n}で{value}上昇します。",
+        "{item}を強化するには{material}が{n}個必要です。",
+        "{material}は{place}で入手でき、ドロップ率は約{rate}%です。",
+        "{place}のボスは{stat}が高いため、{item}の装備をおすすめします。",
+        "強化に失敗すると{material}が{n}個失われますが、{item}自体は壊れません。",
+        "イベント期間中は{place}で{material}の獲得量が{n}倍になります！",
+        "{item}の限界突破には{material}と{material2}がそれぞれ{n}個ずつ必要です。",
+        "初心者はまず{item}を強化段階{n}まで上げると{place}の攻略が楽になります。",
+    ]
+
+    pages = []
+    for page_index in range(count):
+        # 実際の攻略ページと同様に、ページごとに扱う装備・場所を絞る
+        page_items = rng.sample(items, 2)
+        page_places = rng.sample(places, 2)
+        paragraphs = []
+        for _ in range(rng.randint(6, 14)):
+            sentences = []
+            for _ in range(rng.randint(3, 7)):
+                sentences.append(rng.choice(templates).format(
+                    item=rng.choice(page_items), stat=rng.choice(stats), material=rng.choice(materials),
+                    material2=rng.choice(materials), place=rng.choice(page_places), n=rng.randint(2, 20),
+                    value=rng.randint(5, 300), rate=rng.randint(1, 60)))
+            paragraphs.append("".join(sentences))
+        pages.append({"url": f"https://example.com/guide/{page_index}", "text": "\n\n".join(paragraphs)})
+    return pages
+
+
+def load_pages(path=None, convex_url=None):
+    """crawled_pages をエクスポートファイルまたはConvexの pages:getAllPages から読み込む"""
+    if path:
+        pages = list(iter_documents(path))
+    elif convex_url:
+        response = requests.post(f"{convex_url}/api/query",
+                                 json={"path": "pages:getAllPages", "args": {}}, timeout=60)
+        response.raise_for_status()
+        result = response.json()
+        pages = result.get("value", result) if isinstance(result, dict) else result
+    else:
+        pages = synthesize_pages()
+    return [{"url": page["url"], "text": page["text"]} for page in pages if page.get("text", "").strip()]
+
+
+def build_queries(pages, count=300, min_sentence_chars=20, seed=1):
+    """各ページの文から質問を作る: 文の一部（先頭・末尾を削った中央部分）を質問文とし、元の文の位置を正解とする"""
+    rng = random.Random(seed)
+    candidates = []
+    for page_index, page in enumerate(pages):
+        cursor = 0
+        for sentence in split_sentences(page["text"]):
+            start = page["text"].find(sentence, cursor)
+            cursor = start + len(sentence)
+            stripped = sentence.strip()
+            if len(stripped) >= min_sentence_chars:
+                offset = start + sentence.index(stripped)
+                candidates.append((page_index, offset, offset + len(stripped), stripped))
+
+    queries = []
+    for page_index, start, end, sentence in rng.sample(candidates, min(count, len(candidates))):
+        trim = len(sentence) // 5
+        question = sentence[rng.randint(0, trim):len(sentence) - rng.randint(0, trim)]
+        queries.append({"page": page_index, "start": start, "end": end, "question": question})
+    return queries
+
+
+def evaluate(pages, queries, query_vectors, chunker, chunk_size, chunk_overlap, k=5):
+    """1つの設定で全ページを分割・埋め込みし、コスト指標とrecall@kを返す"""
+    split = CHUNKERS[chunker]
+    embedder = LocalEmbedder()
+    chunk_texts = []
+    chunk_pages = []
+    chunk_spans = []
+    for page_index, page in enumerate(pages):
+        chunks = split(page["text"], chunk_size, chunk_overlap)
+        chunk_texts.extend(chunks)
+        chunk_pages.extend([page_index] * len(chunks))
+        chunk_spans.extend(locate_chunks(page["text"], chunks))
+
+    # 現在の実装は1チャンクごとに embedQuery を呼ぶため、呼び出し数はチャンク数と同じ
+    per_chunk_calls = len(chunk_texts)
+    vectors = np.concatenate([embedder.embed_documents(chunk_texts[i:i + EMBED_BATCH_SIZE])
+                              for i in range(0, len(chunk_texts), EMBED_BATCH_SIZE)] or
+                             [np.zeros((0, EMBEDDING_DIM), dtype=np.float32)])
+
+    hits = 0
+    if len(vectors):
+        scores = query_vectors @ vectors.T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        for query, candidates in zip(queries, top):
+            for chunk_index in candidates:
+                span = chunk_spans[chunk_index]
+                if chunk_pages[chunk_index] != query["page"] or span is None:
+                    continue
+                covered = max(0, min(span[1], query["end"]) - max(span[0], query["start"]))
+                if covered >= SPAN_COVERAGE * (query["end"] - query["start"]):
+                    hits += 1
+                    break
+
+    text_bytes = sum(len(chunk.encode("utf-8")) for chunk in chunk_texts)
+    chunk_lengths = [len(chunk) for chunk in chunk_texts]
+    return {
+        "chunker": chunker,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunks": len(chunk_texts),
+        "chunks_per_page": len(chunk_texts) / len(pages),
+        "mean_chunk_chars": float(np.mean(chunk_lengths)) if chunk_lengths else 0.0,
+        "text_bytes": text_bytes,
+        "embedding_bytes": len(chunk_texts) * EMBEDDING_DIM * BYTES_PER_DIMENSION,
+        "bytes_stored": text_bytes + len(chunk_texts) * EMBEDDING_DIM * BYTES_PER_DIMENSION,
+        "embedded_chars": embedder.chars,
+        "embed_calls_per_chunk": per_chunk_calls,
+        "embed_calls_batched": math.ceil(len(chunk_texts) / EMBED_BATCH_SIZE),
+        f"recall@{k}": hits / len(queries) if queries else 0.0,
+    }
+
+
+def recommend(results, k=5, tolerance=0.01):
+    """基準（先頭の設定）と比べてrecallの低下が tolerance 以内の設定のうち、保存バイト数が最小のものを選ぶ"""
+    baseline = results[0]
+    key = f"recall@{k}"
+    acceptable = [r for r in results if r[key] >= baseline[key] - tolerance]
+    return min(acceptable, key=lambda r: r["bytes_stored"])
+
+
+def run_benchmark(pages, grid=DEFAULT_GRID, queries=300, k=5):
+    query_list = build_queries(pages, queries)
+    query_vectors = LocalEmbedder().embed_documents([q["question"] for q in query_list])
+    print(f"📄 {len(pages)}ページ, 質問 {len(query_list)}件, top-{k}")
+
+    results = []
+    for chunker, chunk_size, chunk_overlap in grid:
+        result = evaluate(pages, query_list, query_vectors, chunker, chunk_size, chunk_overlap, k)
+        results.append(result)
+        print(f"  {chunker:<9} size={chunk_size:<5} overlap={chunk_overlap:<4} "
+              f"chunks/page {result['chunks_per_page']:5.1f}  {result['bytes_stored'] / 1048576:6.2f}MB  "
+              f"calls {result['embed_calls_per_chunk']:>5} (batched {result['embed_calls_batched']:>3})  "
+              f"recall@{k} {result[f'recall@{k}']:.3f}")
+    return results
+
+
+def parse_grid(values):
+    """"chunker:size:overlap" 形式の設定一覧を解析する"""
+    grid = []
+    for value in values:
+        chunker, size, overlap = value.split(":")
+        if chunker not in CHUNKERS:
+            raise argparse.ArgumentTypeError(f"未知のchunker: {chunker}")
+        grid.append((chunker, int(size), int(overlap)))
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="チャンク分割戦略のベンチマーク")
+    parser.add_argument("--pages", help="crawled_pages のエクスポート（JSON/JSONL）")
+    parser.add_argument("--convex-url", help="pages:getAllPages を呼ぶConvexのURL")
+    parser.add_argument("--grid", nargs="+", help="評価する設定（例: character:1000:200 sentence:800:100 token:256:32）")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.01, help="基準からのrecall低下の許容幅")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.convex_url)
+    if not pages:
+        raise SystemExit("テキストを持つページがありません")
+
+    grid = parse_grid(args.grid) if args.grid else DEFAULT_GRID
+    results = run_benchmark(pages, grid, args.queries, args.k)
+    best = recommend(results, args.k, args.tolerance)
+    baseline = results[0]
+    print(f"\n✅ 推奨: {best['chunker']} size={best['chunk_size']} overlap={best['chunk_overlap']} "
+          f"(保存量 {best['bytes_stored'] / max(1, baseline['bytes_stored']) * 100:.0f}%、"
+          f"embedding文字数 {best['embedded_chars'] / max(1, baseline['embedded_chars']) * 100:.0f}%、"
+          f"recall@{args.k} {best[f'recall@{args.k}']:.3f} / 基準 {baseline[f'recall@{args.k}']:.3f})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "recommended": best}, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
@@ -0,0 +1,664 @@
+#!/usr/bin/env python3
+"""
+Convex HTTP API のローカル代替サーバー
+convex-client.ts や skb-intelligence の各ツールが使う /api/query・/api/mutation・/api/action を
+インメモリのテーブルとベクトルインデックスで提供し、本番のConvexやネットワークに依存せずに
+検証・負荷試験を再現可能な形で高レートに実行できるようにする。
+
+対応する関数（skb-datastore/convex/*.ts と同じ名前・引数・戻り値の形）:
+  pages:addPage / getPendingPages / updatePageStatus / getAllPages / getPageByUrl
+        getPendingPagesPage / claimPages / completeClaimedPage / releaseExpiredLeases
+        getIngestCheckpoint / saveIngestCheckpoint
+  knowledge:addDocument / addDocuments / deleteDocuments / deleteDocumentsBySourceUrl
+            getAllDocuments / getDocumentsBySourceUrl / getSourceVersions / getDocumentCount
+  search:searchByEmbedding / searchByText / searchByTextPage / getDocumentById / getDocumentsByIds
+  textIndex:startTextIndexBackfill
+  admin:getStats
+  stats:startStatsReconcile / seedStatsCounters
+
+リクエストボディは {"path": ...}（各ツール）と {"function": ...}（convex-client.ts）の両方を受け付け、
+レスポンスはConvexと同じ {"status": "success", "value": ...} 形式で返す。
+
+使い方:
+  python convex_stub_server.py --port 3210 --latency-ms 20 --error-rate 0.01
+  python convex_stub_server.py --seed documents.jsonl       # エクスポートを初期データとして読み込む
+  CONVEX_URL=http://127.0.0.1:3210 npm run dev             # ツール側はCONVEX_URLを向けるだけ
+
+実行中のプロファイル変更と統計:
+  POST /_stub/profile  {"latency_ms": 100, "functions": {"search:searchByEmbedding": {"error_rate": 0.5}}}
+  GET  /_stub/stats
+
+actionの中の ctx.runQuery は1回ごとに run_query_ms の遅延を加える。searchByEmbedding の結果の取得は
+hydration="batched"（getDocumentsByIds を1回）と "serial"（getDocumentById を件数分、変更前の search.ts）を
+プロファイルで切り替えられる（hydration_benchmark.py で比較）。
+admin:getStats は stats="counters"（stats.ts の集計カウンタを読む）と "scan"（変更前の admin.ts と同じく
+全行を読み出して数える）を切り替えられる（stats_benchmark.py で比較）。
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from stub_chat_server import StubChatHandler
+
+EMBEDDING_DIM = 768
+VECTOR_SEARCH_LIMIT = 256  # Convexの vectorSearch の最大件数
+DEFAULT_LEASE_MS = 10 * 60 * 1000  # pages.ts の claimPages の既定のリース期間
+MAX_LISTING_PAGE_SIZE = 100
+DEFAULT_PROFILE = {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "run_query_ms": 0.0}
+HYDRATION_MODES = ("batched", "serial")
+STATS_MODES = ("counters", "scan")
+
+
+class ConvexError(Exception):
+    """関数実行時のエラー（Convexと同じく status="error" で返す）"""
+
+
+class VectorIndex:
+    """documents.by_embedding 相当のインメモリベクトルインデックス
+
+    正規化済みベクトルを連続した行列に追記し、総当たりのコサイン類似度でtop-kを返す。
+    削除は行を無効化するだけで、容量は倍々で拡張する。
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=1024):
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.ids = [None] * capacity
+        self.rows = {}
+        self.size = 0
+
+    def add(self, doc_id, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ConvexError(f"Invalid embedding dimension: {vector.shape[0]}, expected {self.dim}")
+        if self.size == len(self.vectors):
+            capacity = len(self.vectors) * 2
+            self.vectors = np.resize(self.vectors, (capacity, self.dim))
+            self.live = np.concatenate([self.live, np.zeros(capacity - len(self.live), dtype=bool)])
+            self.ids.extend([None] * (capacity - len(self.ids)))
+        norm = np.linalg.norm(vector)
+        self.vectors[self.size] = vector / norm if norm else vector
+        self.live[self.size] = True
+        self.ids[self.size] = doc_id
+        self.rows[doc_id] = self.size
+        self.size += 1
+
+    def remove(self, doc_id):
+        row = self.rows.pop(doc_id, None)
+        if row is not None:
+            self.live[row] = False
+
+    def search(self, embedding, limit):
+        query = np.asarray(embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ConvexError(f"Invalid vector length: {query.shape[0]}, expected {self.dim}")
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors[:self.size] @ query
+        scores[~self.live[:self.size]] = -np.inf
+        candidates = int(self.live[:self.size].sum())
+        limit = min(limit, candidates)
+        if limit == 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+
+class BigramIndex:
+    """text_index テーブル（textIndex.ts）相当の文字bigram転置インデックス
+
+    検索手順も textIndex.ts の searchTextIndex と同じ: 検索語のbigramから間隔をあけて最大 MAX_PROBED_GRAMS 個を選び、
+    出現documentが MAX_POSTINGS_PER_GRAM 以下のbigramのpostingを積集合にして候補を絞り（ENOUGH_CANDIDATES 件以下に
+    なったら残りは読まない）、本文で部分一致を確認する。確認は MAX_VERIFIED_DOCUMENTS 件ごとに区切り、cursor で続きを返す。
+    """
+
+    MAX_POSTINGS_PER_GRAM = 1000
+    MAX_PROBED_GRAMS = 6
+    ENOUGH_CANDIDATES = 20
+    MAX_VERIFIED_DOCUMENTS = 500
+
+    def __init__(self):
+        self.postings = {}  # gram -> {doc_id: None}（挿入順を保持する）
+        self.doc_grams = {}
+        self.last_reads = 0  # 直前の検索で本文を確認したdocument数
+        self.last_posting_reads = 0  # 直前の検索で読んだposting数（text_index の行数）
+
+    @staticmethod
+    def bigrams(text):
+        text = text.lower()
+        return list(dict.fromkeys(text[i:i + 2] for i in range(len(text) - 1) if len(text[i:i + 2].strip()) == 2))
+
+    @classmethod
+    def spread_grams(cls, grams):
+        count = cls.MAX_PROBED_GRAMS
+        if len(grams) <= count:
+            return grams
+        return [grams[round(i * (len(grams) - 1) / (count - 1))] for i in range(count)]
+
+    def add(self, doc_id, text):
+        grams = self.bigrams(text)
+        for gram in grams:
+            self.postings.setdefault(gram, {})[doc_id] = None
+        self.doc_grams[doc_id] = grams
+
+    def remove(self, doc_id):
+        for gram in self.doc_grams.pop(doc_id, ()):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[gram]
+
+    def search(self, search_text, limit, get_text, all_ids=(), cursor=None):
+        """部分一致するdocumentのIDを (ids, is_done, continue_cursor) で返す。get_text(doc_id) は本文（削除済みならNone）
+
+        IDは作成順に増えるので、cursor（最後に確認したID）より後から確認を再開する。
+        """
+        needle = search_text.lower()
+        grams = self.bigrams(needle)
+        self.last_reads = self.last_posting_reads = 0
+        if not grams:
+            candidates = all_ids
+        else:
+            selected = None
+            for gram in self.spread_grams(grams):
+                posting = self.postings.get(gram)
+                if not posting:
+                    return [], True, None
+                self.last_posting_reads += min(len(posting), self.MAX_POSTINGS_PER_GRAM + 1)
+                if len(posting) > self.MAX_POSTINGS_PER_GRAM:
+                    continue
+                selected = [doc_id for doc_id in posting if selected is None or doc_id in selected]
+                selected = dict.fromkeys(selected)
+                if len(selected) <= self.ENOUGH_CANDIDATES:
+                    break
+            candidates = sorted(selected) if selected is not None else iter(self.postings[grams[0]])
+
+        results = []
+        position = cursor
+        for doc_id in candidates:
+            if cursor is not None and doc_id <= cursor:
+                continue
+            position = doc_id
+            self.last_reads += 1
+            text = get_text(doc_id)
+            if text is not None and needle in text.lower():
+                results.append(doc_id)
+            if len(results) >= limit or self.last_reads >= self.MAX_VERIFIED_DOCUMENTS:
+                return results, False, position
+        return results, True, None
+
+
+class ConvexStore:
+    """crawled_pages・documents テーブルと、各Convex関数の実装"""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.lock = threading.Lock()
+        self.tables = {"crawled_pages": {}, "documents": {}, "ingest_checkpoints": {}}
+        self.index = VectorIndex(dim)
+        self.text_index = BigramIndex()
+        self.hydration = "batched"
+        self.stats_mode = "counters"
+        self.counters = collections.Counter()  # stats_counters 相当（"pages" / "pages:<status>" / "documents"）
+        self.source_versions = {}  # source_versions 相当（sourceUrl → {"count", "latestCreatedAt"}）
+        self.reconciled_at = None  # stats_counters の reconciledAt 行（数え直しが完了した日時）
+        self.local = threading.local()  # 実行中の関数が ctx.runQuery を呼んだ回数
+        self._ids = itertools.count(1)
+        self.functions = {
+            "pages:addPage": ("mutation", self.add_page),
+            "pages:getPendingPages": ("query", self.get_pending_pages),
+            "pages:updatePageStatus": ("mutation", self.update_page_status),
+            "pages:getAllPages": ("query", self.get_all_pages),
+            "pages:getPageByUrl": ("query", self.get_page_by_url),
+            "pages:getPendingPagesPage": ("query", self.get_pending_pages_page),
+            "pages:claimPages": ("mutation", self.claim_pages),
+            "pages:completeClaimedPage": ("mutation", self.complete_claimed_page),
+            # Convexでは internalMutation（crons.ts から実行）。検証用に外から呼べるようにしている
+            "pages:releaseExpiredLeases": ("mutation", self.release_expired_leases),
+            "pages:getIngestCheckpoint": ("query", self.get_ingest_checkpoint),
+            "pages:saveIngestCheckpoint": ("mutation", self.save_ingest_checkpoint),
+            "knowledge:addDocument": ("mutation", self.add_document),
+            "knowledge:addDocuments": ("mutation", self.add_documents),
+            "knowledge:deleteDocuments": ("mutation", self.delete_documents),
+            "knowledge:deleteDocumentsBySourceUrl": ("mutation", self.delete_documents_by_source_url),
+            "knowledge:getAllDocuments": ("query", self.get_all_documents),
+            "knowledge:getDocumentsBySourceUrl": ("query", self.get_documents_by_source_url),
+            "knowledge:getSourceVersions": ("query", self.get_source_versions),
+            "knowledge:getDocumentCount": ("query", self.get_document_count),
+            "search:searchByEmbedding": ("action", self.search_by_embedding),
+            "search:searchByText": ("query", self.search_by_text),
+            "search:searchByTextPage": ("query", self.search_by_text_page),
+            "textIndex:startTextIndexBackfill": ("mutation", self.start_text_index_backfill),
+            "search:getDocumentById": ("query", self.get_document_by_id),
+            "search:getDocumentsByIds": ("query", self.get_documents_by_ids),
+            "admin:getStats": ("query", self.get_stats),
+            "stats:startStatsReconcile": ("mutation", self.start_stats_reconcile),
+            "stats:seedStatsCounters": ("mutation", self.seed_stats_counters),
+        }
+
+    def call(self, kind, name, args):
+        """関数を実行する。/api/action からはactionの中と同様にquery・mutationも呼べる"""
+        name = name.replace("/", ":").removesuffix(".js")
+        if name not in self.functions:
+            raise ConvexError(f"Could not find public function for '{name}'")
+        function_kind, handler = self.functions[name]
+        if kind != function_kind and kind != "action":
+            raise ConvexError(f"Function '{name}' is a {function_kind}, not a {kind}")
+        self.local.run_queries = 0
+        with self.lock:
+            return handler(**args)
+
+    def run_query(self, handler, **args):
+        """actionの中の ctx.runQuery（呼び出し回数を数え、遅延はハンドラ側で加える）"""
+        self.local.run_queries += 1
+        return handler(**args)
+
+    def _insert(self, table, fields):
+        doc_id = f"{table[:1]}{next(self._ids):08d}"
+        document = {"_id": doc_id, "_creationTime": time.time() * 1000, **fields}
+        self.tables[table][doc_id] = document
+        return doc_id
+
+    # pages.ts
+
+    def add_page(self, url, text, status=None):
+        now = int(time.time() * 1000)
+        status = status or "pending"
+        self.counters.update({"pages": 1, f"pages:{status}": 1})
+        return self._insert("crawled_pages", {"url": url, "text": text, "status": status,
+                                              "createdAt": now, "updatedAt": now})
+
+    def get_pending_pages(self):
+        return [page for page in self.tables["crawled_pages"].values() if page["status"] == "pending"]
+
+    def update_page_status(self, id, status):
+        page = self.tables["crawled_pages"].get(id)
+        if page is None:
+            raise ConvexError(f"Document not found: {id}")
+        self._set_page_status(page, status)
+        return None
+
+    def _set_page_status(self, page, status, **fields):
+        if page["status"] != status:
+            self.counters.update({f"pages:{page['status']}": -1, f"pages:{status}": 1})
+        page.pop("leaseOwner", None)
+        page.pop("leaseExpiresAt", None)
+        page.update({"status": status, "updatedAt": int(time.time() * 1000), **fields})
+
+    def get_pending_pages_page(self, cursor, numItems):
+        """by_status の順（作成順）に、cursor（前回の最後のID）より後の pending ページを返す"""
+        limit = min(max(1, int(numItems)), MAX_LISTING_PAGE_SIZE)
+        pending = (page for page in self.tables["crawled_pages"].values()
+                   if page["status"] == "pending" and (cursor is None or page["_id"] > cursor))
+        page = list(itertools.islice(pending, limit + 1))
+        is_done = len(page) <= limit
+        page = page[:limit]
+        return {"page": [{"_id": p["_id"], "url": p["url"]} for p in page],
+                "continueCursor": page[-1]["_id"] if page else cursor, "isDone": is_done}
+
+    def claim_pages(self, ids, workerId, leaseMs=None):
+        now = int(time.time() * 1000)
+        claimed = []
+        for page_id in ids:
+            page = self.tables["crawled_pages"].get(page_id)
+            if page is None or page["status"] != "pending":
+                continue
+            self._set_page_status(page, "processing", leaseOwner=workerId,
+                                  leaseExpiresAt=now + (leaseMs if leaseMs is not None else DEFAULT_LEASE_MS))
+            claimed.append({"_id": page["_id"], "url": page["url"], "text": page["text"]})
+        return claimed
+
+    def complete_claimed_page(self, id, workerId, status, documents=None):
+        if status not in ("processed", "pending", "error"):
+            raise ConvexError(f"Invalid status: {status}")
+        page = self.tables["crawled_pages"].get(id)
+        if page is None or page["status"] != "processing" or page.get("leaseOwner") != workerId:
+            return {"completed": False, "savedDocuments": 0}
+        saved = self.add_documents(documents) if documents else []
+        self._set_page_status(page, status)
+        return {"completed": True, "savedDocuments": len(saved)}
+
+    def release_expired_leases(self):
+        now = int(time.time() * 1000)
+        expired = [page for page in self.tables["crawled_pages"].values()
+                   if page["status"] == "processing" and page.get("leaseExpiresAt", 0) < now]
+        for page in expired:
+            self._set_page_status(page, "pending")
+        return len(expired)
+
+    def get_ingest_checkpoint(self, name):
+        checkpoint = self.tables["ingest_checkpoints"].get(name)
+        return checkpoint and {"cursor": checkpoint["cursor"], "updatedAt": checkpoint["updatedAt"]}
+
+    def save_ingest_checkpoint(self, name, cursor):
+        self.tables["ingest_checkpoints"][name] = {"name": name, "cursor": cursor,
+                                                   "updatedAt": int(time.time() * 1000)}
+        return None
+
+    def get_all_pages(self):
+        return list(self.tables["crawled_pages"].values())
+
+    def get_page_by_url(self, url):
+        return next((page for page in self.tables["crawled_pages"].values() if page["url"] == url), None)
+
+    # knowledge.ts
+
+    def add_document(self, text, embedding, sourceUrl):
+        return self.add_documents([{"text": text, "embedding": embedding, "sourceUrl": sourceUrl}])[0]
+
+    def add_documents(self, documents):
+        ids = []
+        try:
+            for doc in documents:
+                doc_id = self._insert("documents", {"text": doc["text"], "embedding": list(doc["embedding"]),
+                                                    "sourceUrl": doc["sourceUrl"],
+                                                    "createdAt": doc.get("createdAt", int(time.time() * 1000))})
+                ids.append(doc_id)
+                self.index.add(doc_id, doc["embedding"])
+                self.text_index.add(doc_id, doc["text"])
+        except (ConvexError, KeyError):
+            # mutationはトランザクションなので、途中で失敗したら全件取り消す
+            for doc_id in ids:
+                self.tables["documents"].pop(doc_id, None)
+                self.index.remove(doc_id)
+                self.text_index.remove(doc_id)
+            raise
+        self.counters["documents"] += len(ids)
+        self._adjust_source_versions([self.tables["documents"][doc_id] for doc_id in ids], 1)
+        return ids
+
+    def delete_documents(self, ids):
+        deleted = []
+        for doc_id in ids:
+            doc = self.tables["documents"].pop(doc_id, None)
+            if doc is not None:
+                self.index.remove(doc_id)
+                self.text_index.remove(doc_id)
+                deleted.append(doc)
+        self.counters["documents"] -= len(deleted)
+        self._adjust_source_versions(deleted, -1)
+        return len(deleted)
+
+    def _adjust_source_versions(self, documents, sign):
+        """stats.ts の adjustSourceVersions（latestCreatedAt は削除では戻さない）"""
+        by_url = {}
+        for doc in documents:
+            by_url.setdefault(doc["sourceUrl"], []).append(doc)
+        for url, docs in by_url.items():
+            version = self.source_versions.get(url)
+            if version is None:
+                self.source_versions[url] = self._count_source_documents(url)
+                continue
+            version["count"] += sign * len(docs)
+            if sign > 0:
+                version["latestCreatedAt"] = max(version["latestCreatedAt"], *(doc["createdAt"] for doc in docs))
+
+    def _count_source_documents(self, sourceUrl):
+        docs = self.get_documents_by_source_url(sourceUrl)
+        return {"count": len(docs), "latestCreatedAt": max((doc["createdAt"] for doc in docs), default=0)}
+
+    def delete_documents_by_source_url(self, sourceUrl):
+        return self.delete_documents([doc["_id"] for doc in self.get_documents_by_source_url(sourceUrl)])
+
+    def get_all_documents(self):
+        return list(self.tables["documents"].values())
+
+    def get_documents_by_source_url(self, sourceUrl):
+        return [doc for doc in self.tables["documents"].values() if doc["sourceUrl"] == sourceUrl]
+
+    def get_source_versions(self, sourceUrls):
+        return [{"sourceUrl": url, **(self.source_versions.get(url) or self._count_source_documents(url))}
+                for url in sourceUrls]
+
+    def get_document_count(self):
+        return self.counters["documents"]
+
+    # search.ts
+
+    def search_by_embedding(self, embedding, limit=None):
+        limit = min(limit or 5, VECTOR_SEARCH_LIMIT)
+        hits = self.index.search(embedding, limit)
+        if self.hydration == "serial":
+            docs = [self.run_query(self.get_document_by_id, id=doc_id) for doc_id, _ in hits]
+        else:
+            docs = self.run_query(self.get_documents_by_ids, ids=[doc_id for doc_id, _ in hits])
+        return [{"id": doc_id, "text": doc["text"], "sourceUrl": doc["sourceUrl"], "createdAt": doc["createdAt"],
+                 "score": score} for (doc_id, score), doc in zip(hits, docs) if doc]
+
+    def search_by_text(self, searchText, limit=None):
+        """searchByText: 従来どおり配列を返す（1回分の確認で見つかったものだけ）"""
+        return self.search_by_text_page(searchText, limit)["results"]
+
+    def search_by_text_page(self, searchText, limit=None, cursor=None):
+        documents = self.tables["documents"]
+        ids, is_done, continue_cursor = self.text_index.search(
+            searchText, limit or 10, lambda doc_id: documents[doc_id]["text"] if doc_id in documents else None,
+            iter(documents), cursor)
+        return {
+            "results": [{"id": doc_id, "text": documents[doc_id]["text"], "sourceUrl": documents[doc_id]["sourceUrl"],
+                         "createdAt": documents[doc_id]["createdAt"]} for doc_id in ids],
+            "isDone": is_done,
+            "continueCursor": continue_cursor,
+            # この代替サーバーは documents の追加と同時に索引するので、構築が済んでいない状態はない
+            "indexComplete": True,
+        }
+
+    # textIndex.ts
+
+    def start_text_index_backfill(self):
+        return {"scheduled": False, "complete": True}
+
+    def get_document_by_id(self, id):
+        return self.tables["documents"].get(id)
+
+    def get_documents_by_ids(self, ids):
+        docs = [self.tables["documents"].get(doc_id) for doc_id in ids]
+        return [doc and {"id": doc["_id"], "text": doc["text"], "sourceUrl": doc["sourceUrl"],
+                         "createdAt": doc["createdAt"]} for doc in docs]
+
+    # admin.ts
+
+    def get_stats(self):
+        counters = self.counters if self.stats_mode == "counters" else self._count_rows(scan=True)
+        return {
+            "pages": {
+                "total": counters["pages"],
+                "pending": counters["pages:pending"],
+                "processing": counters["pages:processing"],
+                "processed": counters["pages:processed"],
+                "error": counters["pages:error"],
+            },
+            "documents": {"total": counters["documents"]},
+            "countersInitialized": self.reconciled_at is not None,
+            "reconciledAt": self.reconciled_at,
+            "lastUpdated": int(time.time() * 1000),
+        }
+
+    def _count_rows(self, scan=False):
+        """実データから数えたカウンタ。scan=True では collect() と同じく全行を埋め込みごと読み出す"""
+        pages = self.tables["crawled_pages"].values()
+        documents = self.tables["documents"].values()
+        if scan:
+            pages = [dict(page) for page in pages]
+            documents = [{**doc, "embedding": list(doc["embedding"])} for doc in documents]
+        counts = collections.Counter(f"pages:{page['status']}" for page in pages)
+        counts.update({"pages": len(pages), "documents": len(documents)})
+        return counts
+
+    # stats.ts
+
+    def start_stats_reconcile(self):
+        """reconcileStats（ここでは1回で数え直す）。ずれていた分を drift として返す"""
+        counted = self._count_rows()
+        drift = {name: counted[name] - self.counters[name] for name in set(counted) | set(self.counters)
+                 if counted[name] != self.counters[name]}
+        self.counters = counted
+        urls = {doc["sourceUrl"] for doc in self.tables["documents"].values()}
+        self.source_versions.update({url: self._count_source_documents(url) for url in urls})
+        self.reconciled_at = int(time.time() * 1000)
+        return {"scheduledAt": self.reconciled_at, "drift": drift}
+
+    def seed_stats_counters(self):
+        """seedStatsCounters: 一度も数え直していなければ数え直す"""
+        if self.reconciled_at is not None:
+            return {"scheduled": False, "reconciledAt": self.reconciled_at}
+        self.start_stats_reconcile()
+        return {"scheduled": True, "reconciledAt": None}
+
+
+class ConvexStubHandler(StubChatHandler):
+    """/api/query・/api/mutation・/api/action をConvexと同じ形式で処理するハンドラ"""
+
+    KINDS = {"/api/query": "query", "/api/mutation": "mutation", "/api/action": "action"}
+
+    def do_GET(self):
+        if self.path == "/_stub/stats":
+            self._send_json(200, self.server.stats_snapshot())
+        else:
+            self._send_json(404, {"status": "error", "errorMessage": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            self._send_json(400, {"status": "error", "errorMessage": "Invalid JSON body"})
+            return
+
+        if self.path == "/_stub/profile":
+            try:
+                self.server.update_profile(body)
+            except (ValueError, TypeError) as e:
+                self._send_json(400, {"status": "error", "errorMessage": str(e)})
+                return
+            self._send_json(200, {"status": "success", "value": self.server.profile})
+            return
+
+        kind = self.KINDS.get(self.path.split("?")[0])
+        name = body.get("path") or body.get("function")
+        if kind is None or not name:
+            self._send_json(404, {"status": "error", "errorMessage": "Not found"})
+            return
+
+        profile = self.server.profile_for(name)
+        time.sleep((profile["latency_ms"] + random.uniform(0, profile["jitter_ms"])) / 1000)
+        if random.random() < profile["error_rate"]:
+            self.server.record_call(name, "fault")
+            self._send_json(500, {"status": "error", "errorMessage": "stub fault"})
+            return
+
+        try:
+            value = self.server.store.call(kind, name, body.get("args") or {})
+        except (ConvexError, TypeError, KeyError) as e:
+            self.server.record_call(name, "error")
+            self._send_json(200, {"status": "error", "errorMessage": str(e), "logLines": []})
+            return
+        # runQueryは直列に実行される往復なので、ロックの外で回数分の遅延を加える
+        time.sleep(self.server.store.local.run_queries * profile["run_query_ms"] / 1000)
+        self.server.record_call(name, "success")
+        self._send_json(200, {"status": "success", "value": value, "logLines": []})
+
+
+class ConvexStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store=None, profile=None):
+        super().__init__(address, ConvexStubHandler)
+        self.store = store or ConvexStore()
+        self.profile = {**DEFAULT_PROFILE, "hydration": self.store.hydration, "stats": self.store.stats_mode,
+                        "functions": {}}
+        self.update_profile(profile or {})
+        self._stats_lock = threading.Lock()
+        self._calls = {}
+
+    def update_profile(self, changes):
+        """レイテンシ・障害率を更新する。functions で関数ごとの上書きも指定できる"""
+        for key in DEFAULT_PROFILE:
+            if key in changes:
+                self.profile[key] = float(changes[key])
+        if "hydration" in changes:
+            if changes["hydration"] not in HYDRATION_MODES:
+                raise ValueError(f"hydration must be one of {HYDRATION_MODES}")
+            self.store.hydration = self.profile["hydration"] = changes["hydration"]
+        if "stats" in changes:
+            if changes["stats"] not in STATS_MODES:
+                raise ValueError(f"stats must be one of {STATS_MODES}")
+            self.store.stats_mode = self.profile["stats"] = changes["stats"]
+        for name, overrides in changes.get("functions", {}).items():
+            self.profile["functions"].setdefault(name, {}).update(overrides)
+
+    def profile_for(self, name):
+        return {**self.profile, **self.profile["functions"].get(name, {})}
+
+    def record_call(self, name, outcome):
+        with self._stats_lock:
+            counts = self._calls.setdefault(name, {"success": 0, "error": 0, "fault": 0})
+            counts[outcome] += 1
+
+    def stats_snapshot(self):
+        with self._stats_lock:
+            calls = {name: dict(counts) for name, counts in self._calls.items()}
+        with self.store.lock:
+            tables = {name: len(rows) for name, rows in self.store.tables.items()}
+        return {"calls": calls, "tables": tables, "profile": self.profile}
+
+
+def load_seed_documents(store, path):
+    """エクスポート（JSON/JSONL）またはembedding_storeのディレクトリからdocumentsを読み込む"""
+    from embedding_store import EmbeddingStore, iter_documents
+
+    if os.path.isdir(path):
+        embedding_store = EmbeddingStore(path)
+        documents = (embedding_store.document(row) for row in range(len(embedding_store)))
+    else:
+        documents = iter_documents(path)
+
+    count = 0
+    with store.lock:
+        for batch in iter(lambda: list(itertools.islice(documents, 1000)), []):
+            store.add_documents(batch)
+            count += len(batch)
+    return count
+
+
+def start_convex_stub(host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None,
+                      run_query_ms=0.0):
+    """Convex代替サーバーをバックグラウンドで起動し、(server, base_url) を返す"""
+    server = ConvexStubServer((host, port), profile={"latency_ms": latency_ms, "jitter_ms": jitter_ms,
+                                                     "error_rate": error_rate, "run_query_ms": run_query_ms})
+    if seed:
+        load_seed_documents(server.store, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convex HTTP API のローカル代替サーバー")
+    parser.add_argument("--port", type=int, default=3210)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--run-query-ms", type=float, default=0.0, help="actionの中の ctx.runQuery 1回あたりの遅延")
+    parser.add_argument("--seed", help="初期データ（documentsのエクスポートまたはembedding_storeのディレクトリ）")
+    args = parser.parse_args()
+
+    server, base_url = start_convex_stub(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                         error_rate=args.error_rate, seed=args.seed,
+                                         run_query_ms=args.run_query_ms)
+    print(f"🧪 Convex代替サーバー起動: {base_url}  (documents {len(server.store.tables['documents'])}件)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
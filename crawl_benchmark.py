@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+非同期クローラーのベンチマーク（ローカルのサイトフィクスチャ）
+数千ページが相互リンクした攻略サイト風のサイトを別プロセスで配信し、
+asyncio製の参照クローラー（ホストごとの同時接続数制限・Keep-Aliveプール・
+HTMLを受信しながらテキスト抽出）でクロールして、pages/s・bytes/s・メモリ使用量を計測する。
+同時接続数1の結果は、1ページずつ処理する web-crawler.ts の逐次クロールに相当する基準値になる。
+
+使い方:
+  python crawl_benchmark.py --pages 5000 --concurrency 1 8 32
+  python crawl_benchmark.py --url https://example.com/ --max-pages 200 --output pages.jsonl
+  （--output のJSONLは dedup.py・incremental_sync.py の入力に使える）
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import multiprocessing
+import random
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from async_http import ConnectionPool
+from stub_chat_server import StubChatHandler
+
+LINKS_PER_PAGE = 12
+BROKEN_LINK_RATE = 0.01
+WHITESPACE = re.compile(r"\s+")
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+
+def fixture_page(index, total, seed=0):
+    """フィクスチャの index 番目のページのHTMLを決定的に生成する"""
+    rng = random.Random(seed * 1_000_003 + index)
+    words = ["装備", "強化", "素材", "ボス", "ダンジョン", "イベント", "ガチャ", "スキル", "クエスト", "報酬",
+             "攻撃力", "防御力", "限界突破", "ドロップ", "周回", "編成", "属性", "覚醒", "育成", "初心者"]
+    paragraphs = []
+    for _ in range(rng.randint(4, 10)):
+        sentence_count = rng.randint(3, 8)
+        paragraphs.append("".join(
+            f"{rng.choice(words)}の{rng.choice(words)}は{rng.randint(1, 999)}で、{rng.choice(words)}に影響します。"
+            for _ in range(sentence_count)))
+
+    links = [rng.randrange(total) for _ in range(LINKS_PER_PAGE)]
+    # 次のページへのリンクを必ず含め、全ページが到達可能になるようにする
+    links.append((index + 1) % total)
+    anchors = "".join(
+        f'<li><a href="/page/{target}.html#top">{rng.choice(words)} {target}</a></li>'
+        if rng.random() >= BROKEN_LINK_RATE else f'<li><a href="/missing/{target}.html">リンク切れ</a></li>'
+        for target in links)
+
+    return (
+        "<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\">"
+        f"<title>攻略ページ {index}</title>"
+        "<style>body{font-family:sans-serif}.nav{display:flex}</style>"
+        "<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}</script>"
+        "</head><body>"
+        "<header class=\"nav\"><a href=\"/page/0.html\">攻略トップ</a></header>"
+        f"<main><h1>攻略ページ {index}</h1>"
+        + "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+        + f"<ul>{anchors}</ul></main>"
+        "<footer>© Example Games <a href=\"https://external.example.org/\">外部サイト</a></footer>"
+        "</body></html>"
+    ).encode("utf-8")
+
+
+class FixtureHandler(StubChatHandler):
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        server = self.server
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+
+        if path.startswith("/page/") and path.endswith(".html"):
+            try:
+                index = int(path[len("/page/"):-len(".html")])
+            except ValueError:
+                index = -1
+            if not 0 <= index < server.total:
+                self._send_json(404, {"error": "Not found"})
+                return
+            body = fixture_page(index, server.total, server.seed)
+        else:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve_fixture(total, seed, latency_ms, ready):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.total = total
+    server.seed = seed
+    server.latency_ms = latency_ms
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fixture(total=5000, seed=0, latency_ms=0.0):
+    """フィクスチャを別プロセスで起動し、(process, base_url) を返す（クローラーとGILを共有しないため）"""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_fixture, args=(total, seed, latency_ms, ready), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ready.get(timeout=30)}/page/0.html"
+
+
+class StreamingTextExtractor(HTMLParser):
+    """受信したHTMLを順にfeedし、本文テキストとリンクを抽出する（script/styleは除外）"""
+
+    def __init__(self, selector_tag=None):
+        super().__init__(convert_charrefs=True)
+        self.selector_tag = selector_tag
+        self.parts = []
+        self.links = []
+        self._skip_depth = 0
+        self._select_depth = 0 if selector_tag else 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        if self.selector_tag and tag == self.selector_tag:
+            self._select_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        if self.selector_tag and tag == self.selector_tag and self._select_depth:
+            self._select_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth and self._select_depth:
+            self.parts.append(data)
+
+    def text(self):
+        # web-crawler.ts と同じく空白をまとめてtrimする
+        return WHITESPACE.sub(" ", " ".join(self.parts)).strip()
+
+
+class AsyncCrawler:
+    """asyncioによる幅優先クローラー
+
+    ホストごとに ConnectionPool（Keep-Alive、同時接続数 per_host_concurrency）を持ち、
+    本文はチャンク単位でデコードしながらパーサーに渡すので、HTML全体をメモリに保持しない。
+    """
+
+    def __init__(self, start_url, max_pages=1000, max_depth=5, per_host_concurrency=8,
+                 timeout=30.0, selector_tag=None, same_host=True, on_page=None):
+        self.start_url = start_url
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.selector_tag = selector_tag
+        self.same_host = same_host
+        self.on_page = on_page
+        self.start_host = urlsplit(start_url).netloc
+        self.pools = {}
+        self.seen = set()
+        self.stats = {"pages": 0, "bytes": 0, "text_chars": 0, "errors": 0, "non_html": 0, "status_counts": {}}
+
+    def _pool(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self.pools:
+            self.pools[origin] = ConnectionPool(origin, self.per_host_concurrency, self.timeout)
+        return self.pools[origin]
+
+    def _path(self, url):
+        parts = urlsplit(url)
+        return (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+    async def _fetch(self, url):
+        extractor = StreamingTextExtractor(self.selector_tag)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        received = 0
+
+        def on_chunk(data):
+            nonlocal received
+            received += len(data)
+            extractor.feed(decoder.decode(data))
+
+        response = await self._pool(url).request("GET", self._path(url), headers={"Accept": "text/html"},
+                                                 on_chunk=on_chunk)
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+        return response, extractor, received
+
+    async def _worker(self, queue):
+        while True:
+            url, depth = await queue.get()
+            try:
+                if self.stats["pages"] >= self.max_pages:
+                    continue
+                try:
+                    response, extractor, received = await self._fetch(url)
+                except (OSError, asyncio.TimeoutError, ValueError) as e:
+                    self.stats["errors"] += 1
+                    print(f"[WARN] crawl: {url}: {e}", file=sys.stderr)
+                    continue
+
+                status = str(response.status)
+                self.stats["status_counts"][status] = self.stats["status_counts"].get(status, 0) + 1
+                self.stats["bytes"] += received
+                if response.status != 200:
+                    continue
+                if "html" not in response.headers.get("content-type", "text/html"):
+                    self.stats["non_html"] += 1
+                    continue
+
+                text = extractor.text()
+                if self.stats["pages"] >= self.max_pages:
+                    continue
+                self.stats["pages"] += 1
+                self.stats["text_chars"] += len(text)
+                if self.on_page and text:
+                    self.on_page(url, text)
+
+                if depth < self.max_depth:
+                    for href in extractor.links:
+                        link = urldefrag(urljoin(url, href))[0]
+                        parts = urlsplit(link)
+                        if parts.scheme not in ("http", "https"):
+                            continue
+                        if self.same_host and parts.netloc != self.start_host:
+                            continue
+                        if link not in self.seen and len(self.seen) < self.max_pages * 2:
+                            self.seen.add(link)
+                            queue.put_nowait((link, depth + 1))
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        queue = asyncio.Queue()
+        start = urldefrag(self.start_url)[0]
+        self.seen.add(start)
+        queue.put_nowait((start, 0))
+
+        # ワーカー数はホストごとの上限と同じ（単一ホストのクロールではこれが実効的な並列度）
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.per_host_concurrency)]
+        started = time.perf_counter()
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for pool in self.pools.values():
+                await pool.close()
+        elapsed = time.perf_counter() - started
+
+        stats = dict(self.stats)
+        stats["elapsed_s"] = round(elapsed, 3)
+        stats["pages_per_s"] = round(stats["pages"] / elapsed, 1) if elapsed else None
+        stats["bytes_per_s"] = round(stats["bytes"] / elapsed) if elapsed else None
+        stats["connections_opened"] = sum(pool.connections_opened for pool in self.pools.values())
+        return stats
+
+
+def crawl(start_url, max_pages, max_depth, concurrency, selector_tag=None, on_page=None, trace_memory=False):
+    """1回クロールし、メモリ使用量を含む統計を返す
+
+    trace_memory はPythonヒープのピークをtracemallocで計測する（割り当てごとに記録するため数倍遅くなる）。
+    """
+    if trace_memory:
+        tracemalloc.start()
+    crawler = AsyncCrawler(start_url, max_pages, max_depth, concurrency, selector_tag=selector_tag, on_page=on_page)
+    stats = asyncio.run(crawler.run())
+    stats["concurrency"] = concurrency
+    stats["python_heap_peak_mb"] = None
+    if trace_memory:
+        stats["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1048576, 1)
+        tracemalloc.stop()
+    # Linuxでは ru_maxrss はKB単位
+    stats["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="非同期クローラーのベンチマーク")
+    parser.add_argument("--url", help="クロール開始URL（省略時はローカルのフィクスチャ）")
+    parser.add_argument("--pages", type=int, default=5000, help="フィクスチャのページ数")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="フィクスチャの応答遅延（実サイトのサーバー処理時間を模す）")
+    parser.add_argument("--max-pages", type=int, help="クロールする最大ページ数（既定: フィクスチャの全ページ）")
+    parser.add_argument("--max-depth", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="ホストごとの同時接続数")
+    parser.add_argument("--selector", help="本文として抽出するタグ名（例: main）")
+    parser.add_argument("--trace-memory", action="store_true", help="Pythonヒープのピークも計測する（低速）")
+    parser.add_argument("--output", help="最後の実行で取得したページの出力先（{url, text} のJSONL）")
+    parser.add_argument("--report", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    fixture = None
+    start_url = args.url
+    if not start_url:
+        fixture, start_url = start_fixture(args.pages, latency_ms=args.latency_ms)
+        print(f"🧪 サイトフィクスチャ起動: {start_url} ({args.pages}ページ)")
+    max_pages = args.max_pages or (args.pages if fixture else 1000)
+
+    report = []
+    try:
+        for index, concurrency in enumerate(args.concurrency):
+            out = None
+            if args.output and index == len(args.concurrency) - 1:
+                out = open(args.output, "w", encoding="utf-8")
+
+            def on_page(url, text):
+                if out:
+                    out.write(json.dumps({"url": url, "text": text}, ensure_ascii=False) + "\n")
+
+            try:
+                stats = crawl(start_url, max_pages, args.max_depth, concurrency, args.selector, on_page,
+                              args.trace_memory)
+            finally:
+                if out:
+                    out.close()
+            report.append(stats)
+            heap = f"  heap peak {stats['python_heap_peak_mb']}MB" if args.trace_memory else ""
+            print(f"  同時接続 {concurrency:>3}: {stats['pages']}ページ / {stats['elapsed_s']:.1f}秒  "
+                  f"{stats['pages_per_s']} pages/s  {stats['bytes_per_s'] / 1048576:.1f} MB/s  "
+                  f"接続 {stats['connections_opened']}{heap}  RSS {stats['max_rss_mb']}MB  エラー {stats['errors']}")
+    finally:
+        if fixture:
+            fixture.terminate()
+
+    if len(report) > 1 and report[0]["pages_per_s"]:
+        print(f"\n⚡ 同時接続{report[-1]['concurrency']}は同時接続{report[0]['concurrency']}の "
+              f"{report[-1]['pages_per_s'] / report[0]['pages_per_s']:.1f}倍")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.report}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+MinHash/LSHによる重複チャンク・定型文の検出
+クロールしたサイトはヘッダー・フッター・ナビゲーションが全ページに繰り返されるため、
+ほぼ同じ内容の documents がベクトルインデックスの容量と検索結果のtop-k枠を消費する。
+エクスポートを1件ずつストリーミングで読み、埋め込み前に重複を報告・除去する。
+
+モード:
+  pages   crawled_pages のエクスポートから、多数のページに共通する部分（定型文）を取り除き、
+          ほぼ同一のページを除外して出力する（incremental_sync.py の入力にそのまま使える）
+  chunks  documents のエクスポートから、ほぼ同一のチャンクを検出し、代表以外を除外する
+          （--convex-url を指定すると重複したdocumentsを knowledge:deleteDocuments で削除）
+
+使い方:
+  python dedup.py pages crawled_pages.jsonl --output cleaned_pages.jsonl
+  python dedup.py chunks documents.jsonl --threshold 0.85 --report dedup_report.json
+  python dedup.py chunks documents.jsonl --convex-url URL --apply
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from embedding_store import iter_documents
+
+NUM_PERM = 128
+SHINGLE_SIZE = 5  # 文字n-gram（日本語は単語区切りがないため文字単位）
+DEFAULT_THRESHOLD = 0.8
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_PAGE_RATIO = 0.3  # この割合以上のページに現れる連続区間を定型文とみなす
+MIN_SHINGLE_CHARS = 16  # 定型文の判定に使う区間（連続するセグメント）の最小文字数
+WHITESPACE = re.compile(r"\s+")
+# web-crawler.ts は textContent の空白・改行を1つの空白にまとめて保存するため、行では区切れない。
+# 空白と文末記号でセグメントに分ける（空白はDOM要素の境目、文末記号は日本語の文の境目にあたる）
+SEGMENT = re.compile(r"[^\s。！？!?]+[。！？!?]*|[。！？!?]+")
+
+
+def normalize_text(text):
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """正規化したテキストの文字n-gramをuint64のハッシュ集合にする"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def choose_bands(num_perm, threshold):
+    """LSHのバンド数・行数を、S字カーブの閾値 (1/b)^(1/r) が threshold に最も近くなるように選ぶ"""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class MinHasher:
+    """multiply-shift ハッシュ族によるMinHash（uint64の桁あふれをそのまま使う）"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(len(self.a), np.iinfo(np.uint32).max, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            values = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return values.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """ストリーミングで追加しながら、既存の代表とほぼ同一かを判定するLSHインデックス
+
+    代表（重複でないもの）のシグネチャだけを保持するので、メモリは代表数に比例する。
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, seed=1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key, text):
+        """text を登録する。既存の代表とほぼ同一なら (代表のkey, 推定Jaccard) を返し、登録しない"""
+        signature = self.hasher.signature(shingles(text))
+        band_keys = self._band_keys(signature)
+
+        best = None
+        checked = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            for candidate in bucket.get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = float(np.mean(self.signatures[candidate] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+        if best:
+            return best
+
+        self.signatures[key] = signature
+        for bucket, band_key in zip(self.buckets, band_keys):
+            bucket.setdefault(band_key, []).append(key)
+        return None
+
+
+def segment_shingles(segments):
+    """各セグメントから始まり MIN_SHINGLE_CHARS 文字に達するまで続く区間を (開始, 終了, ハッシュ) で返す"""
+    norms = [normalize_text(segment.group()) for segment in segments]
+    for start in range(len(segments)):
+        end, length = start, 0
+        while end < len(segments) and length < MIN_SHINGLE_CHARS:
+            length += len(norms[end])
+            end += 1
+        if length < MIN_SHINGLE_CHARS:
+            return
+        digest = hashlib.blake2b(" ".join(norms[start:end]).encode("utf-8"), digest_size=8).digest()
+        yield start, end, digest
+
+
+def find_boilerplate(pages, min_pages=BOILERPLATE_MIN_PAGES, page_ratio=BOILERPLATE_PAGE_RATIO):
+    """多数のページに現れる区間（ヘッダー・フッター・ナビゲーション）のハッシュと出現ページ数を返す
+
+    改行の有無に依存しないよう、行ではなくセグメントの連続区間（シングル）の出現ページ数を数える。
+    """
+    document_frequency = Counter()
+    page_count = 0
+    for page in pages:
+        page_count += 1
+        segments = list(SEGMENT.finditer(page.get("text", "")))
+        document_frequency.update({digest for _, _, digest in segment_shingles(segments)})
+
+    cutoff = max(min_pages, page_ratio * page_count)
+    boilerplate = {digest: count for digest, count in document_frequency.items() if count >= cutoff}
+    return boilerplate, page_count
+
+
+def boilerplate_runs(text, boilerplate):
+    """定型文のシングルに覆われたセグメントの連続区間を、テキスト上の (開始位置, 終了位置) で返す"""
+    segments = list(SEGMENT.finditer(text))
+    covered = [False] * len(segments)
+    for start, end, digest in segment_shingles(segments):
+        if digest in boilerplate:
+            covered[start:end] = [True] * (end - start)
+
+    runs = []
+    index = 0
+    while index < len(segments):
+        if not covered[index]:
+            index += 1
+            continue
+        first = index
+        while index < len(segments) and covered[index]:
+            index += 1
+        runs.append((segments[first].start(), segments[index - 1].end()))
+    return runs
+
+
+def strip_boilerplate(text, boilerplate):
+    return remove_runs(text, boilerplate_runs(text, boilerplate))
+
+
+def remove_runs(text, runs):
+    """(開始位置, 終了位置) の区間を取り除く（取り除いた区間の前後の空白は1つにまとめる）"""
+    if not runs:
+        return text.strip()
+    parts, position = [], 0
+    for start, end in runs:
+        parts.append(text[position:start])
+        position = end
+    parts.append(text[position:])
+    return re.sub(r"[ \t]*\n[ \t]*|[ \t]{2,}",
+                  lambda m: "\n" if "\n" in m.group() else " ", "".join(parts)).strip()
+
+
+def dedup_pages(path, threshold=DEFAULT_THRESHOLD):
+    """定型文の区間を除き、ほぼ同一のページを除外したページを順に返す（2パス: 区間の出現頻度→本体）
+
+    戻り値は (pages_iterator, report)。report はイテレータを最後まで読むと確定する。
+    """
+    boilerplate, page_count = find_boilerplate(iter_documents(path))
+    removed = Counter()
+    report = {
+        "pages": page_count,
+        "boilerplate_shingles": len(boilerplate),
+        "boilerplate_samples": [],
+        "chars_before": 0,
+        "chars_after": 0,
+        "duplicate_pages": [],
+    }
+
+    def generate():
+        index = NearDuplicateIndex(threshold)
+        for page in iter_documents(path):
+            text = page.get("text", "")
+            runs = boilerplate_runs(text, boilerplate)
+            removed.update({normalize_text(text[start:end]) for start, end in runs})
+            cleaned = remove_runs(text, runs)
+            report["chars_before"] += len(text)
+            if not cleaned:
+                continue
+            duplicate = index.add(page["url"], cleaned)
+            if duplicate:
+                report["duplicate_pages"].append({"url": page["url"], "duplicate_of": duplicate[0],
+                                                  "similarity": round(duplicate[1], 3)})
+                continue
+            report["chars_after"] += len(cleaned)
+            yield {**page, "text": cleaned}
+        report["boilerplate_samples"] = [text for text, _ in removed.most_common(20)]
+
+    return generate(), report
+
+
+def dedup_chunks(path, threshold=DEFAULT_THRESHOLD):
+    """ほぼ同一のチャンクを除外した documents を順に返す
+
+    戻り値は (documents_iterator, report)。代表は最初に現れたチャンク。
+    """
+    report = {"documents": 0, "kept": 0, "duplicates": [], "cross_page_clusters": 0}
+
+    def generate():
+        index = NearDuplicateIndex(threshold)
+        representative_urls = {}
+        cluster_urls = {}
+        for position, document in enumerate(iter_documents(path)):
+            report["documents"] += 1
+            key = document.get("_id") or f"row-{position}"
+            duplicate = index.add(key, document.get("text", ""))
+            if duplicate:
+                representative, similarity = duplicate
+                report["duplicates"].append({"id": key, "duplicate_of": representative,
+                                             "sourceUrl": document.get("sourceUrl"),
+                                             "similarity": round(similarity, 3)})
+                cluster_urls.setdefault(representative, {representative_urls[representative]}).add(
+                    document.get("sourceUrl"))
+                continue
+            representative_urls[key] = document.get("sourceUrl")
+            report["kept"] += 1
+            yield document
+        # 複数ページにまたがる重複は定型文の可能性が高い
+        report["cross_page_clusters"] = sum(1 for urls in cluster_urls.values() if len(urls) > 1)
+
+    return generate(), report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSHによる重複チャンク・定型文の検出")
+    parser.add_argument("mode", choices=["pages", "chunks"])
+    parser.add_argument("source", help="crawled_pages または documents のエクスポート（JSON/JSONL）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="重複とみなすJaccard類似度")
+    parser.add_argument("--output", help="重複を除いた結果の出力先（JSONL）")
+    parser.add_argument("--report", help="レポートの出力先（JSON）")
+    parser.add_argument("--convex-url", help="chunksモード: 重複したdocumentsを削除するConvexのURL")
+    parser.add_argument("--apply", action="store_true", help="--convex-url のdocumentsを実際に削除する")
+    args = parser.parse_args()
+
+    items, report = (dedup_pages if args.mode == "pages" else dedup_chunks)(args.source, args.threshold)
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for item in items:
+            if out:
+                out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    if args.mode == "pages":
+        saved = 1 - report["chars_after"] / report["chars_before"] if report["chars_before"] else 0.0
+        print(f"🧹 {report['pages']}ページ: 定型文の区間 {report['boilerplate_shingles']}件, "
+              f"重複ページ {len(report['duplicate_pages'])}件, 文字数 {saved * 100:.0f}%削減", file=sys.stderr)
+        for line in report["boilerplate_samples"][:5]:
+            print(f"   定型文: {line[:60]!r}", file=sys.stderr)
+    else:
+        print(f"🧹 {report['documents']}件中 {len(report['duplicates'])}件が重複 "
+              f"(複数ページにまたがるクラスタ {report['cross_page_clusters']}件)", file=sys.stderr)
+        if args.convex_url:
+            ids = [d["id"] for d in report["duplicates"] if not d["id"].startswith("row-")]
+            if args.apply:
+                from incremental_sync import ConvexHTTPClient
+
+                client = ConvexHTTPClient(args.convex_url)
+                deleted = sum(client.mutation("knowledge:deleteDocuments", {"ids": ids[i:i + 100]})
+                              for i in range(0, len(ids), 100))
+                print(f"🗑️ {deleted}件のdocumentsを削除しました", file=sys.stderr)
+            else:
+                print(f"   --apply で{len(ids)}件のdocumentsを削除します", file=sys.stderr)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
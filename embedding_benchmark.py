@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+埋め込みパイプラインのベンチマーク（チャンクごとの逐次 embedQuery vs 埋め込みスケジューラ）
+変更前の process_pending_documents はチャンクを1件ずつ embedQuery で逐次ベクトル化していたため、
+取り込み速度が埋め込みAPIの往復時間で決まっていた。skb-intelligence/src/utils/embedding-scheduler.ts と
+同じ手順（複数入力のリクエストへのまとめ・同時実行数の制限・トークンバケット・バックオフ付き再試行・
+Convexへの書き込みとの重ね合わせ）をPythonで再現し、レイテンシとクォータを設定できる
+ローカルの偽の埋め込みサーバーとConvex代替サーバーに対して取り込みスループットを比較する。
+
+偽の埋め込みサーバーは Google の batchEmbedContents と同じ形式なので、
+GOOGLE_EMBEDDING_API_BASE=http://127.0.0.1:PORT/v1beta を設定すれば実際の document-processor.ts も向けられる。
+
+使い方:
+  python embedding_benchmark.py                                    # 合成ページ100件で比較
+  python embedding_benchmark.py --pages 500 --quota-rpm 120 --latency-ms 300 --error-rate 0.05
+  python embedding_benchmark.py --serve --port 8089                 # 偽の埋め込みサーバーだけを起動
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import math
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer
+
+import requests
+
+from chunking_benchmark import recursive_character_split, synthesize_pages
+from convex_stub_server import start_convex_stub
+from local_embedder import LocalEmbedder
+from stub_chat_server import StubChatHandler
+
+MAX_BATCH = 100  # batchEmbedContents の1リクエストあたりの上限
+BATCH_PATH = re.compile(r"^/v1beta/models/([\w.-]+):batchEmbedContents")
+SINGLE_PATH = re.compile(r"^/v1beta/models/([\w.-]+):embedContent")  # embedQuery が呼ぶ1件ずつのAPI
+
+
+class FakeEmbeddingHandler(StubChatHandler):
+    """batchEmbedContents・embedContent 互換のエンドポイント（遅延・1分あたりのクォータ・障害率を再現）"""
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) if length else b"{}")
+        single = SINGLE_PATH.match(self.path)
+        if not single and not BATCH_PATH.match(self.path):
+            self._send(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+
+        server = self.server
+        retry_after = server.admit()
+        if retry_after is not None:
+            self._send(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                       "message": "Quota exceeded"}}, {"Retry-After": str(retry_after)})
+            return
+
+        entries = [body] if single else body.get("requests", [])
+        texts = [request["content"]["parts"][0]["text"] for request in entries]
+        if not texts or len(texts) > MAX_BATCH:
+            self._send(400, {"error": {"code": 400, "message": f"requests must contain 1-{MAX_BATCH} items"}})
+            return
+        time.sleep((server.latency_ms + server.per_text_ms * len(texts)) / 1000)
+        if random.random() < server.error_rate:
+            self._send(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "stub fault"}})
+            return
+        vectors = server.embedder.embed_documents(texts)
+        if single:
+            self._send(200, {"embedding": {"values": [round(float(x), 6) for x in vectors[0]]}})
+            return
+        self._send(200, {"embeddings": [{"values": [round(float(x), 6) for x in vector]} for vector in vectors]})
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=100.0, per_text_ms=1.0, quota_rpm=0, error_rate=0.0):
+        super().__init__(address, FakeEmbeddingHandler)
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.quota_rpm = quota_rpm
+        self.error_rate = error_rate
+        self.embedder = LocalEmbedder()
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def admit(self):
+        """直近60秒のリクエスト数がクォータ以内なら None、超えていれば再試行までの秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0] <= now - 60:
+                self._window.popleft()
+            if self.quota_rpm and len(self._window) >= self.quota_rpm:
+                self.counts["rate_limited"] += 1
+                return max(1, math.ceil(self._window[0] + 60 - now))
+            self._window.append(now)
+            self.counts["accepted"] += 1
+            return None
+
+
+def start_fake_embedding_server(host="127.0.0.1", port=0, **options):
+    server = FakeEmbeddingServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1beta"
+
+
+class EmbeddingRequestError(Exception):
+    def __init__(self, message, status=None, retry_after_s=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after_s = retry_after_s
+
+
+def batch_embedder(api_base, model="embedding-001", timeout=60):
+    """batchEmbedContents を呼ぶ関数を返す（スレッドごとにセッションを持つ）"""
+    local = threading.local()
+
+    def embed_batch(texts):
+        session = getattr(local, "session", None) or requests.Session()
+        local.session = session
+        response = session.post(f"{api_base}/models/{model}:batchEmbedContents", params={"key": "local"},
+                                timeout=timeout, json={"requests": [
+                                    {"model": f"models/{model}", "content": {"parts": [{"text": text}]}}
+                                    for text in texts]})
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After")
+            raise EmbeddingRequestError(f"Embedding request failed: {response.status_code}", response.status_code,
+                                        float(retry_after) if retry_after else None)
+        return [item["values"] for item in response.json()["embeddings"]]
+
+    return embed_batch
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = max(1, math.ceil(self.rate))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        with self.lock:
+            self.tokens = min(self.tokens, 0)
+
+
+class EmbeddingScheduler:
+    """embedding-scheduler.ts の EmbeddingScheduler と同じ手順のスケジューラ
+
+    max_in_flight 本のレーンが、レートの枠を得てからキューの先頭を最大 batch_size 件まとめて送る。
+    """
+
+    def __init__(self, embed_batch, batch_size=MAX_BATCH, max_in_flight=4, requests_per_minute=150,
+                 linger_s=0.02, max_retries=5, base_delay_s=0.5, max_delay_s=30.0):
+        self.embed_batch = embed_batch
+        self.batch_size = batch_size
+        self.linger_s = linger_s
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.bucket = TokenBucket(requests_per_minute)
+        self.queue = collections.deque()
+        self.ready = threading.Condition()
+        self.closed = False
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self.lanes = [threading.Thread(target=self._lane, daemon=True) for _ in range(max_in_flight)]
+        for lane in self.lanes:
+            lane.start()
+
+    def submit(self, texts):
+        """埋め込みを予約し、入力と同じ順序でベクトルを返すFutureのリストを返す"""
+        futures = [Future() for _ in texts]
+        with self.ready:
+            self.queue.extend(zip(texts, futures))
+            self.ready.notify_all()
+        return futures
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _lane(self):
+        while True:
+            with self.ready:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if not self.queue:
+                    return
+                # 少しだけ待って、他のページのチャンクと同じリクエストにまとめる
+                if len(self.queue) < self.batch_size:
+                    self.ready.wait(self.linger_s)
+            self.bucket.take()
+            with self.ready:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            if not batch:
+                continue
+            try:
+                vectors = self._send([text for text, _ in batch])
+            except (EmbeddingRequestError, requests.RequestException) as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _send(self, texts):
+        for attempt in itertools.count():
+            if attempt > 0:
+                self.bucket.take()
+            self._count("requests")
+            try:
+                vectors = self.embed_batch(texts)
+                self._count("texts", len(texts))
+                return vectors
+            except (EmbeddingRequestError, requests.RequestException) as e:
+                error = e
+            status = getattr(error, "status", None)
+            if attempt >= self.max_retries or (status is not None and status != 429 and status < 500):
+                raise error
+            if status == 429:
+                self._count("rate_limited")
+                self.bucket.drain()
+            backoff = min(self.max_delay_s, self.base_delay_s * 2 ** attempt)
+            delay = getattr(error, "retry_after_s", None) or backoff / 2 + random.random() * backoff / 2
+            self._count("retries")
+            time.sleep(delay)
+
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify_all()
+        for lane in self.lanes:
+            lane.join()
+
+
+def page_chunks(pages, chunk_size=1000, chunk_overlap=200):
+    return [(page, recursive_character_split(page["text"], chunk_size, chunk_overlap)) for page in pages]
+
+
+def save_page(convex_url, session, page, chunks, vectors):
+    documents = [{"text": chunk, "embedding": vector, "sourceUrl": page["url"]}
+                 for chunk, vector in zip(chunks, vectors)]
+    for path, args in (("knowledge:addDocuments", {"documents": documents}),
+                       ("pages:updatePageStatus", {"id": page["_id"], "status": "processed"})):
+        response = session.post(f"{convex_url}/api/mutation", json={"path": path, "args": args}, timeout=60)
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"{path} failed: {body.get('errorMessage')}")
+
+
+def run_sequential(items, api_base, convex_url):
+    """変更前の手順: ページごとに、チャンクを1件ずつ（1入力のリクエストで）逐次ベクトル化してから保存する"""
+    embed_batch = batch_embedder(api_base)
+    session = requests.Session()
+    stats = collections.Counter()
+    for page, chunks in items:
+        vectors = []
+        for chunk in chunks:
+            stats["requests"] += 1
+            try:
+                vectors.append(embed_batch([chunk])[0])
+            except EmbeddingRequestError:
+                stats["failed_chunks"] += 1  # 変更前もチャンク単位で失敗を記録して続行していた
+        save_page(convex_url, session, page, chunks[:len(vectors)], vectors)
+        stats["texts"] += len(vectors)
+    return stats
+
+
+def run_scheduled(items, api_base, convex_url, max_in_flight, requests_per_minute):
+    """スケジューラ: 全ページの埋め込みを予約し、終わったページから書き込みスレッドで順に保存する"""
+    scheduler = EmbeddingScheduler(batch_embedder(api_base), max_in_flight=max_in_flight,
+                                   requests_per_minute=requests_per_minute)
+    writes = queue.Queue()
+    failures = []
+
+    def writer():
+        session = requests.Session()
+        while (item := writes.get()) is not None:
+            try:
+                save_page(convex_url, session, *item)
+            except RuntimeError as e:
+                failures.append(str(e))
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    try:
+        pending = [(page, chunks, scheduler.submit(chunks)) for page, chunks in items]
+        for page, chunks, futures in pending:
+            try:
+                vectors = [future.result() for future in futures]
+            except (EmbeddingRequestError, requests.RequestException):
+                failures.append(f"Embedding failed for {page['url']}")
+                continue
+            writes.put((page, chunks, vectors))
+    finally:
+        writes.put(None)
+        writer_thread.join()
+        scheduler.close()
+    stats = scheduler.stats
+    stats["failures"] = len(failures)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="埋め込みパイプラインのベンチマーク")
+    parser.add_argument("--pages", type=int, default=100, help="合成ページ数")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="埋め込みリクエスト1回あたりの遅延")
+    parser.add_argument("--per-text-ms", type=float, default=1.0, help="入力1件あたりの追加の遅延")
+    parser.add_argument("--quota-rpm", type=int, default=300, help="偽の埋め込みサーバーのクォータ（0で無制限）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="偽の埋め込みサーバーが503を返す割合")
+    parser.add_argument("--convex-latency-ms", type=float, default=30.0, help="Convex代替サーバーの遅延")
+    parser.add_argument("--concurrency", type=int, default=4, help="スケジューラの同時リクエスト数")
+    parser.add_argument("--rpm", type=int, help="スケジューラのレート制限（既定: --quota-rpm）")
+    parser.add_argument("--skip-sequential", action="store_true", help="変更前の手順を計測しない")
+    parser.add_argument("--serve", action="store_true", help="偽の埋め込みサーバーだけを起動する")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    embedding_server, api_base = start_fake_embedding_server(
+        port=args.port, latency_ms=args.latency_ms, per_text_ms=args.per_text_ms, quota_rpm=args.quota_rpm,
+        error_rate=args.error_rate)
+    if args.serve:
+        print(f"🧪 偽の埋め込みサーバー起動: GOOGLE_EMBEDDING_API_BASE={api_base}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return 0
+
+    rpm = args.rpm or args.quota_rpm or 10 ** 6
+    report = {"settings": vars(args), "results": {}}
+    strategies = [("scheduled", lambda items, url: run_scheduled(items, api_base, url, args.concurrency, rpm))]
+    if not args.skip_sequential:
+        strategies.insert(0, ("sequential", lambda items, url: run_sequential(items, api_base, url)))
+
+    quota_bound = args.quota_rpm / 60 * MAX_BATCH if args.quota_rpm else None
+    print(f"🧪 埋め込み {args.latency_ms}ms/回, クォータ {args.quota_rpm or '無制限'} rpm, "
+          f"Convex {args.convex_latency_ms}ms/回"
+          + (f"  (クォータ上限 {quota_bound:.0f} chunks/s)" if quota_bound else ""))
+    for name, run in strategies:
+        convex, convex_url = start_convex_stub(latency_ms=args.convex_latency_ms)
+        try:
+            pages = synthesize_pages(args.pages)
+            for page in pages:
+                page["_id"] = convex.store.add_page(page["url"], page["text"])
+            items = page_chunks(pages)
+            chunks = sum(len(chunks) for _, chunks in items)
+
+            embedding_server.counts.clear()
+            started = time.perf_counter()
+            stats = run(items, convex_url)
+            elapsed = time.perf_counter() - started
+            saved = len(convex.store.tables["documents"])
+        finally:
+            convex.shutdown()
+
+        result = {"chunks": chunks, "saved": saved, "elapsed_s": round(elapsed, 2),
+                  "chunks_per_s": round(saved / elapsed, 1), "server": dict(embedding_server.counts), **stats}
+        report["results"][name] = result
+        print(f"  {name:>10}: {saved}/{chunks}チャンク保存 / {elapsed:.1f}秒  {result['chunks_per_s']} chunks/s  "
+              f"リクエスト {stats['requests']}  429 {embedding_server.counts['rate_limited']}  "
+              f"再試行 {stats.get('retries', 0)}")
+
+    results = report["results"]
+    if "sequential" in results and results["sequential"]["chunks_per_s"]:
+        print(f"\n⚡ スケジューラは逐次処理の "
+              f"{results['scheduled']['chunks_per_s'] / results['sequential']['chunks_per_s']:.1f}倍")
+    embedding_server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
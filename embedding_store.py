@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+メモリマップ型のembeddingストア
+documents テーブル（skb-datastore/convex/schema.ts）のエクスポートを、
+連続したfloat32/float16行列とオフセット索引付きのテキスト・URLサイドカーに変換する。
+numpy.memmap で開くため読み込みはほぼ一瞬で、RSSを抑えたまま数百万チャンクを検索できる。
+
+ストアのディレクトリ構成:
+  meta.json          件数・次元・dtype
+  embeddings.bin     N×dim の行列（float32 または float16、行優先）
+  norms.f32          各行のL2ノルム（コサイン類似度用）
+  created_at.i64     createdAt（Unix ms）
+  text.bin/.idx      UTF-8テキストを連結したものと、N+1個のuint64オフセット
+  id.bin/.idx        Convexの _id（エクスポートに含まれる場合）
+  source_urls.json   ユニークなsourceUrl一覧
+  source_url.u32     各行のsourceUrl番号
+
+使い方:
+  python embedding_store.py import documents.json store/ [--dtype float16]
+  python embedding_store.py export store/ documents.jsonl
+  python embedding_store.py info store/
+  python embedding_store.py search store/ --row 0 -k 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+EMBEDDING_DIM = 768
+SEARCH_BLOCK_ROWS = 65536  # 検索時に一度に読む行数（RSSの上限を決める）
+WRITE_BATCH_ROWS = 4096  # 書き込み時にまとめてフラッシュする行数
+
+
+def iter_documents(path):
+    """エクスポートファイルからドキュメントを順に返す
+
+    JSONLはストリーミングで読む。JSON配列（{"value": [...]} 形式を含む）は一括で読み込む。
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            data = json.load(f)
+            yield from (data.get("value", data) if isinstance(data, dict) else data)
+
+
+class _StringColumnWriter:
+    def __init__(self, directory, name):
+        self.data = open(os.path.join(directory, f"{name}.bin"), "wb")
+        self.offsets = [0]
+
+    def append(self, value):
+        encoded = value.encode("utf-8")
+        self.data.write(encoded)
+        self.offsets.append(self.offsets[-1] + len(encoded))
+
+    def close(self, directory, name):
+        self.data.close()
+        np.asarray(self.offsets, dtype=np.uint64).tofile(os.path.join(directory, f"{name}.idx"))
+
+
+class EmbeddingStoreWriter:
+    """ドキュメントを1件ずつ追記してストアを作る（全件をメモリに載せない）"""
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, dtype="float32"):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._embeddings = open(os.path.join(directory, "embeddings.bin"), "wb")
+        self._norms = open(os.path.join(directory, "norms.f32"), "wb")
+        self._created_at = open(os.path.join(directory, "created_at.i64"), "wb")
+        self._source_url_ids = open(os.path.join(directory, "source_url.u32"), "wb")
+        self._text = _StringColumnWriter(directory, "text")
+        self._id = _StringColumnWriter(directory, "id")
+        self._source_urls = {}
+        self._pending = {"embeddings": [], "created_at": [], "source_url_ids": []}
+
+    def append(self, document):
+        embedding = np.asarray(document["embedding"], dtype=np.float32)
+        if embedding.shape != (self.dim,):
+            raise ValueError(f"Invalid embedding dimension: {embedding.shape[0]}, expected {self.dim}")
+
+        url = document.get("sourceUrl", "")
+        url_id = self._source_urls.setdefault(url, len(self._source_urls))
+
+        self._pending["embeddings"].append(embedding)
+        self._pending["created_at"].append(document.get("createdAt", 0))
+        self._pending["source_url_ids"].append(url_id)
+        self._text.append(document.get("text", ""))
+        self._id.append(document.get("_id", ""))
+        self.count += 1
+        if len(self._pending["embeddings"]) >= WRITE_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending["embeddings"]:
+            return
+        embeddings = np.stack(self._pending["embeddings"])
+        embeddings.astype(self.dtype).tofile(self._embeddings)
+        np.linalg.norm(embeddings, axis=1).astype(np.float32).tofile(self._norms)
+        np.asarray(self._pending["created_at"], dtype=np.int64).tofile(self._created_at)
+        np.asarray(self._pending["source_url_ids"], dtype=np.uint32).tofile(self._source_url_ids)
+        self._pending = {"embeddings": [], "created_at": [], "source_url_ids": []}
+
+    def close(self):
+        self._flush()
+        for f in (self._embeddings, self._norms, self._created_at, self._source_url_ids):
+            f.close()
+        self._text.close(self.directory, "text")
+        self._id.close(self.directory, "id")
+        with open(os.path.join(self.directory, "source_urls.json"), "w", encoding="utf-8") as f:
+            json.dump(list(self._source_urls), f, ensure_ascii=False)
+        with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "count": self.count,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+            }, f, indent=2)
+
+
+class EmbeddingStore:
+    """読み取り専用でメモリマップしたストア"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"未対応のストア形式: version {meta['version']}")
+
+        self.directory = directory
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+
+        def mapped(name, dtype, shape=None):
+            path = os.path.join(directory, name)
+            # 0件のストアはmemmapできないため空配列を返す
+            if os.path.getsize(path) == 0:
+                return np.zeros(shape if shape else 0, dtype=dtype)
+            return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+        self.embeddings = mapped("embeddings.bin", self.dtype, (self.count, self.dim))
+        self.norms = mapped("norms.f32", np.float32)
+        self.created_at = mapped("created_at.i64", np.int64)
+        self.source_url_ids = mapped("source_url.u32", np.uint32)
+        self._text = (mapped("text.bin", np.uint8), np.fromfile(os.path.join(directory, "text.idx"), np.uint64))
+        self._id = (mapped("id.bin", np.uint8), np.fromfile(os.path.join(directory, "id.idx"), np.uint64))
+        with open(os.path.join(directory, "source_urls.json"), encoding="utf-8") as f:
+            self.source_urls = json.load(f)
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def _string(column, row):
+        data, offsets = column
+        return bytes(data[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def text(self, row):
+        return self._string(self._text, row)
+
+    def document_id(self, row):
+        return self._string(self._id, row)
+
+    def source_url(self, row):
+        return self.source_urls[self.source_url_ids[row]]
+
+    def document(self, row, include_embedding=True):
+        """documents スキーマの形（text, embedding, sourceUrl, createdAt）で1行を返す"""
+        document = {
+            "text": self.text(row),
+            "sourceUrl": self.source_url(row),
+            "createdAt": int(self.created_at[row]),
+        }
+        if include_embedding:
+            document["embedding"] = self.embeddings[row].astype(np.float64).tolist()
+        document_id = self.document_id(row)
+        if document_id:
+            document["_id"] = document_id
+        return document
+
+    def search(self, query, k=5, block_rows=SEARCH_BLOCK_ROWS):
+        """コサイン類似度のtop-kをブロック単位で走査して返す: [(row, score), ...]
+
+        一度に読むのは block_rows 行だけなので、コーパス全体をメモリに載せずに済む。
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        for start in range(0, self.count, block_rows):
+            end = min(self.count, start + block_rows)
+            block = np.asarray(self.embeddings[start:end], dtype=np.float32)
+            norms = np.where(self.norms[start:end] == 0, 1.0, self.norms[start:end])
+            scores = (block @ query) / norms
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+
+def import_documents(source, directory, dtype="float32"):
+    """エクスポート（JSON/JSONL）からストアを作成し、件数を返す"""
+    writer = EmbeddingStoreWriter(directory, dtype=dtype)
+    try:
+        for document in iter_documents(source):
+            writer.append(document)
+    finally:
+        writer.close()
+    return writer.count
+
+
+def export_documents(directory, destination):
+    """ストアを documents スキーマのJSONLに書き出し、件数を返す"""
+    store = EmbeddingStore(directory)
+    with open(destination, "w", encoding="utf-8") as f:
+        for row in range(len(store)):
+            f.write(json.dumps(store.document(row), ensure_ascii=False) + "\n")
+    return len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メモリマップ型embeddingストア")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="エクスポートJSON/JSONLからストアを作成")
+    import_parser.add_argument("source")
+    import_parser.add_argument("store")
+    import_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    export_parser = subparsers.add_parser("export", help="ストアをdocumentsスキーマのJSONLに書き出す")
+    export_parser.add_argument("store")
+    export_parser.add_argument("destination")
+
+    info_parser = subparsers.add_parser("info", help="ストアの概要を表示")
+    info_parser.add_argument("store")
+
+    search_parser = subparsers.add_parser("search", help="既存行のembeddingをクエリにして検索")
+    search_parser.add_argument("store")
+    search_parser.add_argument("--row", type=int, required=True)
+    search_parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        started = time.perf_counter()
+        count = import_documents(args.source, args.store, args.dtype)
+        print(f"💾 {count}件を{args.store}に保存しました ({time.perf_counter() - started:.1f}秒)")
+    elif args.command == "export":
+        count = export_documents(args.store, args.destination)
+        print(f"💾 {count}件を{args.destination}に書き出しました")
+    elif args.command == "info":
+        started = time.perf_counter()
+        store = EmbeddingStore(args.store)
+        open_ms = (time.perf_counter() - started) * 1000
+        size = sum(os.path.getsize(os.path.join(args.store, name)) for name in os.listdir(args.store))
+        print(f"件数: {len(store)}, 次元: {store.dim}, dtype: {store.dtype.name}, "
+              f"ソースURL: {len(store.source_urls)}, サイズ: {size / 1048576:.1f}MB, オープン: {open_ms:.1f}ms")
+    elif args.command == "search":
+        store = EmbeddingStore(args.store)
+        started = time.perf_counter()
+        hits = store.search(store.embeddings[args.row], args.k)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"🔍 {len(store)}件を検索 ({elapsed_ms:.1f}ms)")
+        for row, score in hits:
+            print(f"  {score:.3f}  {store.source_url(row)}  {store.text(row)[:60]!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+HTTPのみの軽量プローブ
+ブラウザ検証の前段として、多数のデプロイURLのステータス・TLS・TTFBを並列に確認し、
+正常なターゲットだけをブラウザ検証へ進める。
+
+使い方:
+  python http_probe.py URL [URL ...] [--targets-file urls.txt] [--workers 16]
+  （正常でないターゲットがあれば終了コード1）
+"""
+
+import argparse
+import socket
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 10
+MAX_TTFB_MS = 5000  # これを超えるTTFBは不健全とみなす
+MIN_CERT_DAYS = 7  # 証明書の残り日数がこれ未満なら不健全とみなす
+
+
+class HttpProber:
+    """コネクションプール付きのHTTPプローブ
+
+    ステータスとTTFBはプールされたrequests.Sessionで取得し、
+    TLSハンドシェイク時間と証明書期限はホストごとに1回だけ確認する。
+    """
+
+    def __init__(self, workers=16, timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._tls_cache = {}
+        self._tls_lock = threading.Lock()
+
+    def _check_tls(self, host, port):
+        """TCP接続・TLSハンドシェイク時間と証明書の残り日数を計測する"""
+        key = (host, port)
+        with self._tls_lock:
+            if key in self._tls_cache:
+                return self._tls_cache[key]
+
+        result = {"connect_ms": None, "tls_handshake_ms": None, "cert_days_left": None, "tls_error": None}
+        try:
+            start = time.perf_counter()
+            with socket.create_connection((host, port), timeout=self.timeout) as sock:
+                result["connect_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                tls_start = time.perf_counter()
+                context = ssl.create_default_context()
+                with context.wrap_socket(sock, server_hostname=host) as tls_sock:
+                    result["tls_handshake_ms"] = round((time.perf_counter() - tls_start) * 1000, 1)
+                    not_after = ssl.cert_time_to_seconds(tls_sock.getpeercert()["notAfter"])
+                    result["cert_days_left"] = round((not_after - time.time()) / 86400, 1)
+        except (OSError, ssl.SSLError) as e:
+            result["tls_error"] = str(e)
+
+        with self._tls_lock:
+            self._tls_cache[key] = result
+        return result
+
+    def probe(self, url):
+        """1つのURLを確認し、計測値と健全性の判定を返す"""
+        parts = urlsplit(url)
+        result = {"url": url, "status": None, "ttfb_ms": None, "healthy": False, "reason": None}
+
+        if parts.scheme == "https":
+            result.update(self._check_tls(parts.hostname, parts.port or 443))
+            if result["tls_error"]:
+                result["reason"] = f"TLSエラー: {result['tls_error']}"
+                return result
+            if result["cert_days_left"] is not None and result["cert_days_left"] < MIN_CERT_DAYS:
+                result["reason"] = f"証明書の期限が近い ({result['cert_days_left']}日)"
+
+        try:
+            # stream=True で本文を読まず、ヘッダー受信までの時間（TTFB）を計測する
+            with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=True) as response:
+                result["status"] = response.status_code
+                result["ttfb_ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+        except requests.RequestException as e:
+            result["reason"] = f"接続失敗: {str(e)}"
+            return result
+
+        if result["reason"]:
+            return result
+        if result["status"] != 200:
+            result["reason"] = f"HTTPステータス {result['status']}"
+        elif result["ttfb_ms"] > MAX_TTFB_MS:
+            result["reason"] = f"TTFBが遅い ({result['ttfb_ms']:.0f}ms)"
+        else:
+            result["healthy"] = True
+        return result
+
+    def probe_all(self, urls):
+        """複数URLを並列に確認する（入力順で返す）"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.probe, urls))
+
+    def close(self):
+        self.session.close()
+
+
+def load_targets(urls, targets_file=None):
+    """コマンドライン引数とファイル（1行1URL、#でコメント）からターゲットを集める"""
+    targets = list(urls)
+    if targets_file:
+        with open(targets_file, encoding="utf-8") as f:
+            targets.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return list(dict.fromkeys(targets))
+
+
+def print_probe_results(results):
+    for result in results:
+        mark = "✅" if result["healthy"] else "❌"
+        ttfb = f"{result['ttfb_ms']:.0f}ms" if result["ttfb_ms"] is not None else "-"
+        tls = f"{result['tls_handshake_ms']:.0f}ms" if result.get("tls_handshake_ms") is not None else "-"
+        reason = f" ({result['reason']})" if result["reason"] else ""
+        print(f"  {mark} {result['url']}  status={result['status']} TTFB={ttfb} TLS={tls}{reason}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTPのみの軽量プローブ")
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--targets-file", help="1行1URLのターゲット一覧")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    args = parser.parse_args()
+
+    targets = load_targets(args.urls, args.targets_file)
+    if not targets:
+        parser.error("URLを指定してください")
+
+    prober = HttpProber(args.workers, args.timeout)
+    started = time.perf_counter()
+    results = prober.probe_all(targets)
+    prober.close()
+
+    print(f"🔍 {len(targets)}件をプローブ ({(time.perf_counter() - started):.2f}秒)")
+    print_probe_results(results)
+    sys.exit(0 if all(r["healthy"] for r in results) else 1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+searchByEmbedding の結果取得（hydration）のベンチマーク
+変更前の search.ts はベクトル検索のヒットごとに ctx.runQuery(getDocumentById) を直列に呼んでいたため、
+limit=256 なら256回の往復が終わるまで結果を返せなかった。Convex代替サーバーで
+actionの中の runQuery 1回ごとの遅延を再現し、件数分の直列取得（serial）と
+getDocumentsByIds による一括取得（batched）のレイテンシを limit ごとに比較する。
+
+使い方:
+  python hydration_benchmark.py                                   # 代替サーバーで serial と batched を比較
+  python hydration_benchmark.py --run-query-ms 8 --limits 5 50 256
+  python hydration_benchmark.py --convex-url https://xxx.convex.cloud   # 実環境の現在の実装を計測
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import requests
+
+from convex_stub_server import EMBEDDING_DIM, HYDRATION_MODES, start_convex_stub
+from latency_histogram import LatencyHistogram
+
+DEFAULT_LIMITS = [5, 16, 64, 128, 256]
+DEFAULT_RUN_QUERY_MS = 4.0  # actionからのrunQuery 1回あたりの往復の目安
+
+
+def seed_documents(store, count, dim=EMBEDDING_DIM, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    with store.lock:
+        for start in range(0, count, 1000):
+            store.add_documents([{"text": f"チャンク{i} " + "攻略情報" * 100, "embedding": vectors[i].tolist(),
+                                  "sourceUrl": f"https://example.com/page/{i // 10}"}
+                                 for i in range(start, min(start + 1000, count))])
+
+
+def measure(base_url, limits, repeats, dim=EMBEDDING_DIM, seed=1):
+    """limitごとに searchByEmbedding を repeats 回呼び、レイテンシの分布と返却件数を返す"""
+    rng = np.random.default_rng(seed)
+    session = requests.Session()
+    results = {}
+    for limit in limits:
+        latency = LatencyHistogram()
+        returned = 0
+        for _ in range(repeats):
+            embedding = rng.standard_normal(dim).tolist()
+            started = time.perf_counter()
+            response = session.post(f"{base_url}/api/action", timeout=120,
+                                    json={"path": "search:searchByEmbedding",
+                                          "args": {"embedding": embedding, "limit": limit}})
+            latency.record((time.perf_counter() - started) * 1000)
+            body = response.json()
+            if body.get("status") != "success":
+                raise RuntimeError(f"searchByEmbedding failed: {body.get('errorMessage')}")
+            returned = len(body["value"])
+        results[limit] = {"returned": returned, **latency.summary()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="searchByEmbedding の直列取得と一括取得の比較")
+    parser.add_argument("--documents", type=int, default=5000, help="代替サーバーに投入するdocuments数")
+    parser.add_argument("--limits", type=int, nargs="+", default=DEFAULT_LIMITS)
+    parser.add_argument("--repeats", type=int, default=20, help="limitごとの検索回数")
+    parser.add_argument("--run-query-ms", type=float, default=DEFAULT_RUN_QUERY_MS,
+                        help="actionの中の ctx.runQuery 1回あたりの遅延")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="HTTPリクエスト1回あたりの遅延")
+    parser.add_argument("--convex-url", help="実環境を計測する（代替サーバーを使わない）")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    report = {}
+    if args.convex_url:
+        print(f"🔍 {args.convex_url} の searchByEmbedding を計測")
+        report["deployment"] = measure(args.convex_url, args.limits, args.repeats)
+    else:
+        server, base_url = start_convex_stub(latency_ms=args.latency_ms, run_query_ms=args.run_query_ms)
+        seed_documents(server.store, args.documents)
+        print(f"🧪 Convex代替サーバー: documents {args.documents}件, runQuery {args.run_query_ms}ms/回")
+        try:
+            for mode in HYDRATION_MODES:
+                server.update_profile({"hydration": mode})
+                report[mode] = measure(base_url, args.limits, args.repeats)
+        finally:
+            server.shutdown()
+
+    modes = list(report)
+    print(f"{'limit':>6} " + " ".join(f"{mode + ' p50':>14} {mode + ' p95':>14}" for mode in modes))
+    for limit in args.limits:
+        print(f"{limit:>6} " + " ".join(f"{report[mode][limit]['p50']:>12.1f}ms {report[mode][limit]['p95']:>12.1f}ms"
+                                        for mode in modes))
+    if "serial" in report and "batched" in report:
+        largest = max(args.limits)
+        print(f"\n⚡ limit={largest}: batched は serial の "
+              f"{report['serial'][largest]['p50'] / report['batched'][largest]['p50']:.1f}倍速")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
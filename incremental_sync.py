@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+差分再クロール同期（コンテンツハッシュによる変更検出）
+クロールし直したページのテキストをページ単位・チャンク単位でハッシュ化し、
+Convexに保存済みのチャンクと比較して、新規・変更されたチャンクだけを埋め込んで追加し、
+不要になった documents を削除する。再同期のコストはサイト規模ではなく変更量に比例する。
+
+チャンク分割は document-processor.ts と同じ RecursiveCharacterTextSplitter の手順を使う。
+同期状態はローカルのSQLite（マニフェスト）にキャッシュし、マニフェストにないURLと、
+前回の同期が書き込みの途中で止まったURLは knowledge:getDocumentsBySourceUrl の本文からハッシュを復元する。
+
+埋め込みの既定は google（embedding-001）。local は決定的な代替モデルで、ベクトルが embedding-001 と
+別の空間になり searchByEmbedding を壊すため、書き込み先がローカルのスタブのときか --dry-run でだけ使える。
+
+使い方:
+  python incremental_sync.py crawl.jsonl --convex-url URL --dry-run      # 埋め込み対象のチャンクだけ出力
+  python incremental_sync.py crawl.jsonl --convex-url URL                # embedding-001 で埋め込んで同期
+  python incremental_sync.py crawl.jsonl --convex-url http://127.0.0.1:PORT --embedder local  # スタブで検証
+  python incremental_sync.py crawl.jsonl --convex-url URL --prune        # 入力にないURLのdocumentsも削除
+  （入力は {"url", "text"} のJSON/JSONL。pages:getAllPages のエクスポートも使える）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+
+from chunking_benchmark import recursive_character_split
+from embedding_store import iter_documents
+from local_embedder import LocalEmbedder
+
+DEFAULT_MANIFEST_PATH = "sync_manifest.db"
+GOOGLE_EMBED_URL = "https://generativelanguage.googleapis.com/v1beta/models/embedding-001:batchEmbedContents"
+EMBED_BATCH_SIZE = 100
+ADD_BATCH_SIZE = 50  # knowledge:addDocuments 1回あたりの件数（mutationの引数サイズ上限対策）
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+DIRTY_HASH = ""  # 書き込み中のページ（マニフェストのチャンクは信用せずConvexから復元する）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    chunk_overlap INTEGER NOT NULL,
+    synced_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    url TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    document_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_url ON chunks (url);
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ConvexHTTPClient:
+    """skb-intelligence のツールと同じ {path, args} 形式でConvexを呼ぶ最小クライアント"""
+
+    def __init__(self, base_url, admin_key=None, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.admin_key = admin_key or os.environ.get("CONVEX_AUTH_TOKEN")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _call(self, kind, path, args):
+        body = {"path": path, "args": args}
+        if self.admin_key:
+            body["adminKey"] = self.admin_key
+        response = self.session.post(f"{self.base_url}/api/{kind}", json=body, timeout=self.timeout)
+        if not response.ok:
+            raise RuntimeError(f"Convex {kind} failed: {response.status_code} - {response.text}")
+        result = response.json()
+        if isinstance(result, dict) and result.get("status") == "error":
+            raise RuntimeError(f"Convex {kind} {path} failed: {result.get('errorMessage')}")
+        return result.get("value") if isinstance(result, dict) and "status" in result else result
+
+    def query(self, path, args=None):
+        return self._call("query", path, args or {})
+
+    def mutation(self, path, args=None):
+        return self._call("mutation", path, args or {})
+
+
+class GoogleEmbedder:
+    """Google Generative AI embedding-001 を batchEmbedContents で呼ぶ（LocalEmbedderと同じインターフェース）"""
+
+    def __init__(self, api_key=None, timeout=60):
+        self.api_key = api_key or os.environ.get("GOOGLE_GENERATIVE_AI_API_KEY")
+        if not self.api_key:
+            raise ValueError("GOOGLE_GENERATIVE_AI_API_KEY is required")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.calls = 0
+        self.texts = 0
+        self.chars = 0
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            response = self.session.post(GOOGLE_EMBED_URL, params={"key": self.api_key}, timeout=self.timeout, json={
+                "requests": [{"model": "models/embedding-001", "content": {"parts": [{"text": text}]}}
+                             for text in batch],
+            })
+            response.raise_for_status()
+            vectors.extend(item["values"] for item in response.json()["embeddings"])
+            self.calls += 1
+            self.texts += len(batch)
+            self.chars += sum(len(text) for text in batch)
+        return vectors
+
+
+class SyncManifest:
+    """URLごとのコンテンツハッシュと、チャンクハッシュ→documentsのIDの対応を保持する"""
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def page(self, url):
+        row = self.conn.execute(
+            "SELECT content_hash, chunk_size, chunk_overlap FROM pages WHERE url = ?", (url,)).fetchone()
+        return None if row is None else {"content_hash": row[0], "chunk_size": row[1], "chunk_overlap": row[2]}
+
+    def chunks(self, url):
+        return self.conn.execute("SELECT chunk_hash, document_id FROM chunks WHERE url = ?", (url,)).fetchall()
+
+    def urls(self):
+        return [row[0] for row in self.conn.execute("SELECT url FROM pages")]
+
+    def mark_dirty(self, url, chunk_size, chunk_overlap):
+        """Convexへの書き込みを始める前に呼ぶ（途中で止まっても次回はConvexの documents から復元させる）"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO pages (url, content_hash, chunk_size, chunk_overlap, synced_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET content_hash = excluded.content_hash",
+                (url, DIRTY_HASH, chunk_size, chunk_overlap, datetime.now().isoformat(timespec="seconds")))
+
+    def save_page(self, url, page_hash, chunk_size, chunk_overlap, chunks):
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self.conn.executemany("INSERT INTO chunks (url, chunk_hash, document_id) VALUES (?, ?, ?)",
+                                  [(url, chunk_hash, document_id) for chunk_hash, document_id in chunks])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, content_hash, chunk_size, chunk_overlap, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, page_hash, chunk_size, chunk_overlap, datetime.now().isoformat(timespec="seconds")))
+
+    def remove_page(self, url):
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def close(self):
+        self.conn.close()
+
+
+def diff_chunks(new_chunks, stored):
+    """新しいチャンク列と保存済みの (chunk_hash, document_id) を比較する
+
+    戻り値は (keep, add, delete):
+      keep   既存のまま使える [(chunk_hash, document_id)]
+      add    埋め込みが必要な [(chunk_hash, text)]
+      delete 不要になった document_id のリスト
+    同じ内容のチャンクが複数ある場合も件数どおりに対応させる。
+    """
+    available = {}
+    for chunk_hash, document_id in stored:
+        available.setdefault(chunk_hash, []).append(document_id)
+
+    keep, add = [], []
+    for text in new_chunks:
+        chunk_hash = content_hash(text)
+        if available.get(chunk_hash):
+            keep.append((chunk_hash, available[chunk_hash].pop()))
+        else:
+            add.append((chunk_hash, text))
+    delete = [document_id for ids in available.values() for document_id in ids]
+    return keep, add, delete
+
+
+class IncrementalSync:
+    def __init__(self, convex, manifest, embedder, chunk_size=1000, chunk_overlap=200, dry_run=False):
+        self.convex = convex
+        self.manifest = manifest
+        self.embedder = embedder
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.dry_run = dry_run
+        self.counts = Counter()
+        self.pending_embeddings = []  # dry_run時に出力する埋め込み対象
+
+    def _stored_chunks(self, url):
+        """マニフェストにあればそれを使い、なければ（または前回の書き込みが途中で止まっていれば）
+        Convexの documents から復元する"""
+        known = self.manifest.page(url)
+        if known is not None and known["content_hash"] != DIRTY_HASH:
+            return self.manifest.chunks(url)
+        documents = self.convex.query("knowledge:getDocumentsBySourceUrl", {"sourceUrl": url}) or []
+        self.counts["documents_fetched"] += len(documents)
+        return [(content_hash(doc["text"]), doc["_id"]) for doc in documents]
+
+    def sync_page(self, url, text):
+        page_hash = content_hash(text)
+        known = self.manifest.page(url)
+        if known and known["content_hash"] == page_hash and \
+                (known["chunk_size"], known["chunk_overlap"]) == (self.chunk_size, self.chunk_overlap):
+            self.counts["pages_unchanged"] += 1
+            return
+
+        stored = self._stored_chunks(url)
+        chunks = recursive_character_split(text, self.chunk_size, self.chunk_overlap)
+        keep, add, delete = diff_chunks(chunks, stored)
+        if not stored:
+            self.counts["pages_new"] += 1
+        else:
+            self.counts["pages_changed" if add or delete else "pages_unchanged"] += 1
+        self.counts["chunks_total"] += len(chunks)
+        self.counts["chunks_kept"] += len(keep)
+        self.counts["chunks_added"] += len(add)
+        self.counts["documents_deleted"] += len(delete)
+
+        if self.dry_run:
+            self.pending_embeddings.extend({"sourceUrl": url, "hash": chunk_hash, "text": chunk_text}
+                                           for chunk_hash, chunk_text in add)
+            return
+
+        if add or delete:
+            self.manifest.mark_dirty(url, self.chunk_size, self.chunk_overlap)
+        added = []
+        if add:
+            vectors = self.embedder.embed_documents([chunk_text for _, chunk_text in add])
+            documents = [{"text": chunk_text, "embedding": [float(x) for x in vector], "sourceUrl": url}
+                         for (_, chunk_text), vector in zip(add, vectors)]
+            ids = []
+            for start in range(0, len(documents), ADD_BATCH_SIZE):
+                ids.extend(self.convex.mutation("knowledge:addDocuments",
+                                                {"documents": documents[start:start + ADD_BATCH_SIZE]}))
+            added = [(chunk_hash, document_id) for (chunk_hash, _), document_id in zip(add, ids)]
+        if delete:
+            self.convex.mutation("knowledge:deleteDocuments", {"ids": delete})
+        self.manifest.save_page(url, page_hash, self.chunk_size, self.chunk_overlap, keep + added)
+
+    def prune(self, live_urls):
+        """入力に含まれないURLの documents を削除する"""
+        for url in set(self.manifest.urls()) - set(live_urls):
+            self.counts["pages_removed"] += 1
+            if not self.dry_run:
+                self.counts["documents_deleted"] += self.convex.mutation(
+                    "knowledge:deleteDocumentsBySourceUrl", {"sourceUrl": url}) or 0
+                self.manifest.remove_page(url)
+
+    def run(self, pages, prune=False):
+        started = time.perf_counter()
+        urls = []
+        for page in pages:
+            if not page.get("text", "").strip():
+                continue
+            urls.append(page["url"])
+            self.sync_page(page["url"], page["text"])
+        if prune:
+            self.prune(urls)
+
+        report = {name: self.counts[name] for name in (
+            "pages_new", "pages_changed", "pages_unchanged", "pages_removed",
+            "chunks_total", "chunks_kept", "chunks_added", "documents_deleted", "documents_fetched")}
+        report["embed_calls"] = getattr(self.embedder, "calls", 0)
+        report["embedded_chars"] = getattr(self.embedder, "chars", 0)
+        report["embedding_saved_ratio"] = (report["chunks_kept"] / report["chunks_total"]
+                                           if report["chunks_total"] else 1.0)
+        report["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="差分再クロール同期")
+    parser.add_argument("pages", help="クロール結果（{url, text} のJSON/JSONL）")
+    parser.add_argument("--convex-url", default=os.environ.get("CONVEX_URL"), help="ConvexのURL（既定: CONVEX_URL）")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH, help="同期マニフェスト（SQLite）のパス")
+    parser.add_argument("--embedder", choices=["local", "google"], default="google",
+                        help="埋め込みモデル（local は検証用の決定的な代替で、スタブか --dry-run でのみ使用可）")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--prune", action="store_true", help="入力にないURLの documents を削除")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに埋め込み対象のチャンクを出力")
+    parser.add_argument("--output", help="--dry-run時の埋め込み対象の出力先（JSONL、省略時は標準出力）")
+    args = parser.parse_args()
+
+    if not args.convex_url:
+        parser.error("--convex-url または CONVEX_URL を指定してください")
+    if args.embedder == "local" and not args.dry_run and urlparse(args.convex_url).hostname not in LOCAL_HOSTS:
+        parser.error("--embedder local のベクトルは embedding-001 と互換性がないため、"
+                     "ローカルのスタブ以外へは書き込めません（--embedder google を使ってください）")
+
+    embedder = GoogleEmbedder() if args.embedder == "google" and not args.dry_run else LocalEmbedder()
+    manifest = SyncManifest(args.manifest)
+    sync = IncrementalSync(ConvexHTTPClient(args.convex_url), manifest, embedder,
+                           args.chunk_size, args.chunk_overlap, args.dry_run)
+    try:
+        report = sync.run(iter_documents(args.pages), args.prune)
+    finally:
+        manifest.close()
+
+    if args.dry_run:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        for item in sync.pending_embeddings:
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+        if args.output:
+            out.close()
+
+    print(f"🔄 新規 {report['pages_new']} / 変更 {report['pages_changed']} / 変更なし {report['pages_unchanged']} / "
+          f"削除 {report['pages_removed']} ページ", file=sys.stderr)
+    print(f"   チャンク {report['chunks_total']}件中 再利用 {report['chunks_kept']} / 埋め込み {report['chunks_added']}, "
+          f"documents削除 {report['documents_deleted']}件 "
+          f"(埋め込み削減率 {report['embedding_saved_ratio'] * 100:.0f}%, {report['elapsed_s']}秒)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
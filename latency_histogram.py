@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+ストリーミング型レイテンシヒストグラム
+対数バケット（相対誤差保証付き）で集計するため、全サンプルを保持せずにパーセンタイルを計算できる
+"""
+
+import math
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LatencyHistogram:
+    """対数バケットのヒストグラム
+
+    値 v はバケット ceil(log_gamma(v)) に数えられ、パーセンタイルは
+    バケット代表値で返す。代表値の相対誤差は relative_error 以下になる。
+    """
+
+    def __init__(self, relative_error=0.01):
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0  # 0以下の値（計測誤差）
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        """値を記録する"""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """同じ相対誤差の別ヒストグラムを合算する"""
+        if other.gamma != self.gamma:
+            raise ValueError("相対誤差の異なるヒストグラムは合算できません")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """p パーセンタイル（0-100）を返す。サンプルがなければNone"""
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = self.zero_count
+        if rank <= seen:
+            return max(self.min, 0.0)
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self, percentiles=PERCENTILES):
+        """件数・平均・最小・最大・パーセンタイルの辞書"""
+        result = {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+        }
+        for p in percentiles:
+            result[f"p{p}"] = self.percentile(p)
+        return result
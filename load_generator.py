@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+/api/chat 向けオープンループ負荷生成
+目標RPSで到着時刻をあらかじめ決め、応答を待たずにリクエストを発行する。
+レイテンシは予定送信時刻から計測するため、サーバーが詰まった場合の待ち時間も含まれる。
+"""
+
+import asyncio
+import json
+import math
+import time
+
+from async_http import ConnectionPool
+from latency_histogram import LatencyHistogram
+
+
+def arrival_offsets(rps, duration, ramp_up=0.0):
+    """各リクエストの予定送信時刻（開始からの秒数）を返す
+
+    ramp_up 秒かけて 0 → rps まで線形に増加し、その後は rps で一定。
+    """
+    offsets = []
+    ramp_requests = rps * ramp_up / 2  # ランプアップ区間の到着数
+    k = 0
+    while True:
+        if ramp_up > 0 and k < ramp_requests:
+            t = math.sqrt(2 * ramp_up * k / rps)
+        else:
+            t = ramp_up + (k - ramp_requests) / rps
+        if t >= duration:
+            return offsets
+        offsets.append(t)
+        k += 1
+
+
+async def _fire(pool, payload, scheduled, stats):
+    """1リクエストを送信し、結果をstatsへ集計する"""
+    try:
+        response = await pool.request("POST", "/api/chat", body=payload,
+                                      headers={"Content-Type": "application/json"})
+        key = str(response.status)
+        if not response.ok:
+            stats["errors"] += 1
+        # route.ts の Server-Timing（翻訳・検索・生成などの段階ごとの処理時間）
+        for stage, duration in response.server_timing.items():
+            stats["stages"].setdefault(stage, LatencyHistogram()).record(duration)
+    except Exception as e:
+        key = type(e).__name__
+        stats["errors"] += 1
+    stats["latency"].record((time.perf_counter() - scheduled) * 1000)
+    stats["status_counts"][key] = stats["status_counts"].get(key, 0) + 1
+
+
+async def run_load_test(base_url, questions, rps, duration, ramp_up=0.0,
+                        connections=50, timeout=60.0, action="rag_search"):
+    """オープンループ負荷試験を実行し、集計レポートを返す"""
+    pool = ConnectionPool(base_url, max_connections=connections, timeout=timeout)
+    payloads = [
+        json.dumps({"message": question, "action": action}, ensure_ascii=False)
+        for _, question in questions
+    ]
+    stats = {"errors": 0, "latency": LatencyHistogram(), "status_counts": {}, "stages": {}}
+    offsets = arrival_offsets(rps, duration, ramp_up)
+
+    tasks = []
+    start = time.perf_counter()
+    for index, offset in enumerate(offsets):
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(
+            _fire(pool, payloads[index % len(payloads)], scheduled, stats)
+        ))
+    await asyncio.gather(*tasks)
+    wall_time = time.perf_counter() - start
+    await pool.close()
+
+    latency = stats["latency"]
+    completed = latency.count
+    return {
+        "target_rps": rps,
+        "duration_s": duration,
+        "ramp_up_s": ramp_up,
+        "requests": len(offsets),
+        "completed": completed,
+        "errors": stats["errors"],
+        "error_rate": stats["errors"] / completed if completed else 0.0,
+        "throughput_rps": (completed - stats["errors"]) / wall_time if wall_time > 0 else 0.0,
+        "status_counts": stats["status_counts"],
+        "connections_opened": pool.connections_opened,
+        "latency_ms": latency.summary(),
+        "stages_ms": {stage: histogram.summary() for stage, histogram in stats["stages"].items()},
+    }
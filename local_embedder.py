@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+決定的なローカルembedding（Google Embeddings embedding-001 の代替）
+文字n-gram（日本語向け）と英数字の単語をfeature hashingで768次元に射影し、L2正規化して返す。
+APIキーやネットワークなしで、チャンク分割・検索まわりのベンチマークを再現可能に実行するために使う。
+語彙が重なるテキスト同士の類似度が高くなるため、意味的な近さではなく表層的な近さを測ることに注意。
+
+使い方:
+  from local_embedder import LocalEmbedder
+  embedder = LocalEmbedder()
+  vectors = embedder.embed_documents(["装備の強化方法", "ガチャの確率"])
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+NGRAM_SIZES = (1, 2, 3)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class LocalEmbedder:
+    """LangChainのEmbeddingsと同じ embed_query / embed_documents を持つハッシュ埋め込み
+
+    calls は embed_query / embed_documents の呼び出し回数（API呼び出し数の見積もり）、
+    texts と chars は埋め込んだテキスト数と文字数（課金量の見積もり）。
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, ngram_sizes=NGRAM_SIZES):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.calls = 0
+        self.texts = 0
+        self.chars = 0
+
+    def _features(self, text):
+        text = text.lower()
+        compact = re.sub(r"\s+", "", text)
+        for n in self.ngram_sizes:
+            for i in range(len(compact) - n + 1):
+                yield compact[i:i + n]
+        for word in WORD_PATTERN.findall(text):
+            yield "w:" + word
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # 上位ビットで符号を決め、衝突による偏りを打ち消す
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts += 1
+        self.chars += len(text)
+        return self._embed(text)
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        self.chars += sum(len(text) for text in texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._embed(text) for text in texts])
+
+
+def embed(text, dim=EMBEDDING_DIM):
+    """1件だけ埋め込む（呼び出し回数を数えない）"""
+    return LocalEmbedder(dim)._embed(text)
@@ -5,11 +5,16 @@ Vercel認証問題を解決するための手動操作ガイド
 
 import sys
 import os
-sys.path.append('/Users/gotohiro/Library/Python/3.9/lib/python/site-packages')
 
 from playwright.sync_api import sync_playwright
 import time
 
+from quality_verification import BASE_URL
+
+# 確認対象のURL（環境変数で上書き可能。ローカルのスタブや別デプロイを確認する場合に使う）
+TARGET_URL = os.environ.get("SKB_BASE_URL", BASE_URL)
+VERIFICATION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quality_verification.py")
+
 def open_vercel_dashboard_for_manual_fix():
     """Vercelダッシュボードを開いて手動設定変更をガイドする"""
 
@@ -58,7 +63,7 @@ def test_access_after_fix():
     """修正後のアクセステスト"""
     import requests
 
-    test_url = "https://smartknowledgebot-frontend-cyqgu1xrd-hirohgxxs-projects.vercel.app"
+    test_url = TARGET_URL
 
     try:
         print(f"アクセステスト: {test_url}")
@@ -87,7 +92,7 @@ def comprehensive_verification_after_fix():
 
     try:
         result = subprocess.run(
-            ["python3", "/Users/gotohiro/Documents/user/Products/SmartKnowledgeBot/quality_verification.py"],
+            [sys.executable, VERIFICATION_SCRIPT, "--base-url", TARGET_URL],
             capture_output=True,
             text=True,
             timeout=300  # 5分でタイムアウト
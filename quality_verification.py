@@ -4,15 +4,26 @@ SmartKnowledgeBot本番サービス品質検証スクリプト
 URL: https://smartknowledgebot-frontend-emjn0hmib-hirohgxxs-projects.vercel.app
 """
 
-import sys
 import os
-sys.path.append('/Users/gotohiro/Library/Python/3.9/lib/python/site-packages')
 
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 import time
 import json
+import re
+import queue
+import argparse
+import asyncio
+import threading
 import traceback
+from contextlib import closing
 from datetime import datetime
+from urllib.parse import urlparse
+
+import results_history
+from async_http import parse_server_timing
+from http_probe import HttpProber, load_targets, print_probe_results
+from latency_histogram import LatencyHistogram
+from load_generator import run_load_test
 
 # 検証結果を格納する辞書
 verification_results = {
@@ -25,8 +36,40 @@ verification_results = {
     "summary": {}
 }
 
-def log_result(category, test_name, status, details, priority="medium"):
-    """検証結果をログに記録"""
+# 並列検証時に複数スレッドから記録されるためのロック
+results_lock = threading.Lock()
+
+RESULTS_FILE = "verification_results.json"
+
+BASE_URL = "https://smartknowledgebot-frontend-cyqgu1xrd-hirohgxxs-projects.vercel.app"
+
+CONTEXT_OPTIONS = {
+    "viewport": {'width': 1920, 'height': 1080},
+    "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# 質問送信機能テストで使う質問バンク（テスト名, 質問）
+TEST_QUESTIONS = [
+    ("基本質問", "装備の強化方法を教えてください"),
+    ("短い質問", "こんにちは")
+]
+
+def reset_results():
+    """検証結果をクリアする（複数ターゲットを順に検証するとき、ターゲットごとに集計するため）"""
+    with results_lock:
+        for category in verification_results:
+            if category == "summary":
+                verification_results[category] = {}
+            else:
+                verification_results[category].clear()
+
+def results_file_for(target):
+    """ターゲットごとの結果ファイル名（verification_results_<ホスト名>.json）"""
+    host = urlparse(target).netloc or target
+    return f"verification_results_{re.sub(r'[^A-Za-z0-9.-]', '_', host)}.json"
+
+def log_result(category, test_name, status, details, priority="medium", metrics=None):
+    """検証結果をログに記録（metricsには数値の計測値を辞書で渡す）"""
     result = {
         "test_name": test_name,
         "status": status,  # "pass", "fail", "warning"
@@ -34,28 +77,724 @@ def log_result(category, test_name, status, details, priority="medium"):
         "priority": priority,  # "critical", "high", "medium", "low"
         "timestamp": datetime.now().isoformat()
     }
-    verification_results[category].append(result)
-    print(f"[{status.upper()}] {test_name}: {details}")
+    if metrics is not None:
+        result["metrics"] = metrics
+    with results_lock:
+        verification_results[category].append(result)
+        print(f"[{status.upper()}] {test_name}: {details}")
+
+# 回答検出用セレクター（ブラウザ内のMutationObserverで評価する。先頭ほど優先）
+RESPONSE_SELECTORS = [
+    '[data-testid="response"]',  # skb-frontend/src/app/page.tsx の回答表示
+    'p.whitespace-pre-wrap',  # data-testid を付ける前のデプロイの回答表示
+    '.response',
+    '.answer',
+]
+
+ERROR_SELECTORS = [
+    '[data-testid="error"]',
+    'p.text-red-800',  # data-testid を付ける前のデプロイのエラー表示
+    '.error',
+    '.alert-error',
+    '.text-red-500',
+    '.text-red-600'
+]
+
+LOADING_SELECTORS = [
+    '[data-testid="loading"]',
+    '.loading',
+    '.spinner',
+    '[aria-label*="loading"]',
+    '[aria-label*="Loading"]',
+    '.animate-spin'
+]
+
+ANSWER_TIMEOUT_MS = 45000
+MIN_ANSWER_LENGTH = 20  # 20文字以上の応答を回答とみなす
+ANSWER_STABLE_MS = 1500  # この時間テキストが変化しなければ回答完了とみなす
+RENDER_TIMEOUT_MS = 5000  # /api/chat が回答を返してから、DOMに表示されるのを待つ上限
+SERVER_TIMING_PREFIX = "server_"  # Server-Timing の段階別処理時間を入れるmetricsの接頭辞
+
+# 送信前にページへ注入する回答検出器
+# DOM変更をMutationObserverで監視し、回答・エラー・ローディングの出現時刻を
+# performance.now()（ミリ秒精度）で記録する。送信前から存在するテキストは回答として扱わない。
+# 回答テキストは最初の表示（firstTokenAt）と最後の変化（lastChangeAt）も記録し、
+# ストリーミング表示の体感レイテンシと生成完了までの時間を区別できるようにする。
+ANSWER_DETECTOR_JS = """
+({responseSelectors, errorSelectors, loadingSelectors, minLength}) => {
+    if (window.__skbDetector) {
+        window.__skbDetector.observer.disconnect();
+    }
+    const baseline = new WeakMap();
+    for (const selector of responseSelectors) {
+        for (const el of document.querySelectorAll(selector)) {
+            baseline.set(el, (el.innerText || '').trim());
+        }
+    }
+    const state = {
+        submittedAt: null,
+        submittedEpoch: null,
+        loadingAt: null,
+        firstTokenAt: null,
+        answerAt: null,
+        answerText: null,
+        lastChangeAt: null,
+        errorAt: null,
+        errorText: null,
+    };
+    const check = () => {
+        if (state.submittedAt === null) return;
+        const now = performance.now();
+        if (state.loadingAt === null &&
+            loadingSelectors.some((s) => document.querySelector(s))) {
+            state.loadingAt = now;
+        }
+        if (state.errorAt === null) {
+            for (const selector of errorSelectors) {
+                const el = document.querySelector(selector);
+                const text = el ? (el.innerText || '').trim() : '';
+                if (text.length > 0) {
+                    state.errorAt = now;
+                    state.errorText = text;
+                    break;
+                }
+            }
+        }
+        // 送信前から変化した最初の候補要素を回答表示とみなす
+        let current = null;
+        for (const selector of responseSelectors) {
+            for (const el of document.querySelectorAll(selector)) {
+                const text = (el.innerText || '').trim();
+                if (text.length > 0 && baseline.get(el) !== text) {
+                    current = text;
+                    break;
+                }
+            }
+            if (current !== null) break;
+        }
+        if (current === null) return;
+        if (state.firstTokenAt === null) state.firstTokenAt = now;
+        if (state.answerAt === null && current.length > minLength) state.answerAt = now;
+        if (state.answerAt !== null && current !== state.answerText) {
+            state.answerText = current;
+            state.lastChangeAt = now;
+        }
+    };
+    const observer = new MutationObserver(check);
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+    window.__skbDetector = {observer, state, check};
+}
+"""
+
+
+def is_chat_response(response):
+    """/api/chat へのPOSTレスポンスか判定"""
+    return "/api/chat" in response.url and response.request.method == "POST"
+
+
+def find_submit_button(page):
+    """質問の送信ボタン（本番ページでは履歴ボタンが先にあるため、type="submit" を優先する）"""
+    submit = page.locator('button[type="submit"]')
+    return submit.first if submit.count() > 0 else page.locator("button").first
+
+
+def chat_answer_text(response):
+    """/api/chat の2xx応答から回答本文を取り出す（success でなければ None）"""
+    if not 200 <= response.status < 300:
+        return None
+    try:
+        body = response.json()
+    except Exception:
+        return None
+    if not isinstance(body, dict) or not body.get("success"):
+        return None
+    answer = body.get("aiResponse")
+    return answer.strip() if isinstance(answer, str) and answer.strip() else None
+
+
+def split_request_timing(timing):
+    """Playwrightのrequest.timing（startTime基準のms、未計測は-1）を区間に分割する"""
+    def span(start, end):
+        if start < 0 or end < 0:
+            return None
+        return round(end - start, 1)
+
+    request_start = timing.get("requestStart", -1)
+    return {
+        "total_ms": round(timing["responseEnd"], 1) if timing.get("responseEnd", -1) >= 0 else None,
+        "dns_ms": span(timing.get("domainLookupStart", -1), timing.get("domainLookupEnd", -1)),
+        "connect_ms": span(timing.get("connectStart", -1), timing.get("connectEnd", -1)),
+        "ssl_ms": span(timing.get("secureConnectionStart", -1), timing.get("connectEnd", -1)),
+        "request_ms": round(request_start, 1) if request_start >= 0 else None,
+        "ttfb_ms": span(request_start, timing.get("responseStart", -1)),
+        "receive_ms": span(timing.get("responseStart", -1), timing.get("responseEnd", -1)),
+    }
+
+
+def wait_for_rag_answer(page, submit_button, timeout_ms=ANSWER_TIMEOUT_MS, stable_ms=ANSWER_STABLE_MS):
+    """質問を送信し、回答がDOMに現れて表示が落ち着くまでイベント駆動で待機する
+
+    固定sleepによるポーリングの代わりに、ページ内のMutationObserverと
+    /api/chat のネットワークレスポンスを待ち受ける。/api/chat が2xxで回答を返したら、
+    DOMへの表示は RENDER_TIMEOUT_MS だけ待ち、表示されなくても回答ありとする（answer_source="api"）。
+    戻り値は送信時刻を基準にしたタイムライン（ミリ秒）と検出結果を含む辞書:
+      first_byte_ms   /api/chat の最初のバイト受信
+      first_token_ms  回答テキストが最初に表示された時点（体感レイテンシ）
+      response_time_ms 回答が MIN_ANSWER_LENGTH 文字を超えて表示された時点（表示されなければ /api/chat の受信完了）
+      final_text_ms   最後にテキストが変化した時点（stable_ms 変化なしで確定）
+    answer_text は表示された回答テキスト（表示されなければ /api/chat の aiResponse）。
+    server_timing は /api/chat の Server-Timing ヘッダーから得たサーバー側の段階別処理時間。
+    """
+    page.evaluate(ANSWER_DETECTOR_JS, {
+        "responseSelectors": RESPONSE_SELECTORS,
+        "errorSelectors": ERROR_SELECTORS,
+        "loadingSelectors": LOADING_SELECTORS,
+        "minLength": MIN_ANSWER_LENGTH,
+    })
 
-def run_comprehensive_verification():
-    """包括的品質検証の実行"""
+    result = {
+        "answered": False,
+        "answer_source": None,
+        "answer_text": None,
+        "rendered": False,
+        "response_time_ms": None,
+        "api_status": None,
+        "api_time_ms": None,
+        "api_request_ms": None,
+        "api_ttfb_ms": None,
+        "api_receive_ms": None,
+        "first_byte_ms": None,
+        "first_token_ms": None,
+        "final_text_ms": None,
+        "final_stable": False,
+        "loading_seen": False,
+        "answer_length": 0,
+        "error_text": None,
+        "server_timing": {},
+    }
+
+    deadline = time.perf_counter() + timeout_ms / 1000
+    api_response = None
+    api_answer = None
+    api_received_ms = None
+    try:
+        with page.expect_response(is_chat_response, timeout=timeout_ms) as response_info:
+            page.evaluate("() => { const s = window.__skbDetector.state; "
+                          "s.submittedAt = performance.now(); s.submittedEpoch = performance.timeOrigin + s.submittedAt; }")
+            clicked = time.perf_counter()
+            submit_button.click()
+        api_response = response_info.value
+        result["api_status"] = api_response.status
+        result["server_timing"] = parse_server_timing(api_response.all_headers().get("server-timing"))
+        api_answer = chat_answer_text(api_response)
+        api_received_ms = round((time.perf_counter() - clicked) * 1000, 1)
+    except PlaywrightTimeoutError:
+        # APIが応答しない場合でも、DOM側の状態を確認するため続行
+        pass
+
+    # timeout=0 はPlaywrightでは無制限待機になるため最低1msを確保
+    remaining_ms = max(1, (deadline - time.perf_counter()) * 1000)
+    if api_answer is not None:
+        # 回答は受信済み。表示されるまで（表示されたら落ち着くまで）だけ待つ
+        remaining_ms = min(remaining_ms, RENDER_TIMEOUT_MS + stable_ms)
+    try:
+        page.wait_for_function(
+            "(stableMs) => { const d = window.__skbDetector; d.check(); const s = d.state; "
+            "if (s.answerAt !== null) return performance.now() - s.lastChangeAt >= stableMs; "
+            "return s.errorAt !== null; }",
+            arg=stable_ms,
+            timeout=remaining_ms,
+        )
+    except PlaywrightTimeoutError:
+        pass
+
+    state = page.evaluate("() => window.__skbDetector.state")
+    page.evaluate("() => window.__skbDetector.observer.disconnect()")
+
+    # /api/chat の内訳: 送信前（接続待ち等）・TTFB・本文転送
+    if api_response is not None:
+        api_response.finished()
+        timing = split_request_timing(api_response.request.timing)
+        result["api_time_ms"] = timing["total_ms"]
+        result["api_request_ms"] = timing["request_ms"]
+        result["api_ttfb_ms"] = timing["ttfb_ms"]
+        result["api_receive_ms"] = timing["receive_ms"]
+        raw_timing = api_response.request.timing
+        if raw_timing.get("responseStart", -1) >= 0 and state["submittedEpoch"] is not None:
+            first_byte_epoch = raw_timing["startTime"] + raw_timing["responseStart"]
+            result["first_byte_ms"] = round(first_byte_epoch - state["submittedEpoch"], 1)
+        if raw_timing.get("responseEnd", -1) >= 0 and state["submittedEpoch"] is not None:
+            api_received_ms = round(raw_timing["startTime"] + raw_timing["responseEnd"] - state["submittedEpoch"], 1)
+
+    result["loading_seen"] = state["loadingAt"] is not None
+    result["error_text"] = state["errorText"]
+    submitted = state["submittedAt"]
+    if state["firstTokenAt"] is not None:
+        result["first_token_ms"] = round(state["firstTokenAt"] - submitted, 1)
+    if state["answerAt"] is not None:
+        result["answered"] = True
+        result["answer_source"] = "dom"
+        result["rendered"] = True
+        result["answer_text"] = state["answerText"]
+        result["response_time_ms"] = round(state["answerAt"] - submitted, 1)
+        result["final_text_ms"] = round(state["lastChangeAt"] - submitted, 1)
+        result["final_stable"] = (state["lastChangeAt"] + stable_ms) <= page.evaluate("() => performance.now()")
+        result["answer_length"] = len(state["answerText"])
+    elif api_answer is not None:
+        # APIは回答を返したが、回答表示のセレクターに一致する要素が変化しなかった
+        result["answered"] = True
+        result["answer_source"] = "api"
+        result["answer_text"] = api_answer
+        result["response_time_ms"] = api_received_ms
+        result["answer_length"] = len(api_answer)
+    return result
+
+
+# Web Vitals計測用の初期化スクリプト（ページ読み込み前に注入）
+# LCP・CLS・Long Task・インタラクション（INP近似）をPerformanceObserverで蓄積する
+WEB_VITALS_INIT_JS = """
+(() => {
+    const vitals = {lcp: null, cls: 0, longTasks: [], inp: null};
+    window.__skbVitals = vitals;
+    const observe = (type, callback, options = {}) => {
+        try {
+            new PerformanceObserver((list) => list.getEntries().forEach(callback))
+                .observe({type, buffered: true, ...options});
+        } catch (e) {
+            // 未対応のエントリタイプは無視
+        }
+    };
+    observe('largest-contentful-paint', (entry) => { vitals.lcp = entry.startTime; });
+    observe('layout-shift', (entry) => {
+        if (!entry.hadRecentInput) vitals.cls += entry.value;
+    });
+    observe('longtask', (entry) => {
+        vitals.longTasks.push({start: entry.startTime, duration: entry.duration});
+    });
+    observe('event', (entry) => {
+        if (entry.interactionId && (vitals.inp === null || entry.duration > vitals.inp)) {
+            vitals.inp = entry.duration;
+        }
+    }, {durationThreshold: 16});
+})();
+"""
+
+# Navigation Timing・Paint Timing・Resource Timingと蓄積済みWeb Vitalsを取得する
+COLLECT_WEB_VITALS_JS = """
+() => {
+    const nav = performance.getEntriesByType('navigation')[0];
+    const fcpEntry = performance.getEntriesByName('first-contentful-paint')[0];
+    const fcp = fcpEntry ? fcpEntry.startTime : null;
+    const vitals = window.__skbVitals || {lcp: null, cls: 0, longTasks: [], inp: null};
+    // TBT近似: FCP以降のLong Taskのうち50msを超えた分の合計
+    const tbt = vitals.longTasks
+        .filter((t) => fcp === null || t.start >= fcp)
+        .reduce((sum, t) => sum + Math.max(0, t.duration - 50), 0);
+    const resources = performance.getEntriesByType('resource').map((r) => ({
+        name: r.name,
+        type: r.initiatorType,
+        transferSize: r.transferSize,
+        decodedSize: r.decodedBodySize,
+        duration: r.duration,
+        ttfb: r.responseStart > 0 ? r.responseStart - r.requestStart : null,
+    }));
+    return {
+        navigation: nav ? {
+            dns: nav.domainLookupEnd - nav.domainLookupStart,
+            connect: nav.connectEnd - nav.connectStart,
+            ttfb: nav.responseStart - nav.requestStart,
+            response: nav.responseEnd - nav.responseStart,
+            domContentLoaded: nav.domContentLoadedEventEnd,
+            load: nav.loadEventEnd,
+            transferSize: nav.transferSize,
+        } : null,
+        fcp,
+        lcp: vitals.lcp,
+        cls: vitals.cls,
+        tbt,
+        inp: vitals.inp,
+        resources,
+    };
+}
+"""
+
+# Web Vitalsの判定閾値（good, needs improvement の上限）
+WEB_VITAL_THRESHOLDS = {
+    "LCP": ("lcp_ms", 2500, 4000),
+    "CLS": ("cls", 0.1, 0.25),
+    "TBT": ("tbt_ms", 200, 600),
+    "INP": ("inp_ms", 200, 500),
+}
+
+
+def _round_ms(value):
+    return round(value, 1) if value is not None else None
+
+
+def collect_frontend_metrics(page):
+    """ブラウザのPerformance APIとCDPからフロントエンドの計測値を取得し、performanceカテゴリに記録する
+
+    Next.jsバンドル・APIルート・その他リソースのどこに時間がかかっているか切り分けられるよう、
+    Web Vitals、ナビゲーションタイミング、JSバンドルサイズ、リソース種別ごとの内訳を構造化して残す。
+    """
+    data = page.evaluate(COLLECT_WEB_VITALS_JS)
+
+    # ナビゲーションタイミング
+    nav = data["navigation"]
+    if nav:
+        nav_metrics = {
+            "dns_ms": _round_ms(nav["dns"]),
+            "connect_ms": _round_ms(nav["connect"]),
+            "ttfb_ms": _round_ms(nav["ttfb"]),
+            "response_ms": _round_ms(nav["response"]),
+            "dom_content_loaded_ms": _round_ms(nav["domContentLoaded"]),
+            "load_event_ms": _round_ms(nav["load"]),
+            "document_transfer_bytes": nav["transferSize"],
+        }
+        log_result("performance", "ナビゲーションタイミング", "pass",
+                 f"TTFB {nav['ttfb']:.0f}ms, DOMContentLoaded {nav['domContentLoaded']:.0f}ms, "
+                 f"load {nav['load']:.0f}ms", metrics=nav_metrics)
+
+    # Web Vitals
+    vital_values = {
+        "lcp_ms": _round_ms(data["lcp"]),
+        "cls": round(data["cls"], 4),
+        "tbt_ms": _round_ms(data["tbt"]),
+        "inp_ms": _round_ms(data["inp"]),
+        "fcp_ms": _round_ms(data["fcp"]),
+    }
+    for vital, (key, good, poor) in WEB_VITAL_THRESHOLDS.items():
+        value = vital_values[key]
+        if value is None:
+            log_result("performance", f"Web Vitals_{vital}", "warning",
+                     f"{vital}を計測できない", "low")
+            continue
+        unit = "" if key == "cls" else "ms"
+        metrics = {key: value}
+        if value <= good:
+            log_result("performance", f"Web Vitals_{vital}", "pass", f"{vital}: {value}{unit}", metrics=metrics)
+        elif value <= poor:
+            log_result("performance", f"Web Vitals_{vital}", "warning",
+                     f"{vital}が改善推奨範囲: {value}{unit}", "low", metrics=metrics)
+        else:
+            log_result("performance", f"Web Vitals_{vital}", "fail",
+                     f"{vital}が不良: {value}{unit}", "medium", metrics=metrics)
+
+    # リソース種別ごとの内訳とJSバンドルサイズ
+    resources = data["resources"]
+    breakdown = {}
+    for resource in resources:
+        entry = breakdown.setdefault(resource["type"], {"count": 0, "transfer_bytes": 0, "max_duration_ms": 0})
+        entry["count"] += 1
+        entry["transfer_bytes"] += resource["transferSize"]
+        entry["max_duration_ms"] = max(entry["max_duration_ms"], _round_ms(resource["duration"]))
+
+    scripts = [r for r in resources if r["type"] == "script" or r["name"].split("?")[0].endswith(".js")]
+    js_transfer = sum(r["transferSize"] for r in scripts)
+    js_decoded = sum(r["decodedSize"] for r in scripts)
+    largest = sorted(scripts, key=lambda r: r["decodedSize"], reverse=True)[:5]
+    log_result("performance", "JSバンドルサイズ", "pass",
+             f"{len(scripts)}ファイル, 転送 {js_transfer / 1024:.0f}KB / 展開後 {js_decoded / 1024:.0f}KB",
+             metrics={
+                 "js_files": len(scripts),
+                 "js_transfer_bytes": js_transfer,
+                 "js_decoded_bytes": js_decoded,
+                 "largest_bundles": [
+                     {"name": r["name"].rsplit("/", 1)[-1], "decoded_bytes": r["decodedSize"]} for r in largest
+                 ],
+             })
+
+    api_calls = [r for r in resources if "/api/chat" in r["name"]]
+    resource_metrics = {"resource_count": len(resources), "by_type": breakdown}
+    if api_calls:
+        resource_metrics["api_chat_duration_ms"] = _round_ms(max(r["duration"] for r in api_calls))
+        ttfbs = [r["ttfb"] for r in api_calls if r["ttfb"] is not None]
+        if ttfbs:
+            resource_metrics["api_chat_ttfb_ms"] = _round_ms(max(ttfbs))
+    type_counts = ", ".join(f"{t}:{v['count']}" for t, v in breakdown.items())
+    log_result("performance", "リソースタイミング", "pass",
+             f"{len(resources)}リソース ({type_counts})", metrics=resource_metrics)
+
+    # CDP（Chromiumのみ）によるランタイム計測
+    try:
+        cdp = page.context.new_cdp_session(page)
+        cdp.send("Performance.enable")
+        cdp_metrics = {m["name"]: m["value"] for m in cdp.send("Performance.getMetrics")["metrics"]}
+        cdp.detach()
+        runtime_metrics = {
+            "script_duration_ms": _round_ms(cdp_metrics.get("ScriptDuration", 0) * 1000),
+            "layout_duration_ms": _round_ms(cdp_metrics.get("LayoutDuration", 0) * 1000),
+            "recalc_style_duration_ms": _round_ms(cdp_metrics.get("RecalcStyleDuration", 0) * 1000),
+            "task_duration_ms": _round_ms(cdp_metrics.get("TaskDuration", 0) * 1000),
+            "js_heap_used_bytes": cdp_metrics.get("JSHeapUsedSize"),
+            "dom_nodes": cdp_metrics.get("Nodes"),
+        }
+        log_result("performance", "ランタイム計測(CDP)", "pass",
+                 f"スクリプト {runtime_metrics['script_duration_ms']:.0f}ms, "
+                 f"レイアウト {runtime_metrics['layout_duration_ms']:.0f}ms, "
+                 f"JSヒープ {(runtime_metrics['js_heap_used_bytes'] or 0) / 1048576:.1f}MB",
+                 metrics=runtime_metrics)
+    except Exception as e:
+        log_result("performance", "ランタイム計測(CDP)", "warning",
+                 f"CDPメトリクス取得失敗: {str(e)}", "low")
+
+
+class NetworkTraceRecorder:
+    """1問分のネットワークアクティビティを記録し、HAR 1.2形式で保存する
+
+    記録対象は記録開始後に完了したリクエストと /api/chat 呼び出し。
+    /api/chat については本文も保存し、trace_replay.py でオフライン再生できるようにする。
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.finished = []
+        self.chat_requests = []
+        self._on_finished = self.finished.append
+        self._on_request = lambda request: self.chat_requests.append(request) if "/api/chat" in request.url else None
+        page.on("requestfinished", self._on_finished)
+        page.on("request", self._on_request)
+
+    def stop(self):
+        self.page.remove_listener("requestfinished", self._on_finished)
+        self.page.remove_listener("request", self._on_request)
+
+    def save(self, path):
+        """記録を終了し、HARファイルとして保存する"""
+        self.stop()
+        requests = list(self.finished)
+        for request in self.chat_requests:
+            if request not in requests:
+                requests.append(request)
+
+        entries = [_har_entry(request) for request in requests]
+        har = {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "skb-quality-verification", "version": "1.0"},
+                "entries": [entry for entry in entries if entry is not None],
+            }
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(har, f, ensure_ascii=False, indent=2)
+
+
+def _har_entry(request):
+    """PlaywrightのRequestをHARエントリに変換する"""
+    response = request.response()
+    if response is None:
+        return None
+    is_chat = "/api/chat" in request.url
+    if is_chat:
+        response.finished()
+
+    timing = request.timing
+    split = split_request_timing(timing)
+    first_start = next((timing[k] for k in ("domainLookupStart", "connectStart", "requestStart")
+                        if timing.get(k, -1) >= 0), 0)
+
+    entry = {
+        "startedDateTime": datetime.fromtimestamp(timing["startTime"] / 1000).isoformat(),
+        "time": split["total_ms"] or 0,
+        "request": {
+            "method": request.method,
+            "url": request.url,
+            "httpVersion": "HTTP/1.1",
+            "headers": [{"name": k, "value": v} for k, v in request.headers.items()],
+            "queryString": [],
+            "cookies": [],
+            "headersSize": -1,
+            "bodySize": len(request.post_data or ""),
+        },
+        "response": {
+            "status": response.status,
+            "statusText": response.status_text,
+            "httpVersion": "HTTP/1.1",
+            "headers": [{"name": k, "value": v} for k, v in response.headers.items()],
+            "cookies": [],
+            "content": {"size": -1, "mimeType": response.headers.get("content-type", "")},
+            "redirectURL": "",
+            "headersSize": -1,
+            "bodySize": -1,
+        },
+        "cache": {},
+        "timings": {
+            "blocked": round(first_start, 1),
+            "dns": split["dns_ms"] if split["dns_ms"] is not None else -1,
+            "connect": split["connect_ms"] if split["connect_ms"] is not None else -1,
+            "ssl": split["ssl_ms"] if split["ssl_ms"] is not None else -1,
+            "send": 0,
+            "wait": split["ttfb_ms"] if split["ttfb_ms"] is not None else -1,
+            "receive": split["receive_ms"] if split["receive_ms"] is not None else -1,
+        },
+    }
+    if is_chat:
+        if request.post_data:
+            entry["request"]["postData"] = {"mimeType": "application/json", "text": request.post_data}
+        try:
+            body = response.text()
+            entry["response"]["content"].update({"size": len(body.encode("utf-8")), "text": body})
+        except Exception:
+            pass
+    return entry
+
+
+def verify_question(page, test_name, question, trace_dir=None):
+    """1件の質問を送信し、回答取得・ローディング表示・エラー表示を記録する
+
+    trace_dir を指定すると、この質問のネットワークトレースをHARとして保存する。
+    """
+    print(f"テスト実行: {test_name} - '{question}'")
+
+    # フォーム要素を再取得
+    text_input = page.locator('input[type="text"], textarea').first
+    submit_button = find_submit_button(page)
+
+    if text_input.count() == 0 or submit_button.count() == 0:
+        log_result("basic_functionality", f"フォーム要素_{test_name}", "fail",
+                 f"フォーム要素が見つからない", "critical")
+        return
+
+    # 既存の入力をクリア
+    text_input.clear()
+    text_input.fill(question)
+
+    recorder = NetworkTraceRecorder(page) if trace_dir else None
+
+    print(f"送信ボタンクリック - 回答待機中...")
+    answer = wait_for_rag_answer(page, submit_button)
+
+    trace_file = None
+    if recorder:
+        trace_file = os.path.join(trace_dir, f"{test_name}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.har")
+        try:
+            recorder.save(trace_file)
+            print(f"🧾 ネットワークトレース保存: {trace_file}")
+        except Exception as e:
+            print(f"⚠️ トレース保存エラー: {str(e)}")
+            trace_file = None
+
+    if answer["loading_seen"]:
+        log_result("ui_ux", f"ローディング表示_{test_name}", "pass",
+                 f"ローディング状態が表示される")
+    else:
+        log_result("ui_ux", f"ローディング表示_{test_name}", "warning",
+                 f"ローディング表示が確認できない", "low")
+
+    if answer["error_text"]:
+        log_result("error_cases", f"API エラー_{test_name}", "warning",
+                 f"エラー表示: {answer['error_text']}", "medium")
+        print(f"⚠️ エラー検出: {answer['error_text']}")
+
+    if answer["answered"]:
+        response_time = answer["response_time_ms"] / 1000
+        api_note = f", API {answer['api_time_ms']:.0f}ms" if answer["api_time_ms"] is not None else ""
+        metrics = {"response_time_ms": answer["response_time_ms"], "answer_length": answer["answer_length"]}
+        for key in ("api_time_ms", "api_request_ms", "api_ttfb_ms", "api_receive_ms",
+                    "first_byte_ms", "first_token_ms", "final_text_ms"):
+            if answer[key] is not None:
+                metrics[key] = answer[key]
+        for stage, duration in answer["server_timing"].items():
+            metrics[f"{SERVER_TIMING_PREFIX}{stage}_ms"] = duration
+        metrics["final_stable"] = answer["final_stable"]
+        metrics["rendered"] = answer["rendered"]
+        if trace_file:
+            metrics["trace_file"] = trace_file
+        log_result("basic_functionality", f"RAG回答_{test_name}", "pass",
+                 f"回答取得成功 ({response_time:.3f}秒, {answer['answer_length']}文字{api_note})",
+                 metrics=metrics)
+        if answer["rendered"]:
+            print(f"✅ 回答取得成功: {answer['answer_length']}文字 "
+                  f"(初回表示 {answer['first_token_ms']:.0f}ms / 表示完了 {answer['final_text_ms']:.0f}ms)")
+        else:
+            log_result("ui_ux", f"回答表示_{test_name}", "warning",
+                     f"/api/chat は回答を返したが、{RENDER_TIMEOUT_MS // 1000}秒以内に画面に表示されない", "medium")
+            print(f"✅ 回答取得成功（API）: {answer['answer_length']}文字 / ⚠️ 画面への表示は検出できず")
+        if answer["server_timing"]:
+            print("   サーバー内訳: " + ", ".join(f"{stage} {duration:.0f}ms"
+                                            for stage, duration in answer["server_timing"].items()))
+    elif answer["error_text"]:
+        log_result("basic_functionality", f"RAG回答_{test_name}", "fail",
+                 f"エラー表示のため回答なし", "high")
+        print(f"❌ エラー終了: 回答なし")
+    else:
+        timeout_seconds = ANSWER_TIMEOUT_MS // 1000
+        log_result("basic_functionality", f"RAG回答_{test_name}", "fail",
+                 f"{timeout_seconds}秒以内に回答が得られない", "high")
+        print(f"❌ タイムアウト: {timeout_seconds}秒以内に回答なし")
+
+def _question_worker(base_url, jobs, headless, trace_dir=None):
+    """ワーカースレッド: 専用ブラウザを起動し、質問ごとに独立したコンテキストで検証する
+
+    Playwright同期APIはスレッドをまたいで共有できないため、ワーカーごとに
+    sync_playwright() とブラウザを持つ。
+    """
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            while True:
+                try:
+                    test_name, question = jobs.get_nowait()
+                except queue.Empty:
+                    return
+
+                context = browser.new_context(**CONTEXT_OPTIONS)
+                try:
+                    page = context.new_page()
+                    page.goto(base_url, wait_until="networkidle", timeout=30000)
+                    verify_question(page, test_name, question, trace_dir)
+                except Exception as e:
+                    log_result("basic_functionality", f"質問送信_{test_name}", "fail",
+                             f"送信処理失敗: {str(e)}", "high")
+                    print(f"❌ 送信エラー: {str(e)}")
+                finally:
+                    context.close()
+        finally:
+            browser.close()
+
+
+def run_parallel_question_verification(base_url, questions, workers, headless=True, trace_dir=None):
+    """質問バンクを複数のブラウザコンテキストへ分散して並列検証する
+
+    全体の所要時間は質問数の合計ではなく、最も遅い質問に比例する。
+    """
+    jobs = queue.Queue()
+    for test_name, question in questions:
+        jobs.put((test_name, question))
+
+    worker_count = max(1, min(workers, len(questions)))
+    print(f"🧵 並列検証: {len(questions)}問を{worker_count}ワーカーで実行")
+
+    threads = [
+        threading.Thread(target=_question_worker, args=(base_url, jobs, headless, trace_dir), daemon=True)
+        for _ in range(worker_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_comprehensive_verification(base_url=BASE_URL, workers=1, headless=False, trace_dir=None):
+    """包括的品質検証の実行
+
+    workers が2以上の場合、質問送信機能テストを並列モードで実行する。
+    trace_dir を指定すると、質問ごとのネットワークトレース（HAR）を保存する。
+    """
     print("🚀 SmartKnowledgeBot本番サービス品質検証開始")
     print("=" * 60)
 
     try:
         with sync_playwright() as p:
             # ブラウザ起動（Chromiumで実行）
-            base_url = "https://smartknowledgebot-frontend-cyqgu1xrd-hirohgxxs-projects.vercel.app"
-
             print(f"\n🔍 Chromiumブラウザでの検証開始")
             print("-" * 40)
 
             try:
-                browser = p.chromium.launch(headless=False)  # 視覚的確認のためheadless=False
-                context = browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                )
+                browser = p.chromium.launch(headless=headless)  # 視覚的確認のためデフォルトはheadless=False
+                context = browser.new_context(**CONTEXT_OPTIONS)
+                context.add_init_script(WEB_VITALS_INIT_JS)
                 page = context.new_page()
 
                 # パフォーマンス測定開始
@@ -72,7 +811,8 @@ def run_comprehensive_verification():
 
                     if response and response.status == 200:
                         log_result("basic_functionality", "ページロード", "pass",
-                                 f"正常ロード完了 ({load_time:.2f}秒)")
+                                 f"正常ロード完了 ({load_time:.2f}秒)",
+                                 metrics={"load_time_ms": round(load_time * 1000, 1)})
                     else:
                         status_code = response.status if response else "No Response"
                         log_result("basic_functionality", "ページロード", "fail",
@@ -161,134 +901,16 @@ def run_comprehensive_verification():
                 # 3. 質問送信機能テスト
                 print("\n💬 3. 質問送信機能テスト")
 
-                test_questions = [
-                    ("基本質問", "装備の強化方法を教えてください"),
-                    ("短い質問", "こんにちは")
-                ]
-
-                for test_name, question in test_questions:
-                    try:
-                        print(f"テスト実行: {test_name} - '{question}'")
-
-                        # フォーム要素を再取得
-                        text_input = page.locator('input[type="text"], textarea').first
-                        submit_button = page.locator('button[type="submit"], button').first
-
-                        if text_input.count() == 0 or submit_button.count() == 0:
-                            log_result("basic_functionality", f"フォーム要素_{test_name}", "fail",
-                                     f"フォーム要素が見つからない", "critical")
-                            continue
-
-                        # 既存の入力をクリア
-                        text_input.clear()
-                        text_input.fill(question)
-
-                        # 送信前の状態確認
-                        submit_start_time = time.time()
-                        submit_button.click()
-
-                        print(f"送信ボタンクリック完了 - 応答待機中...")
-
-                        # ローディング状態の確認（5秒待機）
-                        time.sleep(5)
-
-                        # ローディング表示があるかチェック
-                        loading_selectors = [
-                            '[data-testid="loading"]',
-                            '.loading',
-                            '.spinner',
-                            '[aria-label*="loading"]',
-                            '[aria-label*="Loading"]',
-                            '.animate-spin'
-                        ]
-
-                        loading_found = False
-                        for selector in loading_selectors:
-                            if page.locator(selector).count() > 0:
-                                loading_found = True
-                                break
-
-                        if loading_found:
-                            log_result("ui_ux", f"ローディング表示_{test_name}", "pass",
-                                     f"ローディング状態が表示される")
-                        else:
-                            log_result("ui_ux", f"ローディング表示_{test_name}", "warning",
-                                     f"ローディング表示が確認できない", "low")
-
-                        # 回答待機（最大45秒）
-                        response_found = False
-                        print("回答待機中...")
-
-                        for wait_second in range(45):
-                            time.sleep(1)
-                            if wait_second % 5 == 0:
-                                print(f"  待機中... {wait_second}/45秒")
-
-                            # 回答エリアを探す（複数のセレクターを試行）
-                            response_selectors = [
-                                '[data-testid="response"]',
-                                '.response',
-                                '.answer',
-                                '.result',
-                                'div[role="region"]',
-                                'main div div',  # 汎用的なdiv構造
-                                'article',
-                                'section'
-                            ]
-
-                            for selector in response_selectors:
-                                elements = page.locator(selector)
-                                for i in range(elements.count()):
-                                    try:
-                                        element_text = elements.nth(i).inner_text()
-                                        if element_text and len(element_text.strip()) > 20:  # 20文字以上の応答
-                                            response_time = time.time() - submit_start_time
-                                            log_result("basic_functionality", f"RAG回答_{test_name}", "pass",
-                                                     f"回答取得成功 ({response_time:.1f}秒, {len(element_text)}文字)")
-                                            print(f"✅ 回答取得成功: {len(element_text)}文字")
-                                            response_found = True
-                                            break
-                                    except:
-                                        continue
-                                if response_found:
-                                    break
-                            if response_found:
-                                break
-
-                            # エラーメッセージの確認
-                            error_selectors = [
-                                '[data-testid="error"]',
-                                '.error',
-                                '.alert-error',
-                                '.text-red-500',
-                                '.text-red-600'
-                            ]
-
-                            for selector in error_selectors:
-                                error_elements = page.locator(selector)
-                                if error_elements.count() > 0:
-                                    try:
-                                        error_text = error_elements.first.inner_text()
-                                        if error_text and len(error_text.strip()) > 0:
-                                            log_result("error_cases", f"API エラー_{test_name}", "warning",
-                                                     f"エラー表示: {error_text}", "medium")
-                                            print(f"⚠️ エラー検出: {error_text}")
-                                            break
-                                    except:
-                                        continue
-
-                        if not response_found:
-                            log_result("basic_functionality", f"RAG回答_{test_name}", "fail",
-                                     f"45秒以内に回答が得られない", "high")
-                            print(f"❌ タイムアウト: 45秒以内に回答なし")
-
-                        # 少し待機してから次のテストへ
-                        time.sleep(3)
-
-                    except Exception as e:
-                        log_result("basic_functionality", f"質問送信_{test_name}", "fail",
-                                 f"送信処理失敗: {str(e)}", "high")
-                        print(f"❌ 送信エラー: {str(e)}")
+                if workers > 1:
+                    run_parallel_question_verification(base_url, TEST_QUESTIONS, workers, headless, trace_dir)
+                else:
+                    for test_name, question in TEST_QUESTIONS:
+                        try:
+                            verify_question(page, test_name, question, trace_dir)
+                        except Exception as e:
+                            log_result("basic_functionality", f"質問送信_{test_name}", "fail",
+                                     f"送信処理失敗: {str(e)}", "high")
+                            print(f"❌ 送信エラー: {str(e)}")
 
                 # 4. エラーケーステスト
                 print("\n⚠️ 4. エラーケーステスト")
@@ -296,7 +918,7 @@ def run_comprehensive_verification():
                 # 空入力テスト
                 try:
                     text_input = page.locator('input[type="text"], textarea').first
-                    submit_button = page.locator('button[type="submit"], button').first
+                    submit_button = find_submit_button(page)
 
                     if text_input.count() > 0 and submit_button.count() > 0:
                         text_input.clear()
@@ -365,22 +987,30 @@ def run_comprehensive_verification():
                 # 6. パフォーマンス測定
                 print("\n⚡ 6. パフォーマンス測定")
 
+                # 初回ロードと操作中に蓄積したWeb Vitals・リソースタイミングを先に回収する
+                try:
+                    collect_frontend_metrics(page)
+                except Exception as e:
+                    log_result("performance", "フロントエンド計測", "fail",
+                             f"Web Vitals取得失敗: {str(e)}", "low")
+
                 try:
                     # ページ再読み込みでパフォーマンス測定
-                    perf_start = time.time()
+                    perf_start = time.perf_counter()
                     page.reload(wait_until="networkidle")
-                    perf_end = time.time()
+                    perf_end = time.perf_counter()
 
                     reload_time = perf_end - perf_start
+                    reload_metrics = {"reload_time_ms": round(reload_time * 1000, 1)}
                     if reload_time < 5:
                         log_result("performance", "ページ再読み込み速度", "pass",
-                                 f"再読み込み時間: {reload_time:.2f}秒")
+                                 f"再読み込み時間: {reload_time:.2f}秒", metrics=reload_metrics)
                     elif reload_time < 10:
                         log_result("performance", "ページ再読み込み速度", "warning",
-                                 f"やや遅い再読み込み: {reload_time:.2f}秒", "low")
+                                 f"やや遅い再読み込み: {reload_time:.2f}秒", "low", metrics=reload_metrics)
                     else:
                         log_result("performance", "ページ再読み込み速度", "fail",
-                                 f"再読み込みが遅い: {reload_time:.2f}秒", "medium")
+                                 f"再読み込みが遅い: {reload_time:.2f}秒", "medium", metrics=reload_metrics)
 
                 except Exception as e:
                     log_result("performance", "パフォーマンス測定", "fail",
@@ -405,6 +1035,120 @@ def run_comprehensive_verification():
         print(f"❌ Playwright初期化エラー: {str(e)}")
         verification_results["summary"]["critical_error"] = str(e)
 
+def run_probe_tier(targets, workers=16):
+    """HTTPのみのプローブで各ターゲットを確認し、正常なターゲットのリストを返す
+
+    ブラウザ検証より桁違いに安いため、401や5xxのデプロイはここで除外する。
+    """
+    print(f"\n🔎 HTTPプローブ: {len(targets)}件")
+    prober = HttpProber(workers)
+    try:
+        results = prober.probe_all(targets)
+    finally:
+        prober.close()
+    print_probe_results(results)
+
+    healthy = []
+    for result in results:
+        metrics = {key: result.get(key) for key in
+                   ("status", "ttfb_ms", "connect_ms", "tls_handshake_ms", "cert_days_left")
+                   if result.get(key) is not None}
+        test_name = f"HTTPプローブ_{result['url']}"
+        if result["healthy"]:
+            healthy.append(result["url"])
+            log_result("basic_functionality", test_name, "pass",
+                     f"ステータス {result['status']}, TTFB {result['ttfb_ms']:.0f}ms", metrics=metrics)
+        else:
+            log_result("basic_functionality", test_name, "fail",
+                     f"ブラウザ検証をスキップ: {result['reason']}", "critical", metrics=metrics)
+    return healthy
+
+def run_load_verification(base_url, rps, duration, ramp_up=0.0, connections=50, use_stub=False, convex_seed=None):
+    """headlessの負荷試験を実行し、結果をperformanceカテゴリに記録する
+
+    use_stub の場合は /api/chat のスタブとConvex代替サーバーをローカルで起動し、
+    ネットワークに依存せず再現可能な形で実行する。
+    """
+    print("🚀 SmartKnowledgeBot 負荷試験開始")
+    print("=" * 60)
+
+    stub_servers = []
+    if use_stub:
+        from convex_stub_server import start_convex_stub
+        from stub_chat_server import start_stub_server
+        convex_server, convex_url = start_convex_stub(seed=convex_seed)
+        chat_server, base_url = start_stub_server(convex_url=convex_url)
+        stub_servers = [chat_server, convex_server]
+        print(f"🧪 ローカルスタブを使用: {base_url} (Convex代替: {convex_url})")
+
+    print(f"対象: {base_url}/api/chat  目標: {rps} RPS × {duration}秒 (ランプアップ {ramp_up}秒)")
+
+    try:
+        report = asyncio.run(run_load_test(base_url, TEST_QUESTIONS, rps, duration,
+                                           ramp_up=ramp_up, connections=connections))
+    except Exception as e:
+        log_result("performance", "負荷試験", "fail", f"負荷試験失敗: {str(e)}", "high")
+        return
+    finally:
+        for server in stub_servers:
+            server.shutdown()
+
+    latency = report["latency_ms"]
+    details = (f"{report['throughput_rps']:.1f} RPS (目標 {rps}), エラー率 {report['error_rate'] * 100:.1f}%, "
+               f"p50 {latency['p50'] or 0:.0f}ms / p95 {latency['p95'] or 0:.0f}ms / p99 {latency['p99'] or 0:.0f}ms")
+
+    if report["error_rate"] < 0.01:
+        log_result("performance", "負荷試験", "pass", details, metrics=report)
+    elif report["error_rate"] < 0.05:
+        log_result("performance", "負荷試験", "warning", details, "medium", metrics=report)
+    else:
+        log_result("performance", "負荷試験", "fail", details, "high", metrics=report)
+
+    if report["status_counts"]:
+        print(f"ステータス内訳: {report['status_counts']}")
+    if report["stages_ms"]:
+        print_stage_breakdown("⏱️ サーバー側の段階別処理時間 (ms)", report["stages_ms"])
+
+def is_timing_metric(name, value):
+    """"_ms" で終わる数値フィールドをタイミング計測値として扱う"""
+    return name.endswith("_ms") and isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def aggregate_latency():
+    """各結果のタイミング計測値をカテゴリ別・テスト別のヒストグラムに集計する"""
+    by_category = {}
+    by_test = {}
+
+    for category, results in verification_results.items():
+        if category == "summary":
+            continue
+        for result in results:
+            for name, value in result.get("metrics", {}).items():
+                if not is_timing_metric(name, value):
+                    continue
+                by_category.setdefault(category, {}).setdefault(name, LatencyHistogram()).record(value)
+                by_test.setdefault(result["test_name"], {}).setdefault(name, LatencyHistogram()).record(value)
+
+    def summarize(groups):
+        return {
+            group: {name: histogram.summary() for name, histogram in metrics.items()}
+            for group, metrics in groups.items()
+        }
+
+    return {"by_category": summarize(by_category), "by_test": summarize(by_test)}
+
+def aggregate_server_timing():
+    """質問ごとの Server-Timing を段階別のパーセンタイルに集計する（負荷試験の集計も含む）"""
+    stages = {}
+    for category, results in verification_results.items():
+        if category == "summary":
+            continue
+        for result in results:
+            for name, value in result.get("metrics", {}).items():
+                if name.startswith(SERVER_TIMING_PREFIX) and is_timing_metric(name, value):
+                    stage = name[len(SERVER_TIMING_PREFIX):-len("_ms")]
+                    stages.setdefault(stage, LatencyHistogram()).record(value)
+    return {stage: histogram.summary() for stage, histogram in stages.items()}
+
 def generate_summary():
     """検証結果サマリーの生成"""
     print("\n" + "=" * 60)
@@ -460,11 +1204,34 @@ def generate_summary():
         "failed": failed_tests,
         "warnings": warnings,
         "success_rate": f"{success_rate:.1f}%" if total_tests > 0 else "0%",
+        "latency": aggregate_latency(),
+        "server_timing": aggregate_server_timing(),
         "timestamp": datetime.now().isoformat()
     }
 
+    latency_by_category = verification_results["summary"]["latency"]["by_category"]
+    if latency_by_category:
+        print("\n⏱️ レイテンシ (ms)")
+        for category, metrics in latency_by_category.items():
+            for name, stats in metrics.items():
+                print(f"  {category}.{name}: n={stats['count']} p50={stats['p50']:.0f} "
+                      f"p95={stats['p95']:.0f} p99={stats['p99']:.0f} max={stats['max']:.0f}")
+
+    server_timing = verification_results["summary"]["server_timing"]
+    if server_timing:
+        print_stage_breakdown("⏱️ /api/chat サーバー側の段階別処理時間 (ms)", server_timing)
+
     print(f"\n検証完了時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
+def print_stage_breakdown(title, stages):
+    """段階別のパーセンタイルを、合計に占める割合が大きい順に表示する"""
+    print(f"\n{title}")
+    total_p50 = (stages.get("total") or {}).get("p50")
+    for stage, stats in sorted(stages.items(), key=lambda item: -(item[1]["p50"] or 0)):
+        share = f"  (p50の{stats['p50'] / total_p50 * 100:.0f}%)" if total_p50 and stage != "total" else ""
+        print(f"  {stage:>12}: n={stats['count']} p50={stats['p50']:.0f} p95={stats['p95']:.0f} "
+              f"p99={stats['p99']:.0f} max={stats['max']:.0f}{share}")
+
 def print_detailed_results():
     """詳細結果の出力"""
     print("\n" + "=" * 60)
@@ -522,15 +1289,81 @@ def print_detailed_results():
         for warning in warning_issues:
             print(f"  - {warning['test_name']}: {warning['details']}")
 
-if __name__ == "__main__":
-    run_comprehensive_verification()
+def parse_args():
+    """コマンドライン引数の解析"""
+    parser = argparse.ArgumentParser(description="SmartKnowledgeBot本番サービス品質検証")
+    parser.add_argument("--base-url", default=BASE_URL, help="検証対象のURL")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="質問送信テストの並列ワーカー数（1で逐次実行）")
+    parser.add_argument("--headless", action="store_true", help="ブラウザをheadlessで起動")
+    parser.add_argument("--trace-dir", help="質問ごとのネットワークトレース（HAR）の保存先")
+    parser.add_argument("--history-db", default=results_history.DEFAULT_DB_PATH, help="実行履歴DBのパス")
+    parser.add_argument("--no-history", action="store_true", help="実行履歴に記録しない")
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("verify", help="ブラウザによる包括的品質検証（デフォルト）")
+
+    load_parser = subparsers.add_parser("load", help="/api/chat へのオープンループ負荷試験")
+    load_parser.add_argument("--rps", type=float, default=5, help="目標リクエスト/秒")
+    load_parser.add_argument("--duration", type=float, default=60, help="試験時間（秒）")
+    load_parser.add_argument("--ramp-up", type=float, default=0, help="目標RPSまでのランプアップ時間（秒）")
+    load_parser.add_argument("--connections", type=int, default=50, help="最大同時接続数")
+    load_parser.add_argument("--stub", action="store_true", help="ローカルスタブサーバーに対して実行")
+    load_parser.add_argument("--convex-seed", help="--stub時にConvex代替へ読み込むdocumentsのエクスポート")
+
+    probe_parser = subparsers.add_parser("probe", help="複数デプロイURLのHTTPプローブ（正常なものだけブラウザ検証）")
+    probe_parser.add_argument("targets", nargs="*", help="プローブ対象のURL")
+    probe_parser.add_argument("--targets-file", help="1行1URLのターゲット一覧")
+    probe_parser.add_argument("--probe-workers", type=int, default=16, help="HTTPプローブの並列数")
+    probe_parser.add_argument("--escalate", action="store_true", help="正常なターゲットをブラウザ検証へ進める")
+
+    parser.add_argument("--skip-probe", action="store_true", help="ブラウザ検証前のHTTPプローブを省略")
+    return parser.parse_args()
+
+def finish_run(deploy_url, results_file=RESULTS_FILE, history_db=None):
+    """サマリーを表示して結果を保存し、history_db が指定されていれば実行履歴に追記する
+
+    HTTPプローブだけの実行はレイテンシのベースラインを歪めるため、呼び出し側で history_db=None にする。
+    """
     generate_summary()
     print_detailed_results()
 
     # 結果をJSONファイルに保存
     try:
-        with open("verification_results.json", "w", encoding="utf-8") as f:
+        with open(results_file, "w", encoding="utf-8") as f:
             json.dump(verification_results, f, ensure_ascii=False, indent=2)
-        print(f"\n💾 詳細結果をverification_results.jsonに保存しました")
+        print(f"\n💾 詳細結果を{results_file}に保存しました")
     except Exception as e:
         print(f"⚠️ 結果保存エラー: {str(e)}")
+
+    # 実行履歴に追記（results_history.py compare でリグレッション検出に使う）
+    if history_db:
+        try:
+            with closing(results_history.connect(history_db)) as conn:
+                run_id = results_history.record_run(conn, verification_results, deploy_url)
+            print(f"💾 実行 #{run_id} ({deploy_url}) を{history_db}に記録しました")
+        except Exception as e:
+            print(f"⚠️ 履歴記録エラー: {str(e)}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    history_db = None if args.no_history else args.history_db
+    if args.command == "load":
+        run_load_verification(args.base_url, args.rps, args.duration, args.ramp_up,
+                              args.connections, args.stub, args.convex_seed)
+        finish_run("stub" if args.stub else args.base_url, history_db=history_db)
+    elif args.command == "probe":
+        targets = load_targets(args.targets, args.targets_file) or [args.base_url]
+        healthy = run_probe_tier(targets, args.probe_workers)
+        finish_run(None)
+        if args.escalate:
+            # ターゲットごとに結果を分け、同名のテストが別デプロイの結果と混ざらないようにする
+            for target in healthy:
+                reset_results()
+                run_comprehensive_verification(target, args.workers, args.headless, args.trace_dir)
+                finish_run(target, results_file_for(target), history_db)
+    else:
+        verified = args.skip_probe or bool(run_probe_tier([args.base_url]))
+        if verified:
+            run_comprehensive_verification(args.base_url, args.workers, args.headless, args.trace_dir)
+        finish_run(args.base_url, history_db=history_db if verified else None)
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+route.ts の answerQuestionFromDocs（質問→翻訳→埋め込み→検索→回答生成）の再生ベンチマーク
+変更前は各段階が前の段階を待つ直列の手順で、質問ごとに翻訳のLLM呼び出しと埋め込みを毎回行っていた。
+変更後の手順（翻訳と質問の埋め込みの有界LRUキャッシュ、翻訳中に元の質問の埋め込みで先行検索し、
+翻訳後の検索結果とまとめる）をPythonで再現し、質問ログを両方の手順で再生してレイテンシを比較する。
+
+LLM・埋め込みAPI・Convexはローカルの代替サーバー（偽のgenerateContent、embedding_benchmark.py の
+偽の埋め込みサーバー、convex_stub_server.py）で、各段階の遅延は semantic_cache.py の目安を既定値にする。
+回答キャッシュ（route.ts の Step 0）は両方の手順で同じなので、ここではヒットしなかった質問の経路だけを計測する。
+
+使い方:
+  python query_pipeline_benchmark.py                               # 合成の質問ログ120件で比較
+  python query_pipeline_benchmark.py --log questions.jsonl --workers 8
+  python query_pipeline_benchmark.py --translate-ms 1200 --generate-ms 3000 --output pipeline.json
+  python query_pipeline_benchmark.py --translate-error-rate 0.1     # 翻訳APIの失敗を混ぜる
+  python query_pipeline_benchmark.py --search-error-rate 0.1        # ベクトル検索の失敗を混ぜる
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import requests
+
+from chunking_benchmark import recursive_character_split, synthesize_pages
+from convex_stub_server import start_convex_stub
+from embedding_benchmark import FakeEmbeddingHandler, start_fake_embedding_server
+from latency_histogram import LatencyHistogram
+from local_embedder import LocalEmbedder
+from semantic_cache import STAGE_LATENCY_MS, load_log, synthesize_log
+
+GENERATE_PATH = re.compile(r"^/v1beta/models/([\w.-]+):generateContent")
+TRANSLATION_PATTERN = re.compile(r"Japanese question: (.*)")
+SEARCH_LIMIT = 5
+MODES = ("sequential", "pipelined")
+
+
+class FakeLLMHandler(FakeEmbeddingHandler):
+    """generateContent 互換のエンドポイント（翻訳と回答生成で遅延を分ける）"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) if length else b"{}")
+        if not GENERATE_PATH.match(self.path):
+            self._send(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+
+        prompt = body["contents"][0]["parts"][0]["text"]
+        translation = TRANSLATION_PATTERN.search(prompt)
+        kind = "translate" if translation else "generate"
+        time.sleep(self.server.latency_ms[kind] / 1000)
+        with self.server.lock:
+            self.server.counts[kind] += 1
+            failed = kind == "translate" and self.server.rng.random() < self.server.translate_error_rate
+        if failed:
+            self._send(503, {"error": {"code": 503, "message": "The model is overloaded."}})
+            return
+        # 翻訳の代わりに印を付けるだけにする（埋め込みが元の質問と少し違うので、翻訳後の検索も実際に行われる）
+        text = f"Question: {translation.group(1)}" if translation else "スタブ回答: ドキュメントに記載されています。"
+        self._send(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, translate_ms, generate_ms, translate_error_rate=0.0, seed=0):
+        super().__init__(address, FakeLLMHandler)
+        self.latency_ms = {"translate": translate_ms, "generate": generate_ms}
+        self.translate_error_rate = translate_error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"translate": 0, "generate": 0}
+
+
+def start_fake_llm_server(translate_ms, generate_ms, translate_error_rate=0.0, host="127.0.0.1", port=0):
+    server = FakeLLMServer((host, port), translate_ms, generate_ms, translate_error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1beta"
+
+
+class Services:
+    """route.ts が呼ぶ外部サービス（スレッドごとにKeep-Aliveセッションを持つ）"""
+
+    def __init__(self, llm_base, embedding_base, convex_url):
+        self.llm_base = llm_base
+        self.embedding_base = embedding_base
+        self.convex_url = convex_url
+        self._local = threading.local()
+
+    def _post(self, url, payload):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.post(url, json=payload, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def generate(self, prompt):
+        result = self._post(f"{self.llm_base}/models/gemini-1.5-pro-latest:generateContent",
+                            {"contents": [{"parts": [{"text": prompt}]}]})
+        return result["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+    def translate(self, question):
+        return self.generate("Please translate the following Japanese question to English.\n"
+                             "Provide only the English translation, no additional text or explanation.\n\n"
+                             f"Japanese question: {question}\n")
+
+    def embed(self, text):
+        result = self._post(f"{self.embedding_base}/models/embedding-001:embedContent",
+                            {"model": "models/embedding-001", "content": {"parts": [{"text": text}]}})
+        return result["embedding"]["values"]
+
+    def search(self, embedding):
+        result = self._post(f"{self.convex_url}/api/action", {"path": "search:searchByEmbedding",
+                                                              "args": {"embedding": embedding, "limit": SEARCH_LIMIT}})
+        if result.get("status") != "success":
+            raise RuntimeError(f"searchByEmbedding failed: {result.get('errorMessage')}")
+        return result["value"]
+
+
+class StageTimer:
+    """route.ts の StageTimer と同じく段階ごとの処理時間を足し合わせる（並行する段階は重なって数える）"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def time(self, stage, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+    def summary(self):
+        return {**self.stages, "total": (time.perf_counter() - self.start) * 1000}
+
+
+def answer_prompt(question, results):
+    context = "\n\n".join(f"[Document {index + 1}] (Score: {result['score']:.3f})\n{result['text']}"
+                          for index, result in enumerate(results))
+    return f"**質問:** {question}\n\n**参考ドキュメント:**\n{context}\n\n**回答:**\n"
+
+
+def run_sequential(services, question, timer):
+    """変更前の手順: 回答キャッシュ用の埋め込み→翻訳→翻訳後の埋め込み→検索→回答生成を順に待つ"""
+    timer.time("cache_embed", services.embed, question)
+    translated = timer.time("translate", services.translate, question)
+    embedding = timer.time("embed", services.embed, translated)
+    results = timer.time("search", services.search, embedding)
+    timer.time("generate", services.generate, answer_prompt(question, results))
+    return results
+
+
+class LruCache:
+    """件数上限つきのLRU（route.ts の LruCache と同じく、読んだ項目を末尾に移す）"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+
+def merge_search_results(result_sets, limit=SEARCH_LIMIT):
+    """同じdocumentは高い方のスコアで1件にまとめ、スコア順に limit 件を返す"""
+    merged = {}
+    for results in result_sets:
+        for result in results:
+            if result["id"] not in merged or result["score"] > merged[result["id"]]["score"]:
+                merged[result["id"]] = result
+    return sorted(merged.values(), key=lambda result: -result["score"])[:limit]
+
+
+class QueryPipeline:
+    """変更後の手順: 翻訳・埋め込みをキャッシュし、翻訳中に元の質問で先行検索して結果をまとめる
+    （翻訳に失敗したときは元の質問での検索だけで回答し、片方の検索が失敗したときはもう片方の結果だけで回答する）"""
+
+    def __init__(self, services, max_entries=1000, max_workers=32):
+        self.services = services
+        self.translations = LruCache(max_entries)
+        self.embeddings = LruCache(max_entries)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.translation_failures = 0  # 先行検索の結果だけで回答した質問の数
+        self.search_fallbacks = 0  # 2つの検索の片方が失敗し、もう片方の結果だけで回答した質問の数
+
+    def _cached(self, cache, key, load):
+        # 値にFutureを入れ、同時に届いた同じ質問は1回の呼び出しを共有する（失敗したら取り除く）
+        with self.lock:
+            future = cache.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                cache.set(key, future)
+        if owner:
+            try:
+                future.set_result(load(key))
+            except Exception as e:
+                with self.lock:
+                    cache.delete(key)
+                future.set_exception(e)
+        return future.result()
+
+    def embed(self, text):
+        return self._cached(self.embeddings, text, self.services.embed)
+
+    def translate(self, question):
+        return self._cached(self.translations, question, self.services.translate)
+
+    def _search_original(self, question, original_embedding, timer):
+        embedding = original_embedding if original_embedding is not None else self.embed(question)
+        return timer.time("search_original", self.services.search, embedding)
+
+    def run(self, question, timer):
+        try:
+            original_embedding = timer.time("cache_embed", self.embed, question)
+        except requests.RequestException:
+            original_embedding = None  # route.ts でも回答キャッシュの照会の失敗は回答生成を妨げない
+        translation = self.executor.submit(timer.time, "translate", self.translate, question)
+        # 埋め込みがあるときだけ翻訳と並行して先行検索する
+        original_search = (self.executor.submit(self._search_original, question, original_embedding, timer)
+                           if original_embedding is not None else None)
+        try:
+            translated = translation.result()
+        except requests.RequestException:
+            translated = None
+            with self.lock:
+                self.translation_failures += 1
+        use_translation = translated is not None and translated != question
+        if original_search is None and not use_translation:
+            original_search = self.executor.submit(self._search_original, question, original_embedding, timer)
+
+        # 片方の検索が失敗しても、もう片方の結果で回答する（両方失敗したときだけ失敗させる）
+        result_sets = []
+        failures = []
+        searches = [original_search.result] if original_search is not None else []
+        if use_translation:
+            searches.append(lambda: timer.time("search", self.services.search,
+                                               timer.time("embed", self.embed, translated)))
+        for search in searches:
+            try:
+                result_sets.append(search())
+            except (requests.RequestException, RuntimeError) as e:
+                failures.append(e)
+        if not result_sets:
+            raise failures[0]
+        if failures:
+            with self.lock:
+                self.search_fallbacks += 1
+        results = merge_search_results(result_sets)
+        timer.time("generate", self.services.generate, answer_prompt(question, results))
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def seed_corpus(store, chunk_count, seed=0):
+    """合成ページのチャンクをローカルの代替モデルで埋め込んでConvex代替サーバーに入れる"""
+    embedder = LocalEmbedder()
+    documents = []
+    for page in synthesize_pages(max(1, chunk_count // 3), seed=seed):
+        for chunk in recursive_character_split(page["text"], 1000, 200):
+            documents.append({"text": chunk, "sourceUrl": page["url"]})
+    documents = documents[:chunk_count]
+    vectors = embedder.embed_documents([doc["text"] for doc in documents])
+    with store.lock:
+        store.add_documents([{**doc, "embedding": vector.tolist()} for doc, vector in zip(documents, vectors)])
+    return len(documents)
+
+
+def replay(questions, answer, workers):
+    """質問を workers 並列で再生し、全体と初出・再出の質問ごとのレイテンシ、段階別の処理時間を集計する"""
+    latency = {"all": LatencyHistogram(), "first": LatencyHistogram(), "repeat": LatencyHistogram()}
+    stages = {}
+    lock = threading.Lock()
+    seen = set()
+    errors = 0
+
+    def run_one(item):
+        nonlocal errors
+        question, repeat = item
+        timer = StageTimer()
+        try:
+            answer(question, timer)
+        except (requests.RequestException, RuntimeError, KeyError, ValueError):
+            with lock:
+                errors += 1
+            return
+        summary = timer.summary()
+        with lock:
+            latency["all"].record(summary["total"])
+            latency["repeat" if repeat else "first"].record(summary["total"])
+            for stage, duration in summary.items():
+                stages.setdefault(stage, LatencyHistogram()).record(duration)
+
+    items = []
+    for question in questions:
+        items.append((question, question in seen))
+        seen.add(question)
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(run_one, items))
+    return {
+        "questions": len(items),
+        "errors": errors,
+        "latency_ms": {name: histogram.summary() for name, histogram in latency.items()},
+        "stages_ms": {stage: histogram.summary() for stage, histogram in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="answerQuestionFromDocs: 直列の手順とキャッシュ・先行検索つきの手順の比較")
+    parser.add_argument("--log", help="質問ログ（semantic_cache.py と同じJSONL、省略時は合成ログ）")
+    parser.add_argument("--questions", type=int, default=120, help="再生する質問の数")
+    parser.add_argument("--workers", type=int, default=4, help="同時に再生する質問の数")
+    parser.add_argument("--documents", type=int, default=300, help="Convex代替サーバーに入れるチャンク数")
+    parser.add_argument("--cache-entries", type=int, default=1000, help="翻訳・埋め込みキャッシュの上限件数")
+    parser.add_argument("--translate-ms", type=float, default=STAGE_LATENCY_MS["translate"])
+    parser.add_argument("--generate-ms", type=float, default=STAGE_LATENCY_MS["generate"])
+    parser.add_argument("--translate-error-rate", type=float, default=0.0, help="翻訳のLLM呼び出しが失敗する割合")
+    parser.add_argument("--search-error-rate", type=float, default=0.0, help="searchByEmbedding が失敗する割合")
+    parser.add_argument("--embed-ms", type=float, default=STAGE_LATENCY_MS["embed"])
+    parser.add_argument("--search-ms", type=float, default=STAGE_LATENCY_MS["search"])
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    log = load_log(args.log) if args.log else synthesize_log(args.questions * 2)
+    questions = [item["question"] for item in log if not item.get("event")][:args.questions]
+
+    llm_server, llm_base = start_fake_llm_server(args.translate_ms, args.generate_ms, args.translate_error_rate)
+    embedding_server, embedding_base = start_fake_embedding_server(latency_ms=args.embed_ms, per_text_ms=0.0)
+    convex_server, convex_url = start_convex_stub()
+    convex_server.update_profile({"functions": {"search:searchByEmbedding": {"latency_ms": args.search_ms,
+                                                                             "error_rate": args.search_error_rate}}})
+    documents = seed_corpus(convex_server.store, args.documents)
+    services = Services(llm_base, embedding_base, convex_url)
+    print(f"🧪 質問{len(questions)}件（異なる質問{len(set(questions))}件）, documents {documents}件, 並列{args.workers}")
+    print(f"   段階の遅延: 翻訳 {args.translate_ms:.0f}ms / 生成 {args.generate_ms:.0f}ms / "
+          f"埋め込み {args.embed_ms:.0f}ms / 検索 {args.search_ms:.0f}ms")
+
+    report = {}
+    try:
+        for mode in MODES:
+            llm_server.counts.update(translate=0, generate=0)
+            embedding_server.counts.clear()
+            if mode == "sequential":
+                report[mode] = replay(questions, lambda question, timer: run_sequential(services, question, timer),
+                                      args.workers)
+            else:
+                pipeline = QueryPipeline(services, args.cache_entries)
+                try:
+                    report[mode] = replay(questions, pipeline.run, args.workers)
+                    report[mode]["translation_fallbacks"] = pipeline.translation_failures
+                    report[mode]["search_fallbacks"] = pipeline.search_fallbacks
+                finally:
+                    pipeline.close()
+            report[mode]["llm_calls"] = dict(llm_server.counts)
+            report[mode]["embedding_calls"] = embedding_server.counts["accepted"]
+    finally:
+        for server in (llm_server, embedding_server, convex_server):
+            server.shutdown()
+
+    print(f"\n{'手順':>12} {'p50':>8} {'p95':>8} {'初出p50':>8} {'再出p50':>8} {'翻訳':>5} {'埋め込み':>6} {'失敗':>4}")
+    for mode, result in report.items():
+        latency = result["latency_ms"]
+        repeat_p50 = latency["repeat"]["p50"]
+        print(f"{mode:>12} {latency['all']['p50']:>6.0f}ms {latency['all']['p95']:>6.0f}ms "
+              f"{latency['first']['p50']:>6.0f}ms "
+              f"{f'{repeat_p50:.0f}ms' if repeat_p50 is not None else '-':>8} "
+              f"{result['llm_calls']['translate']:>5} {result['embedding_calls']:>6} {result['errors']:>4}")
+    if args.translate_error_rate:
+        print(f"\n🛟 翻訳の失敗時に先行検索だけで回答: {report['pipelined']['translation_fallbacks']}件 "
+              f"（sequential は同じ失敗で {report['sequential']['errors']}件がエラー）")
+    if args.search_error_rate:
+        print(f"\n🛟 片方の検索の失敗をもう片方の結果だけで回答: {report['pipelined']['search_fallbacks']}件 "
+              f"（失敗 sequential {report['sequential']['errors']}件 / pipelined {report['pipelined']['errors']}件）")
+    for mode, result in report.items():
+        print(f"\n⏱️ {mode} の段階別 p50: " + ", ".join(f"{stage} {stats['p50']:.0f}ms"
+                                                  for stage, stats in result["stages_ms"].items()))
+
+    before, after = report["sequential"]["latency_ms"]["all"], report["pipelined"]["latency_ms"]["all"]
+    if before["p50"] and after["p50"]:
+        print(f"\n⚡ p50 {before['p50']:.0f}ms → {after['p50']:.0f}ms ({(1 - after['p50'] / before['p50']) * 100:.0f}%短縮), "
+              f"p95 {before['p95']:.0f}ms → {after['p95']:.0f}ms ({(1 - after['p95'] / before['p95']) * 100:.0f}%短縮)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
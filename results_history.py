@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+検証結果の履歴ストアと性能リグレッション検出
+verification_results.json の計測値を実行ごとにSQLiteへ追記し、
+直近の実行をローリングベースラインと比較する。
+
+使い方:
+  python results_history.py record verification_results.json --deploy-url URL
+  python results_history.py compare [--deploy-url URL] [--window 10]
+  （--deploy-url を省略すると最新実行と同じデプロイURLの実行をベースラインにする）
+  （compare はリグレッション検出時に終了コード1を返す）
+"""
+
+import argparse
+import json
+import sqlite3
+import statistics
+import sys
+from datetime import datetime
+
+DEFAULT_DB_PATH = "verification_history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deploy_url TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_url_time ON runs (deploy_url, recorded_at);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_by_name ON metrics (name, run_id);
+"""
+
+# 追跡対象: performanceカテゴリの全結果とRAG回答の結果（いずれも値が大きいほど悪化）
+TRACKED_CATEGORIES = ("performance",)
+TRACKED_TEST_PREFIXES = ("RAG回答_",)
+TRACKED_PERCENTILES = ("p50", "p95", "p99")
+# 割合のメトリクス（0〜1）。ベースラインが0のとき1件のエラーで相対変化が無限大になるため、
+# 絶対値で RATE_MIN_DELTA 未満の悪化はリグレッションとみなさない
+RATE_METRIC_SUFFIXES = ("error_rate",)
+RATE_MIN_DELTA = 0.01
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def extract_run_metrics(results):
+    """検証結果から比較対象の数値メトリクスを {名前: 値} で抽出する"""
+    metrics = {}
+    tracked_tests = set()
+
+    for category, entries in results.items():
+        if category == "summary":
+            continue
+        for entry in entries:
+            name = entry["test_name"]
+            if category in TRACKED_CATEGORIES or name.startswith(TRACKED_TEST_PREFIXES):
+                tracked_tests.add(name)
+            else:
+                continue
+            for key, value in entry.get("metrics", {}).items():
+                # 負荷試験のようなネストしたパーセンタイル集計
+                if isinstance(value, dict):
+                    for p in TRACKED_PERCENTILES:
+                        if isinstance(value.get(p), (int, float)):
+                            metrics[f"{name}.{key}.{p}"] = value[p]
+                elif key == "error_rate":
+                    metrics[f"{name}.error_rate"] = value
+
+    # 1実行内に同じテストが複数回ある場合はヒストグラム集計を使う
+    by_test = results.get("summary", {}).get("latency", {}).get("by_test", {})
+    for name, timings in by_test.items():
+        if name not in tracked_tests:
+            continue
+        for key, stats in timings.items():
+            for p in ("p50", "p95"):
+                if stats.get(p) is not None:
+                    metrics[f"{name}.{key}.{p}"] = stats[p]
+
+    return metrics
+
+
+def record_run(conn, results, deploy_url, recorded_at=None):
+    """1回分の検証結果を履歴に追記し、run idを返す"""
+    recorded_at = recorded_at or results.get("summary", {}).get("timestamp") or datetime.now().isoformat()
+    summary = {k: v for k, v in results.get("summary", {}).items() if k != "latency"}
+    cursor = conn.execute(
+        "INSERT INTO runs (deploy_url, recorded_at, summary) VALUES (?, ?, ?)",
+        (deploy_url, recorded_at, json.dumps(summary, ensure_ascii=False)),
+    )
+    run_id = cursor.lastrowid
+    conn.executemany(
+        "INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+        [(run_id, name, float(value)) for name, value in extract_run_metrics(results).items()],
+    )
+    conn.commit()
+    return run_id
+
+
+def _latest_deploy_url(conn):
+    row = conn.execute("SELECT deploy_url FROM runs ORDER BY recorded_at DESC, id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def _recent_run_ids(conn, deploy_url, limit):
+    rows = conn.execute(
+        "SELECT id FROM runs WHERE deploy_url = ? ORDER BY recorded_at DESC, id DESC LIMIT ?",
+        (deploy_url, limit),
+    )
+    return [row[0] for row in rows]
+
+
+def _run_metrics(conn, run_id):
+    rows = conn.execute("SELECT name, value FROM metrics WHERE run_id = ?", (run_id,))
+    return dict(rows.fetchall())
+
+
+def detect_regressions(conn, deploy_url=None, window=10, min_runs=3, z_threshold=3.0, min_change=0.2,
+                       rate_min_delta=RATE_MIN_DELTA):
+    """最新実行の各メトリクスを直近window件のベースラインと比較する
+
+    ベースラインの中央値とMAD（中央絶対偏差）によるロバストzスコアが z_threshold を超え、
+    かつ中央値から min_change（相対）以上悪化した場合にリグレッションとみなす。
+    MADが小さすぎる場合は中央値の5%をばらつきの下限とする。
+    割合のメトリクスは、さらに中央値から rate_min_delta（絶対値）以上悪化した場合に限る。
+    deploy_url を省略した場合は最新実行と同じデプロイURLの実行だけを比較する
+    （スタブと本番のように桁の違う実行が混ざらないようにする）。
+    """
+    deploy_url = deploy_url or _latest_deploy_url(conn)
+    run_ids = _recent_run_ids(conn, deploy_url, window + 1) if deploy_url else []
+    if not run_ids:
+        return None, []
+
+    latest_id, baseline_ids = run_ids[0], run_ids[1:]
+    latest = _run_metrics(conn, latest_id)
+    history = {}
+    for run_id in baseline_ids:
+        for name, value in _run_metrics(conn, run_id).items():
+            history.setdefault(name, []).append(value)
+
+    findings = []
+    for name, value in sorted(latest.items()):
+        baseline = history.get(name, [])
+        if len(baseline) < min_runs:
+            continue
+        median = statistics.median(baseline)
+        mad = statistics.median(abs(v - median) for v in baseline)
+        scale = max(1.4826 * mad, 0.05 * abs(median), 1e-9)
+        z_score = (value - median) / scale
+        if median:
+            change = (value - median) / median
+        else:
+            change = float("inf") if value > median else 0.0
+        regression = z_score > z_threshold and change > min_change
+        if name.endswith(RATE_METRIC_SUFFIXES) and value - median < rate_min_delta:
+            regression = False
+        findings.append({
+            "metric": name,
+            "value": value,
+            "baseline_median": median,
+            "baseline_runs": len(baseline),
+            "z_score": z_score,
+            "change": change,
+            "regression": regression,
+        })
+    return latest_id, findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検証結果の履歴記録とリグレッション検出")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="履歴DBのパス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="検証結果JSONを履歴に追記")
+    record_parser.add_argument("results_file")
+    record_parser.add_argument("--deploy-url", required=True)
+
+    compare_parser = subparsers.add_parser("compare", help="最新実行をローリングベースラインと比較")
+    compare_parser.add_argument("--deploy-url", help="比較対象のデプロイURL（省略時は最新実行のデプロイURL）")
+    compare_parser.add_argument("--window", type=int, default=10, help="ベースラインに使う過去の実行数")
+    compare_parser.add_argument("--min-runs", type=int, default=3, help="判定に必要な最小ベースライン数")
+    compare_parser.add_argument("--z-threshold", type=float, default=3.0)
+    compare_parser.add_argument("--min-change", type=float, default=0.2, help="リグレッションとみなす最小悪化率")
+    compare_parser.add_argument("--rate-min-delta", type=float, default=RATE_MIN_DELTA,
+                                help="error_rateなど割合のメトリクスでリグレッションとみなす最小悪化幅（絶対値）")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+
+    if args.command == "record":
+        with open(args.results_file, encoding="utf-8") as f:
+            results = json.load(f)
+        run_id = record_run(conn, results, args.deploy_url)
+        print(f"💾 実行 #{run_id} を履歴に記録しました ({args.db})")
+        return 0
+
+    latest_id, findings = detect_regressions(conn, args.deploy_url, args.window, args.min_runs,
+                                             args.z_threshold, args.min_change, args.rate_min_delta)
+    if latest_id is None:
+        print("履歴がありません")
+        return 0
+
+    deploy_url = conn.execute("SELECT deploy_url FROM runs WHERE id = ?", (latest_id,)).fetchone()[0]
+    print(f"📈 実行 #{latest_id} を同じデプロイ ({deploy_url}) のベースラインと比較")
+    regressions = [f for f in findings if f["regression"]]
+    for finding in findings:
+        mark = "❌" if finding["regression"] else "✅"
+        print(f"  {mark} {finding['metric']}: {finding['value']:.1f} "
+              f"(ベースライン中央値 {finding['baseline_median']:.1f}, "
+              f"{finding['change'] * 100:+.0f}%, z={finding['z_score']:.1f}, n={finding['baseline_runs']})")
+
+    if regressions:
+        print(f"\n❌ 性能リグレッションを{len(regressions)}件検出しました")
+        return 1
+    print("\n✅ 性能リグレッションなし")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
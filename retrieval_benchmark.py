@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+documentsベクトルインデックスのオフライン検索ベンチマーク
+Convexの documents テーブル（768次元embedding + text + sourceUrl）のエクスポートをNumPy配列に読み込み、
+総当たりコサイン類似度top-kと近似インデックス（IVF、hnswlibがあればHNSW）の
+スループット・レイテンシ・recall@kをコーパス規模ごとに比較する。
+
+使い方:
+  python retrieval_benchmark.py --export documents.json --sizes 10000 100000 1000000
+  python retrieval_benchmark.py --sizes 10000 100000      # エクスポートなし（合成データ）
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from latency_histogram import LatencyHistogram
+
+EMBEDDING_DIM = 768  # GoogleGenerativeAI embedding-001
+CONVEX_VECTOR_LIMIT = 256  # searchByEmbedding の最大件数
+
+
+def load_documents_export(path):
+    """knowledge:getAllDocuments の出力（JSON配列、{"value": [...]}、またはJSONL）を読み込む
+
+    path が embedding_store.py のストアディレクトリならメモリマップで開く。
+    戻り値は (embeddings[N, 768] float32, texts, source_urls)。
+    """
+    if os.path.isdir(path):
+        store = EmbeddingStore(path)
+        rows = range(len(store))
+        return (np.asarray(store.embeddings, dtype=np.float32),
+                [store.text(row) for row in rows], [store.source_url(row) for row in rows])
+
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            documents = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            documents = data.get("value", data) if isinstance(data, dict) else data
+
+    embeddings = np.asarray([doc["embedding"] for doc in documents], dtype=np.float32)
+    texts = [doc.get("text", "") for doc in documents]
+    source_urls = [doc.get("sourceUrl", "") for doc in documents]
+    return embeddings, texts, source_urls
+
+
+def normalize(vectors):
+    """行ベクトルをL2正規化（内積＝コサイン類似度にする）"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def synthesize_corpus(size, seeds=None, clusters=1024, noise=1.5, rng=None):
+    """規模ごとの合成コーパスを生成する
+
+    seeds（実データのembedding）があればその周辺に、なければランダムなクラスタ中心の周辺に点を置く。
+    実際の文書埋め込みと同様にトピックのまとまりを持たせるため。
+    noise が大きいほどクラスタが重なり、近似インデックスにとって難しいデータになる。
+    """
+    rng = rng or np.random.default_rng(0)
+    if seeds is None:
+        seeds = rng.standard_normal((clusters, EMBEDDING_DIM)).astype(np.float32)
+    seeds = normalize(seeds.astype(np.float32))
+
+    corpus = np.empty((size, seeds.shape[1]), dtype=np.float32)
+    batch = 65536
+    for start in range(0, size, batch):
+        end = min(size, start + batch)
+        centers = seeds[rng.integers(0, len(seeds), end - start)]
+        jitter = rng.standard_normal(centers.shape, dtype=np.float32) * (noise / np.sqrt(seeds.shape[1]))
+        corpus[start:end] = normalize(centers + jitter)
+    return corpus
+
+
+def top_k(scores, k):
+    """スコア行列の各行のtop-kインデックス（スコア降順）"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, part, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(part, order, axis=1)
+
+
+class BruteForceIndex:
+    """総当たりのコサイン類似度検索（正解データの基準）"""
+
+    name = "brute_force"
+
+    def __init__(self, vectors):
+        self.vectors = normalize(vectors)
+
+    def search(self, queries, k):
+        return top_k(normalize(queries) @ self.vectors.T, k)
+
+
+class IVFIndex:
+    """転置ファイル（IVF）インデックス
+
+    k-meansでnlist個のセントロイドに分割し、検索時は近いnprobe個のリストだけを走査する。
+    リストはベクトルをセントロイド順に並べ替えた連続配列として持つ。
+    """
+
+    name = "ivf"
+
+    def __init__(self, vectors, nlist=None, nprobe=8, train_size=50000, iterations=10, seed=0):
+        vectors = normalize(vectors)
+        self.nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        self.nprobe = nprobe
+        rng = np.random.default_rng(seed)
+
+        sample = vectors[rng.choice(len(vectors), min(train_size, len(vectors)), replace=False)]
+        centroids = sample[rng.choice(len(sample), min(self.nlist, len(sample)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=len(centroids))
+            empty = counts == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        self.centroids = centroids
+        self.nlist = len(centroids)
+
+        assignment = self._assign(vectors, centroids)
+        self.order = np.argsort(assignment, kind="stable")
+        self.vectors = vectors[self.order]
+        counts = np.bincount(assignment, minlength=self.nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @staticmethod
+    def _assign(vectors, centroids, batch=65536):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch):
+            assignment[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        probes = top_k(queries @ self.centroids.T, self.nprobe)
+        results = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+            if len(candidates) == 0:
+                continue
+            scores = self.vectors[candidates] @ query
+            best = top_k(scores[None, :], k)[0]
+            results[row, :len(best)] = self.order[candidates[best]]
+        return results
+
+
+class HNSWIndex:
+    """hnswlibによるHNSWインデックス（hnswlibがインストールされている場合のみ）"""
+
+    name = "hnsw"
+
+    def __init__(self, vectors, m=16, ef_construction=200, ef_search=64):
+        import hnswlib
+
+        self.index = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+        self.index.init_index(max_elements=len(vectors), ef_construction=ef_construction, M=m)
+        self.index.add_items(vectors, np.arange(len(vectors)))
+        self.index.set_ef(ef_search)
+
+    def search(self, queries, k):
+        labels, _ = self.index.knn_query(queries, k=k)
+        return labels.astype(np.int64)
+
+
+def recall_at_k(results, truth):
+    """正解top-kのうち近似検索で見つかった割合の平均"""
+    hits = sum(len(set(r[r >= 0]) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def measure(index, queries, k, batch_size=64):
+    """1クエリずつのレイテンシと、バッチ検索のスループットを計測する"""
+    latency = LatencyHistogram()
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query[None, :], k)[0])
+        latency.record((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        index.search(queries[offset:offset + batch_size], k)
+    elapsed = time.perf_counter() - start
+
+    return np.asarray(results), {
+        "latency_ms": latency.summary(),
+        "batched_qps": len(queries) / elapsed if elapsed > 0 else None,
+    }
+
+
+def run_benchmark(sizes, k=5, queries=200, nprobes=(4, 8, 16), seeds=None, use_hnsw=True, noise=1.5):
+    """コーパス規模ごとに各インデックスを構築・計測し、レポートを返す"""
+    rng = np.random.default_rng(42)
+    report = []
+
+    for size in sizes:
+        print(f"\n📚 コーパス {size:,}件 ({size * EMBEDDING_DIM * 4 / 1048576:.0f}MB float32)")
+        corpus = synthesize_corpus(size, seeds, noise=noise, rng=rng)
+        # クエリはコーパス内の点の近傍（実際の質問が既存文書に近い状況を模す）
+        query_vectors = synthesize_corpus(queries, corpus[rng.choice(size, min(size, 1024), replace=False)],
+                                          noise=noise, rng=rng)
+
+        entry = {"size": size, "k": k, "queries": queries, "indexes": []}
+
+        brute = BruteForceIndex(corpus)
+        truth, stats = measure(brute, query_vectors, k)
+        entry["indexes"].append({"index": "brute_force", "build_s": 0.0, "recall": 1.0, **stats})
+        print(f"  brute_force: p50 {stats['latency_ms']['p50']:.2f}ms, {stats['batched_qps']:.0f} QPS")
+
+        start = time.perf_counter()
+        ivf = IVFIndex(corpus)
+        build_s = time.perf_counter() - start
+        for nprobe in nprobes:
+            ivf.nprobe = nprobe
+            results, stats = measure(ivf, query_vectors, k)
+            recall = recall_at_k(results, truth)
+            entry["indexes"].append({"index": f"ivf(nlist={ivf.nlist},nprobe={nprobe})",
+                                     "build_s": build_s, "recall": recall, **stats})
+            print(f"  ivf nprobe={nprobe}: p50 {stats['latency_ms']['p50']:.2f}ms, "
+                  f"{stats['batched_qps']:.0f} QPS, recall@{k} {recall:.3f}")
+
+        if use_hnsw:
+            try:
+                start = time.perf_counter()
+                hnsw = HNSWIndex(corpus)
+                build_s = time.perf_counter() - start
+                results, stats = measure(hnsw, query_vectors, k)
+                recall = recall_at_k(results, truth)
+                entry["indexes"].append({"index": "hnsw", "build_s": build_s, "recall": recall, **stats})
+                print(f"  hnsw: p50 {stats['latency_ms']['p50']:.2f}ms, "
+                      f"{stats['batched_qps']:.0f} QPS, recall@{k} {recall:.3f}")
+            except ImportError:
+                print("  hnsw: hnswlib 未インストールのためスキップ")
+                use_hnsw = False
+
+        report.append(entry)
+        del corpus, brute, ivf
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="documentsベクトルインデックスのオフライン検索ベンチマーク")
+    parser.add_argument("--export", help="knowledge:getAllDocuments のエクスポート（JSON/JSONL）またはストアディレクトリ")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--k", type=int, default=5, help=f"top-k（Convexの上限は{CONVEX_VECTOR_LIMIT}）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--noise", type=float, default=1.5, help="合成データのクラスタ内ばらつき")
+    parser.add_argument("--no-hnsw", action="store_true")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    seeds = None
+    if args.export:
+        seeds, _, _ = load_documents_export(args.export)
+        print(f"📥 エクスポートから{len(seeds)}件のembeddingを読み込みました（合成コーパスの中心に使用）")
+
+    report = run_benchmark(args.sizes, args.k, args.queries, tuple(args.nprobe), seeds, not args.no_hnsw,
+                           args.noise)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 レポートを{args.output}に保存しました")
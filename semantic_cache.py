@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+質問の言い換えに強いセマンティック回答キャッシュと、質問ログの再生ハーネス
+route.ts の回答キャッシュと同じ方式（質問の埋め込みのコサイン類似度が閾値以上なら過去の回答を再利用、
+TTL・LRUで追い出し、根拠にしたsourceUrlの documents が変わったら無効化）をPythonで再現し、
+質問ログを再生してヒット率・誤ヒット率・削減できるレイテンシとLLM呼び出し数を見積もる。
+
+質問ログは1行1件のJSONL:
+  {"question": "装備の強化方法を教えてください", "intent": "equip_upgrade", "t": 12.5}
+  {"event": "update", "sourceUrl": "https://example.com/guide/3", "t": 60.0}
+intent は誤ヒットの判定に、t（秒）はTTLの判定に使う（省略時は1件1秒間隔）。
+
+使い方:
+  python semantic_cache.py --log questions.jsonl --thresholds 0.85 0.9 0.95
+  python semantic_cache.py --synthetic 2000              # 合成ログで実行
+  python semantic_cache.py --log questions.jsonl --base-url http://localhost:3000   # 実際の /api/chat で計測
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+from latency_histogram import LatencyHistogram
+from local_embedder import LocalEmbedder
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_S = 600
+DEFAULT_MAX_ENTRIES = 500
+
+# route.ts の rag_search の各段階の目安（ミリ秒）。--base-url なしの見積もりに使う
+STAGE_LATENCY_MS = {
+    "cache_embed": 150,  # キャッシュ検索用の元の質問の埋め込み
+    "version_check": 40,  # knowledge:getSourceVersions
+    "translate": 900,
+    "embed": 150,
+    "search": 250,
+    "generate": 2500,
+}
+
+
+class SemanticCache:
+    """埋め込みの類似度で引く回答キャッシュ（TTL・LRU・sourceUrlによる無効化）"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self._keys = itertools.count()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def lookup(self, embedding):
+        """閾値以上で最も近い有効なエントリを返す: (value, similarity) または None"""
+        now = self.clock()
+        for key in [key for key, entry in self.entries.items() if entry["expires_at"] <= now]:
+            del self.entries[key]
+            self.stats["expired"] += 1
+
+        if self.entries:
+            keys = list(self.entries)
+            matrix = np.stack([self.entries[key]["embedding"] for key in keys])
+            query = np.asarray(embedding, dtype=np.float32)
+            similarities = matrix @ (query / (np.linalg.norm(query) or 1.0))
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                key = keys[best]
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]["value"], float(similarities[best])
+
+        self.stats["misses"] += 1
+        return None
+
+    def store(self, embedding, value, source_urls=()):
+        while len(self.entries) >= self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evicted"] += 1
+        vector = np.asarray(embedding, dtype=np.float32)
+        self.entries[next(self._keys)] = {
+            "embedding": vector / (np.linalg.norm(vector) or 1.0),
+            "value": value,
+            "source_urls": set(source_urls),
+            "expires_at": self.clock() + self.ttl_s,
+        }
+
+    def invalidate_source_url(self, source_url):
+        """sourceUrl の documents が変わったとき、それを根拠にしたエントリを削除する"""
+        stale = [key for key, entry in self.entries.items() if source_url in entry["source_urls"]]
+        for key in stale:
+            del self.entries[key]
+        self.stats["invalidated"] += len(stale)
+        return len(stale)
+
+
+PARAPHRASE_TEMPLATES = [
+    "{topic}を教えてください",
+    "{topic}を教えて",
+    "{topic}が知りたいです",
+    "{topic}はどうすればいいですか？",
+    "{topic}について教えてください",
+    "すみません、{topic}を教えてもらえますか",
+]
+TOPICS = [
+    "装備の強化方法", "装備を強化するやり方", "ガチャの排出確率", "ガチャの確率", "初心者におすすめの装備",
+    "限界突破に必要な素材", "強化石の入手方法", "強化石の集め方", "ボスの倒し方", "イベントの報酬",
+    "スキルの育成方法", "属性の相性", "パーティ編成のコツ", "周回におすすめのダンジョン", "覚醒の条件",
+    "ログインボーナスの受け取り方", "フレンドの追加方法", "課金アイテムの返金", "データ引き継ぎの方法", "推奨スペック",
+]
+
+
+def synthesize_log(count=2000, seed=0, update_every=200, source_urls=50):
+    """Zipf分布の人気度を持つ質問（言い換えあり）と、ときどきのドキュメント更新からなるログを作る"""
+    rng = random.Random(seed)
+    # 同じ意図の言い換え: 似た話題（「装備の強化方法」と「装備を強化するやり方」など）は同じintentにまとめる
+    intents = {topic: f"intent{index // 2 if index < 8 else index}" for index, topic in enumerate(TOPICS)}
+    weights = [1 / (rank + 1) for rank in range(len(TOPICS))]
+    log = []
+    t = 0.0
+    for i in range(count):
+        t += rng.expovariate(1.0)
+        topic = rng.choices(TOPICS, weights)[0]
+        log.append({"question": rng.choice(PARAPHRASE_TEMPLATES).format(topic=topic), "intent": intents[topic],
+                    "t": round(t, 3)})
+        if update_every and i % update_every == update_every - 1:
+            log.append({"event": "update", "sourceUrl": f"https://example.com/guide/{rng.randrange(source_urls)}",
+                        "t": round(t, 3)})
+    return log
+
+
+def load_log(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def simulate(log, threshold, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES, source_urls=50, seed=0):
+    """ログをキャッシュ付きのパイプラインとして再生し、段階ごとの目安レイテンシで効果を見積もる
+
+    各intentの回答は固定の3つのsourceUrlを根拠にするものとする。
+    """
+    rng = random.Random(seed)
+    clock = {"now": 0.0}
+    cache = SemanticCache(threshold, ttl_s, max_entries, clock=lambda: clock["now"])
+    embedder = LocalEmbedder()
+    sources = {}
+    baseline_ms = sum(STAGE_LATENCY_MS[stage] for stage in ("translate", "embed", "search", "generate"))
+    latency_without = LatencyHistogram()
+    latency_with = LatencyHistogram()
+    false_hits = 0
+    questions = 0
+
+    for position, item in enumerate(log):
+        clock["now"] = item.get("t", float(position))
+        if item.get("event") == "update":
+            cache.invalidate_source_url(item["sourceUrl"])
+            continue
+
+        questions += 1
+        intent = item.get("intent", item["question"])
+        latency_without.record(baseline_ms)
+        embedding = embedder.embed_query(item["question"])
+        hit = cache.lookup(embedding)
+        if hit:
+            latency_with.record(STAGE_LATENCY_MS["cache_embed"] + STAGE_LATENCY_MS["version_check"])
+            if hit[0]["intent"] != intent:
+                false_hits += 1
+            continue
+
+        latency_with.record(STAGE_LATENCY_MS["cache_embed"] + baseline_ms + STAGE_LATENCY_MS["version_check"])
+        if intent not in sources:
+            sources[intent] = {f"https://example.com/guide/{rng.randrange(source_urls)}" for _ in range(3)}
+        cache.store(embedding, {"intent": intent}, sources[intent])
+
+    hits = cache.stats["hits"]
+    return {
+        "threshold": threshold,
+        "questions": questions,
+        "hit_rate": hits / questions if questions else 0.0,
+        "false_hit_rate": false_hits / hits if hits else 0.0,
+        "llm_calls_saved": hits * 2,  # 翻訳と回答生成
+        "latency_without_ms": latency_without.summary(),
+        "latency_with_ms": latency_with.summary(),
+        "cache": dict(cache.stats),
+    }
+
+
+def replay_live(log, base_url, timeout=60):
+    """ログの質問を実際の /api/chat に順に送り、レスポンスの cached フラグごとにレイテンシを集計する"""
+    session = requests.Session()
+    latency = {"hit": LatencyHistogram(), "miss": LatencyHistogram()}
+    errors = 0
+    for item in log:
+        if item.get("event"):
+            continue
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/api/chat", timeout=timeout,
+                                    json={"message": item["question"], "action": "rag_search"})
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            errors += 1
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not data.get("success"):
+            errors += 1
+            continue
+        latency["hit" if data.get("cached") else "miss"].record(elapsed_ms)
+
+    hits, misses = latency["hit"].count, latency["miss"].count
+    hit_p50 = latency["hit"].percentile(50)
+    miss_p50 = latency["miss"].percentile(50)
+    return {
+        "requests": hits + misses + errors,
+        "errors": errors,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "hit_latency_ms": latency["hit"].summary(),
+        "miss_latency_ms": latency["miss"].summary(),
+        "p50_saved_per_hit_ms": (miss_p50 - hit_p50) if hits and misses else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="セマンティック回答キャッシュの再生ハーネス")
+    parser.add_argument("--log", help="質問ログ（JSONL）")
+    parser.add_argument("--synthetic", type=int, default=2000, help="--log がない場合の合成ログの件数")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.9, DEFAULT_THRESHOLD])
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL_S, help="TTL（秒）")
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument("--base-url", help="指定すると実際の /api/chat にログを送って計測する")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    log = load_log(args.log) if args.log else synthesize_log(args.synthetic)
+    questions = sum(1 for item in log if not item.get("event"))
+    print(f"🧾 質問 {questions}件, 更新イベント {len(log) - questions}件")
+
+    if args.base_url:
+        report = replay_live(log, args.base_url)
+        print(f"  ヒット率 {report['hit_rate'] * 100:.1f}%, エラー {report['errors']}件, "
+              f"ヒット時p50 {report['hit_latency_ms']['p50'] or 0:.0f}ms / "
+              f"ミス時p50 {report['miss_latency_ms']['p50'] or 0:.0f}ms")
+    else:
+        report = [simulate(log, threshold, args.ttl, args.max_entries) for threshold in args.thresholds]
+        for result in report:
+            print(f"  閾値 {result['threshold']:.2f}: ヒット率 {result['hit_rate'] * 100:5.1f}%  "
+                  f"誤ヒット {result['false_hit_rate'] * 100:4.1f}%  "
+                  f"p50 {result['latency_without_ms']['p50']:.0f}ms → {result['latency_with_ms']['p50']:.0f}ms  "
+                  f"LLM呼び出し削減 {result['llm_calls_saved']}回  無効化 {result['cache']['invalidated']}件")
+        print("  ※ローカルの代替embeddingは表層的な類似度のため、本番の閾値は --base-url の計測で決めること")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
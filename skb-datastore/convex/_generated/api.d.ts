@@ -14,9 +14,12 @@ import type {
   FunctionReference,
 } from "convex/server";
 import type * as admin from "../admin.js";
+import type * as crons from "../crons.js";
 import type * as knowledge from "../knowledge.js";
 import type * as pages from "../pages.js";
 import type * as search from "../search.js";
+import type * as stats from "../stats.js";
+import type * as textIndex from "../textIndex.js";
 
 /**
  * A utility for referencing Convex functions in your app's API.
@@ -28,9 +31,12 @@ import type * as search from "../search.js";
  */
 declare const fullApi: ApiFromModules<{
   admin: typeof admin;
+  crons: typeof crons;
   knowledge: typeof knowledge;
   pages: typeof pages;
   search: typeof search;
+  stats: typeof stats;
+  textIndex: typeof textIndex;
 }>;
 export declare const api: FilterApi<
   typeof fullApi,
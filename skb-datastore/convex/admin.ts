@@ -1,26 +1,40 @@
 import { mutation, query } from "./_generated/server";
 import { v } from "convex/values";
+import { scheduleUnindexDocuments } from "./textIndex";
+import {
+  adjustCounters,
+  adjustSourceVersions,
+  DOCUMENTS_TOTAL,
+  PAGES_TOTAL,
+  pageCounterDeltas,
+  pageStatusCounter,
+  readCounters,
+  RECONCILED_AT,
+} from "./stats";
 
-// データベース全体の統計情報を取得
+// データベース全体の統計情報を取得（集計カウンタを読むだけなので、件数によらず一定のコスト）
 export const getStats = query({
   handler: async (ctx) => {
-    const [pages, documents] = await Promise.all([
-      ctx.db.query("crawled_pages").collect(),
-      ctx.db.query("documents").collect(),
-    ]);
+    const counters = await readCounters(ctx);
 
     const pageStats = {
-      total: pages.length,
-      pending: pages.filter(p => p.status === "pending").length,
-      processed: pages.filter(p => p.status === "processed").length,
-      error: pages.filter(p => p.status === "error").length,
+      total: counters[PAGES_TOTAL] || 0,
+      pending: counters[pageStatusCounter("pending")] || 0,
+      processing: counters[pageStatusCounter("processing")] || 0,
+      processed: counters[pageStatusCounter("processed")] || 0,
+      error: counters[pageStatusCounter("error")] || 0,
     };
 
+    // 一度も数え直していないカウンタは、導入前からある行を含まない（stats:seedStatsCounters で初期化する）
+    const reconciledAt = counters[RECONCILED_AT] || null;
+
     return {
       pages: pageStats,
       documents: {
-        total: documents.length,
+        total: counters[DOCUMENTS_TOTAL] || 0,
       },
+      countersInitialized: reconciledAt !== null,
+      reconciledAt,
       lastUpdated: Date.now(),
     };
   },
@@ -40,6 +54,9 @@ export const purgeDocumentsBatch = mutation({
       await ctx.db.delete(doc._id);
       deletedDocuments++;
     }
+    await scheduleUnindexDocuments(ctx, documents.page.map((doc) => doc._id));
+    await adjustCounters(ctx, { [DOCUMENTS_TOTAL]: -deletedDocuments });
+    await adjustSourceVersions(ctx, documents.page, -1);
 
     return {
       deletedDocuments,
@@ -64,6 +81,7 @@ export const purgePagesBatch = mutation({
       await ctx.db.delete(page._id);
       deletedPages++;
     }
+    await adjustCounters(ctx, pageCounterDeltas(pages.page.map((page) => page.status), -1));
 
     return {
       deletedPages,
@@ -99,6 +117,9 @@ export const purgeBySourceUrl = mutation({
     for (const doc of documents) {
       await ctx.db.delete(doc._id);
     }
+    await scheduleUnindexDocuments(ctx, documents.map((doc) => doc._id));
+    await adjustCounters(ctx, { [DOCUMENTS_TOTAL]: -documents.length });
+    await adjustSourceVersions(ctx, documents, -1);
 
     // ページを削除
     const page = await ctx.db
@@ -108,6 +129,7 @@ export const purgeBySourceUrl = mutation({
 
     if (page) {
       await ctx.db.delete(page._id);
+      await adjustCounters(ctx, pageCounterDeltas([page.status], -1));
     }
 
     return {
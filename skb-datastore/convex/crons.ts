@@ -0,0 +1,12 @@
+import { cronJobs } from "convex/server";
+import { internal } from "./_generated/api";
+
+const crons = cronJobs();
+
+// 集計カウンタ（stats.ts）を実データで数え直してずれを補正する（取り込みの少ない深夜に実行）
+crons.daily("reconcile stats counters", { hourUTC: 18, minuteUTC: 0 }, internal.stats.reconcileStats, {});
+
+// リースの切れた処理中のページ（ワーカーが異常終了したもの）を pending に戻す
+crons.interval("release expired page leases", { minutes: 5 }, internal.pages.releaseExpiredLeases, {});
+
+export default crons;
@@ -1,5 +1,37 @@
-import { mutation, query } from "./_generated/server";
+import { mutation, MutationCtx, query } from "./_generated/server";
 import { v } from "convex/values";
+import { scheduleIndexDocuments, scheduleUnindexDocuments } from "./textIndex";
+import { adjustCounters, adjustSourceVersions, DOCUMENTS_TOTAL, readCounters, readSourceVersion } from "./stats";
+
+export const documentValidator = v.object({
+  text: v.string(),
+  embedding: v.array(v.float64()),
+  sourceUrl: v.string(),
+});
+
+// documentsへの追加と、それに伴うインデックス・集計カウンタの更新（pages:completeClaimedPage からも使う）
+export async function insertDocuments(
+  ctx: MutationCtx,
+  documents: { text: string; embedding: number[]; sourceUrl: string }[],
+) {
+  const results = [];
+  const createdAt = Date.now();
+
+  for (const doc of documents) {
+    const id = await ctx.db.insert("documents", {
+      text: doc.text,
+      embedding: doc.embedding,
+      sourceUrl: doc.sourceUrl,
+      createdAt,
+    });
+    results.push(id);
+  }
+  await scheduleIndexDocuments(ctx, results);
+  await adjustCounters(ctx, { [DOCUMENTS_TOTAL]: results.length });
+  await adjustSourceVersions(ctx, documents.map((doc) => ({ sourceUrl: doc.sourceUrl, createdAt })), 1);
+
+  return results;
+}
 
 // ベクトル化されたドキュメントを追加
 export const addDocument = mutation({
@@ -9,38 +41,61 @@ export const addDocument = mutation({
     sourceUrl: v.string(),
   },
   handler: async (ctx, args) => {
-    return await ctx.db.insert("documents", {
-      text: args.text,
-      embedding: args.embedding,
-      sourceUrl: args.sourceUrl,
-      createdAt: Date.now(),
-    });
+    const [id] = await insertDocuments(ctx, [args]);
+    return id;
   },
 });
 
 // 複数のドキュメントを一括追加
 export const addDocuments = mutation({
   args: {
-    documents: v.array(v.object({
-      text: v.string(),
-      embedding: v.array(v.float64()),
-      sourceUrl: v.string(),
-    })),
+    documents: v.array(documentValidator),
+  },
+  handler: async (ctx, args) => {
+    return await insertDocuments(ctx, args.documents);
+  },
+});
+
+// 指定したIDのドキュメントを一括削除（差分同期で変更・削除されたチャンク用）
+export const deleteDocuments = mutation({
+  args: {
+    ids: v.array(v.id("documents")),
+  },
+  handler: async (ctx, args) => {
+    const deleted = [];
+
+    for (const id of args.ids) {
+      const doc = await ctx.db.get(id);
+      if (doc) {
+        await ctx.db.delete(id);
+        deleted.push(doc);
+      }
+    }
+    await scheduleUnindexDocuments(ctx, deleted.map((doc) => doc._id));
+    await adjustCounters(ctx, { [DOCUMENTS_TOTAL]: -deleted.length });
+    await adjustSourceVersions(ctx, deleted, -1);
+
+    return deleted.length;
   },
+});
+
+// 特定のソースURLのドキュメントを全て削除（ページ自体は残す）
+export const deleteDocumentsBySourceUrl = mutation({
+  args: { sourceUrl: v.string() },
   handler: async (ctx, args) => {
-    const results = [];
-
-    for (const doc of args.documents) {
-      const id = await ctx.db.insert("documents", {
-        text: doc.text,
-        embedding: doc.embedding,
-        sourceUrl: doc.sourceUrl,
-        createdAt: Date.now(),
-      });
-      results.push(id);
+    const documents = await ctx.db
+      .query("documents")
+      .withIndex("by_source_url", (q) => q.eq("sourceUrl", args.sourceUrl))
+      .collect();
+
+    for (const doc of documents) {
+      await ctx.db.delete(doc._id);
     }
+    await scheduleUnindexDocuments(ctx, documents.map((doc) => doc._id));
+    await adjustCounters(ctx, { [DOCUMENTS_TOTAL]: -documents.length });
+    await adjustSourceVersions(ctx, documents, -1);
 
-    return results;
+    return documents.length;
   },
 });
 
@@ -62,10 +117,25 @@ export const getDocumentsBySourceUrl = query({
   },
 });
 
-// ドキュメント数を取得
+// ソースURLごとの件数と最終追加日時を取得（回答キャッシュの無効化判定用）
+// documents（埋め込みを含む）は読まず、source_versions の1行ずつを読む
+export const getSourceVersions = query({
+  args: { sourceUrls: v.array(v.string()) },
+  handler: async (ctx, args) => {
+    const versions = [];
+
+    for (const sourceUrl of args.sourceUrls) {
+      versions.push(await readSourceVersion(ctx, sourceUrl));
+    }
+
+    return versions;
+  },
+});
+
+// ドキュメント数を取得（集計カウンタから）
 export const getDocumentCount = query({
   handler: async (ctx) => {
-    const docs = await ctx.db.query("documents").collect();
-    return docs.length;
+    const counters = await readCounters(ctx);
+    return counters[DOCUMENTS_TOTAL] || 0;
   },
 });
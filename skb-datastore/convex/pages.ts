@@ -1,5 +1,20 @@
-import { mutation, query } from "./_generated/server";
+import { internalMutation, mutation, query } from "./_generated/server";
+import { internal } from "./_generated/api";
 import { v } from "convex/values";
+import { documentValidator, insertDocuments } from "./knowledge";
+import { adjustCounters, pageCounterDeltas, pageStatusCounter } from "./stats";
+
+// ストリーミング取り込み（process_pending_documents の streaming モード）
+// 1. getPendingPagesPage で pending ページのIDをcursorで少しずつ読む（本文は含めない）
+// 2. claimPages で status="processing" にしてリースを取る（取れたページだけ本文を返す）。
+//    複数のワーカーが同じ一覧を読んでも、取得できるのは1つのワーカーだけ
+// 3. completeClaimedPage でドキュメントの保存とstatusの更新を1つのトランザクションで行う。
+//    リースを失っていれば何も書かないので、同じページが二重に取り込まれない
+// 4. 一覧のcursorを saveIngestCheckpoint で保存し、再起動後はその位置から再開する
+// ワーカーが途中で止まったページはリースが切れたあと releaseExpiredLeases（crons.ts）で pending に戻る
+const DEFAULT_LEASE_MS = 10 * 60 * 1000;
+const MAX_LISTING_PAGE_SIZE = 100;
+const RELEASE_BATCH_SIZE = 500;
 
 // 新しいページをcrawled_pagesテーブルに追加
 export const addPage = mutation({
@@ -10,18 +25,21 @@ export const addPage = mutation({
   },
   handler: async (ctx, args) => {
     const now = Date.now();
+    const status = args.status || "pending";
 
-    return await ctx.db.insert("crawled_pages", {
+    const id = await ctx.db.insert("crawled_pages", {
       url: args.url,
       text: args.text,
-      status: args.status || "pending",
+      status,
       createdAt: now,
       updatedAt: now,
     });
+    await adjustCounters(ctx, pageCounterDeltas([status], 1));
+    return id;
   },
 });
 
-// status="pending"のページを取得
+// status="pending"のページを本文ごと全て取得（少量向け。大量のページはgetPendingPagesPageで読む）
 export const getPendingPages = query({
   handler: async (ctx) => {
     return await ctx.db
@@ -38,13 +56,172 @@ export const updatePageStatus = mutation({
     status: v.string(),
   },
   handler: async (ctx, args) => {
+    const page = await ctx.db.get(args.id);
+    if (page && page.status !== args.status) {
+      await adjustCounters(ctx, {
+        [pageStatusCounter(page.status)]: -1,
+        [pageStatusCounter(args.status)]: 1,
+      });
+    }
+
     return await ctx.db.patch(args.id, {
       status: args.status,
+      leaseOwner: undefined,
+      leaseExpiresAt: undefined,
       updatedAt: Date.now(),
     });
   },
 });
 
+// status="pending"のページのIDとURLを、cursorで少しずつ取得
+export const getPendingPagesPage = query({
+  args: {
+    cursor: v.union(v.string(), v.null()),
+    numItems: v.number(),
+  },
+  handler: async (ctx, args) => {
+    const result = await ctx.db
+      .query("crawled_pages")
+      .withIndex("by_status", (q) => q.eq("status", "pending"))
+      .paginate({
+        cursor: args.cursor,
+        numItems: Math.min(Math.max(1, args.numItems), MAX_LISTING_PAGE_SIZE),
+      });
+
+    return {
+      page: result.page.map((page) => ({ _id: page._id, url: page.url })),
+      continueCursor: result.continueCursor,
+      isDone: result.isDone,
+    };
+  },
+});
+
+// 指定したページのうち、まだpendingのものを status="processing" にしてリースを取り、本文を返す
+export const claimPages = mutation({
+  args: {
+    ids: v.array(v.id("crawled_pages")),
+    workerId: v.string(),
+    leaseMs: v.optional(v.number()),
+  },
+  handler: async (ctx, args) => {
+    const now = Date.now();
+    const claimed = [];
+
+    for (const id of args.ids) {
+      const page = await ctx.db.get(id);
+      if (!page || page.status !== "pending") continue; // 他のワーカーが取得済み・処理済み
+
+      await ctx.db.patch(id, {
+        status: "processing",
+        leaseOwner: args.workerId,
+        leaseExpiresAt: now + (args.leaseMs ?? DEFAULT_LEASE_MS),
+        updatedAt: now,
+      });
+      claimed.push({ _id: page._id, url: page.url, text: page.text });
+    }
+    await adjustCounters(ctx, {
+      [pageStatusCounter("pending")]: -claimed.length,
+      [pageStatusCounter("processing")]: claimed.length,
+    });
+
+    return claimed;
+  },
+});
+
+// リースを持つページのドキュメントを保存してstatusを更新する（status="pending" はリースの返却）
+export const completeClaimedPage = mutation({
+  args: {
+    id: v.id("crawled_pages"),
+    workerId: v.string(),
+    status: v.union(v.literal("processed"), v.literal("pending"), v.literal("error")),
+    documents: v.optional(v.array(documentValidator)),
+  },
+  handler: async (ctx, args) => {
+    const page = await ctx.db.get(args.id);
+    if (!page || page.status !== "processing" || page.leaseOwner !== args.workerId) {
+      // リースが切れて pending に戻された、または他のワーカーが取得し直した
+      return { completed: false, savedDocuments: 0 };
+    }
+
+    const saved = args.documents ? await insertDocuments(ctx, args.documents) : [];
+    await ctx.db.patch(args.id, {
+      status: args.status,
+      leaseOwner: undefined,
+      leaseExpiresAt: undefined,
+      updatedAt: Date.now(),
+    });
+    await adjustCounters(ctx, {
+      [pageStatusCounter("processing")]: -1,
+      [pageStatusCounter(args.status)]: 1,
+    });
+
+    return { completed: true, savedDocuments: saved.length };
+  },
+});
+
+// リースの切れた status="processing" のページを pending に戻す（crons.ts から定期実行）
+export const releaseExpiredLeases = internalMutation({
+  args: {},
+  handler: async (ctx) => {
+    const now = Date.now();
+    const expired = await ctx.db
+      .query("crawled_pages")
+      .withIndex("by_status_lease", (q) => q.eq("status", "processing").lt("leaseExpiresAt", now))
+      .take(RELEASE_BATCH_SIZE);
+
+    for (const page of expired) {
+      await ctx.db.patch(page._id, {
+        status: "pending",
+        leaseOwner: undefined,
+        leaseExpiresAt: undefined,
+        updatedAt: now,
+      });
+    }
+    await adjustCounters(ctx, {
+      [pageStatusCounter("processing")]: -expired.length,
+      [pageStatusCounter("pending")]: expired.length,
+    });
+
+    if (expired.length === RELEASE_BATCH_SIZE) {
+      await ctx.scheduler.runAfter(0, internal.pages.releaseExpiredLeases, {});
+    }
+    return expired.length;
+  },
+});
+
+// ワーカーごとの取り込みの再開位置を取得
+export const getIngestCheckpoint = query({
+  args: { name: v.string() },
+  handler: async (ctx, args) => {
+    const checkpoint = await ctx.db
+      .query("ingest_checkpoints")
+      .withIndex("by_name", (q) => q.eq("name", args.name))
+      .first();
+    return checkpoint ? { cursor: checkpoint.cursor, updatedAt: checkpoint.updatedAt } : null;
+  },
+});
+
+// ワーカーごとの取り込みの再開位置を保存（一覧を読み終えたら null を保存して先頭からに戻す）
+export const saveIngestCheckpoint = mutation({
+  args: {
+    name: v.string(),
+    cursor: v.union(v.string(), v.null()),
+  },
+  handler: async (ctx, args) => {
+    const checkpoint = await ctx.db
+      .query("ingest_checkpoints")
+      .withIndex("by_name", (q) => q.eq("name", args.name))
+      .first();
+
+    if (checkpoint) {
+      await ctx.db.patch(checkpoint._id, { cursor: args.cursor, updatedAt: Date.now() });
+    } else {
+      await ctx.db.insert("ingest_checkpoints", { name: args.name, cursor: args.cursor, updatedAt: Date.now() });
+    }
+    return null;
+  },
+});
+
 // 全てのページを取得（デバッグ用）
 export const getAllPages = query({
   handler: async (ctx) => {
@@ -6,11 +6,14 @@ export default defineSchema({
   crawled_pages: defineTable({
     url: v.string(),        // クロール対象URL
     text: v.string(),       // 抽出されたテキスト
-    status: v.string(),     // "pending" | "processed" | "error"
+    status: v.string(),     // "pending" | "processing" | "processed" | "error"
     createdAt: v.number(),  // 作成日時（Unix timestamp）
     updatedAt: v.number(),  // 更新日時（Unix timestamp）
+    leaseOwner: v.optional(v.string()),     // status="processing" のページを処理中のワーカー
+    leaseExpiresAt: v.optional(v.number()), // この時刻を過ぎたら pending に戻す（ワーカーの異常終了対策）
   })
     .index("by_status", ["status"])
+    .index("by_status_lease", ["status", "leaseExpiresAt"])
     .index("by_url", ["url"]),
 
   // ベクトル化されたドキュメントを保存するテーブル
@@ -25,4 +28,43 @@ export default defineSchema({
       dimensions: 768,
     })
     .index("by_source_url", ["sourceUrl"]),
+
+  // documents.text の文字bigram転置インデックス（searchByText用、textIndex.ts で更新）
+  text_index: defineTable({
+    gram: v.string(),              // 小文字化した2文字
+    docId: v.id("documents"),      // このbigramを含むドキュメント
+  })
+    .index("by_gram", ["gram"])
+    .index("by_doc", ["docId"]),
+
+  // 既存の documents からの text_index の構築の進捗（textIndex.ts、1行だけ）
+  text_index_state: defineTable({
+    cursor: v.union(v.string(), v.null()),   // documents の次に読む位置
+    complete: v.boolean(),                   // 構築前からある documents を全て索引に予約した
+    updatedAt: v.number(),
+  }),
+
+  // ストリーミング取り込みの進捗（ワーカーごとの pending ページ一覧のcursor）
+  ingest_checkpoints: defineTable({
+    name: v.string(),                        // ワーカー名
+    cursor: v.union(v.string(), v.null()),   // 次に読む位置（null は先頭から）
+    updatedAt: v.number(),
+  })
+    .index("by_name", ["name"]),
+
+  // sourceUrlごとの documents の件数と最終追加日時（knowledge:getSourceVersions 用、stats.ts で更新）
+  source_versions: defineTable({
+    sourceUrl: v.string(),
+    count: v.number(),             // このsourceUrlの documents の件数
+    latestCreatedAt: v.number(),   // 最後に documents が追加された日時（削除では戻さない）
+  })
+    .index("by_source_url", ["sourceUrl"]),
+
+  // crawled_pages・documents の行数の集計カウンタ（stats.ts で更新、admin:getStats で合計）
+  stats_counters: defineTable({
+    name: v.string(),              // "pages" | "pages:<status>" | "documents"
+    shard: v.number(),             // 同時更新の競合を避けるための分割番号
+    value: v.number(),
+  })
+    .index("by_name_shard", ["name", "shard"]),
 });
@@ -1,6 +1,16 @@
 import { action, query } from "./_generated/server";
 import { api } from "./_generated/api";
 import { v } from "convex/values";
+import { Doc } from "./_generated/dataModel";
+import { searchTextIndex } from "./textIndex";
+
+// searchByText・searchByTextPage の1件分（埋め込みは返さない）
+const toTextSearchResult = (doc: Doc<"documents">) => ({
+  id: doc._id,
+  text: doc.text,
+  sourceUrl: doc.sourceUrl,
+  createdAt: doc.createdAt,
+});
 
 // ベクトル類似度検索（Convex v1.24.8 対応）
 export const searchByEmbedding = action({
@@ -18,10 +28,14 @@ export const searchByEmbedding = action({
         limit: limit,
       });
 
-      // 各結果のドキュメント詳細を取得（Query経由）
+      // 全結果のドキュメント詳細を1回のQueryでまとめて取得（1件ずつ取得すると件数分の往復が直列に発生する）
+      const docs = await ctx.runQuery(api.search.getDocumentsByIds, {
+        ids: vectorResults.map((result) => result._id),
+      });
+
       const documents: any[] = [];
-      for (const result of vectorResults) {
-        const doc = await ctx.runQuery(api.search.getDocumentById, { id: result._id });
+      vectorResults.forEach((result, i) => {
+        const doc = docs[i];
         if (doc) {
           documents.push({
             id: result._id,
@@ -31,7 +45,7 @@ export const searchByEmbedding = action({
             score: result._score, // Convexが返すコサイン類似度スコア (-1 to 1)
           });
         }
-      }
+      });
 
       return documents;
 
@@ -46,6 +60,9 @@ export const searchByEmbedding = action({
 });
 
 // テキスト部分検索（フォールバック用）
+// bigram転置インデックスで候補を絞ってから本文で部分一致を確認する（全件走査しない）
+// 従来どおり配列を返す。1回で確認するdocument数には上限があるため、一致するものが残っていても
+// limit 件未満で返ることがある。続きや索引の構築状況が必要なときは searchByTextPage を使う
 export const searchByText = query({
   args: {
     searchText: v.string(),
@@ -53,20 +70,33 @@ export const searchByText = query({
   },
   handler: async (ctx, args) => {
     const limit = args.limit || 10;
-    const searchText = args.searchText.toLowerCase();
 
-    const allDocs = await ctx.db.query("documents").collect();
+    const { results } = await searchTextIndex(ctx, args.searchText, limit);
 
-    const matchingDocs = allDocs
-      .filter(doc => doc.text.toLowerCase().includes(searchText))
-      .slice(0, limit);
+    return results.map(toTextSearchResult);
+  },
+});
 
-    return matchingDocs.map(doc => ({
-      id: doc._id,
-      text: doc.text,
-      sourceUrl: doc.sourceUrl,
-      createdAt: doc.createdAt,
-    }));
+// searchByText のページ版。isDone=false のときは continueCursor を渡して続きを検索する
+// indexComplete=false の間は、構築前からある documents が結果に含まれないことがある
+export const searchByTextPage = query({
+  args: {
+    searchText: v.string(),
+    limit: v.optional(v.number()),
+    cursor: v.optional(v.union(v.string(), v.null())),
+  },
+  handler: async (ctx, args) => {
+    const limit = args.limit || 10;
+
+    const { results, isDone, continueCursor, indexComplete } =
+      await searchTextIndex(ctx, args.searchText, limit, args.cursor ?? null);
+
+    return {
+      results: results.map(toTextSearchResult),
+      isDone,
+      continueCursor,
+      indexComplete,
+    };
   },
 });
 
@@ -78,6 +108,22 @@ export const getDocumentById = query({
   },
 });
 
+// ヘルパー: 複数IDのドキュメントをまとめて取得（順序はidsと同じ、削除済みはnull）
+// 埋め込みは返さない（768次元×件数分の転送を避ける）
+export const getDocumentsByIds = query({
+  args: { ids: v.array(v.id("documents")) },
+  handler: async (ctx, args) => {
+    const docs = await Promise.all(args.ids.map((id) => ctx.db.get(id)));
+
+    return docs.map((doc) => doc && {
+      id: doc._id,
+      text: doc.text,
+      sourceUrl: doc.sourceUrl,
+      createdAt: doc.createdAt,
+    });
+  },
+});
+
 // ヘルパー: フォールバック用ドキュメント取得
 export const getFallbackDocuments = query({
   args: { limit: v.number() },
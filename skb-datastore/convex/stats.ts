@@ -0,0 +1,231 @@
+import { internalMutation, mutation, MutationCtx, QueryCtx } from "./_generated/server";
+import { internal } from "./_generated/api";
+import { v } from "convex/values";
+
+// 行数の集計カウンタ（admin:getStats 用）
+// crawled_pages・documents（768次元の埋め込みを含む）を全件 collect して数える代わりに、
+// 追加・statusの変更・削除を行う各mutationで stats_counters を増減する。
+// 並行するmutation（複数の取り込みワーカーなど）が同じ行を書いて競合しないよう、
+// カウンタごとに STATS_SHARDS 行へ分散して加算し、読むときに合計する。
+// カウンタを通さない変更（ダッシュボードでの直接編集など）によるずれは reconcileStats で実データから数え直す。
+// あわせて、sourceUrlごとの版（source_versions: 件数と最終追加日時）も documents の追加・削除で更新する。
+
+const STATS_SHARDS = 8;
+// 数え直しの1回のmutationで読む行数（documentsは埋め込みを含み、読み取り量の上限に達しやすい）
+const RECONCILE_BATCH_SIZE = 200;
+
+export const PAGES_TOTAL = "pages";
+export const DOCUMENTS_TOTAL = "documents";
+// 最後に数え直しが完了した日時（shard 0 の1行だけ。これがないうちはカウンタが既存の行を数えていない）
+export const RECONCILED_AT = "reconciledAt";
+
+export function pageStatusCounter(status: string) {
+  return `pages:${status}`;
+}
+
+// ページの追加（sign=1）・削除（sign=-1）に対応するカウンタの増減
+export function pageCounterDeltas(statuses: string[], sign: 1 | -1): Record<string, number> {
+  const deltas: Record<string, number> = { [PAGES_TOTAL]: sign * statuses.length };
+  for (const status of statuses) {
+    const name = pageStatusCounter(status);
+    deltas[name] = (deltas[name] || 0) + sign;
+  }
+  return deltas;
+}
+
+export async function adjustCounters(ctx: MutationCtx, deltas: Record<string, number>) {
+  for (const [name, delta] of Object.entries(deltas)) {
+    if (delta === 0) continue;
+    const shard = Math.floor(Math.random() * STATS_SHARDS);
+    const counter = await ctx.db
+      .query("stats_counters")
+      .withIndex("by_name_shard", (q) => q.eq("name", name).eq("shard", shard))
+      .first();
+
+    if (counter) {
+      await ctx.db.patch(counter._id, { value: counter.value + delta });
+    } else {
+      await ctx.db.insert("stats_counters", { name, shard, value: delta });
+    }
+  }
+}
+
+// 全カウンタの合計値（行数はカウンタの種類 × STATS_SHARDS なのでコーパスの大きさに依存しない）
+export async function readCounters(ctx: QueryCtx): Promise<Record<string, number>> {
+  const totals: Record<string, number> = {};
+  for await (const counter of ctx.db.query("stats_counters")) {
+    totals[counter.name] = (totals[counter.name] || 0) + counter.value;
+  }
+  return totals;
+}
+
+type SourceVersion = { sourceUrl: string; count: number; latestCreatedAt: number };
+
+async function sourceVersionRow(ctx: QueryCtx, sourceUrl: string) {
+  return await ctx.db
+    .query("source_versions")
+    .withIndex("by_source_url", (q) => q.eq("sourceUrl", sourceUrl))
+    .first();
+}
+
+// documents を数えて版を求める（source_versions の行がまだないsourceUrl用。documentsがなければ読む行もない）
+async function countSourceDocuments(ctx: QueryCtx, sourceUrl: string): Promise<SourceVersion> {
+  const version = { sourceUrl, count: 0, latestCreatedAt: 0 };
+  for await (const doc of ctx.db.query("documents").withIndex("by_source_url", (q) => q.eq("sourceUrl", sourceUrl))) {
+    version.count += 1;
+    version.latestCreatedAt = Math.max(version.latestCreatedAt, doc.createdAt);
+  }
+  return version;
+}
+
+export async function readSourceVersion(ctx: QueryCtx, sourceUrl: string): Promise<SourceVersion> {
+  const row = await sourceVersionRow(ctx, sourceUrl);
+  return row
+    ? { sourceUrl, count: row.count, latestCreatedAt: row.latestCreatedAt }
+    : await countSourceDocuments(ctx, sourceUrl);
+}
+
+async function writeSourceVersion(ctx: MutationCtx, version: SourceVersion) {
+  const row = await sourceVersionRow(ctx, version.sourceUrl);
+  if (!row) {
+    await ctx.db.insert("source_versions", version);
+  } else if (row.count !== version.count || row.latestCreatedAt !== version.latestCreatedAt) {
+    await ctx.db.patch(row._id, { count: version.count, latestCreatedAt: version.latestCreatedAt });
+  }
+}
+
+// documents の追加（sign=1）・削除（sign=-1）を source_versions に反映する（documentsを書いたあとに呼ぶ）
+// latestCreatedAt は削除では戻さないので、追加・削除のどちらでも (count, latestCreatedAt) の組が変わる
+export async function adjustSourceVersions(
+  ctx: MutationCtx,
+  documents: { sourceUrl: string; createdAt: number }[],
+  sign: 1 | -1,
+) {
+  const changes = new Map<string, { delta: number; latestCreatedAt: number }>();
+  for (const doc of documents) {
+    const change = changes.get(doc.sourceUrl) ?? { delta: 0, latestCreatedAt: 0 };
+    change.delta += sign;
+    if (sign > 0) change.latestCreatedAt = Math.max(change.latestCreatedAt, doc.createdAt);
+    changes.set(doc.sourceUrl, change);
+  }
+
+  for (const [sourceUrl, change] of changes) {
+    const row = await sourceVersionRow(ctx, sourceUrl);
+    if (row) {
+      await ctx.db.patch(row._id, {
+        count: row.count + change.delta,
+        latestCreatedAt: Math.max(row.latestCreatedAt, change.latestCreatedAt),
+      });
+    } else {
+      // 導入前からあるsourceUrl: 今回の変更を反映済みの documents から数える（sourceUrlごとに初回のみ）
+      await ctx.db.insert("source_versions", await countSourceDocuments(ctx, sourceUrl));
+    }
+  }
+}
+
+// 実データを少しずつ数え、最後にカウンタを数えた値で置き換える
+// 数え直しの途中に行われた追加・削除の分はずれうるので、書き込みの少ない時間帯に実行する（crons.ts）
+// documents は by_source_url の順に読み、sourceUrlの切れ目ごとに source_versions も数えた値で置き換える
+export const reconcileStats = internalMutation({
+  args: {
+    table: v.optional(v.union(v.literal("crawled_pages"), v.literal("documents"))),
+    cursor: v.optional(v.union(v.string(), v.null())),
+    counts: v.optional(v.record(v.string(), v.number())),
+    source: v.optional(v.union(
+      v.object({ sourceUrl: v.string(), count: v.number(), latestCreatedAt: v.number() }),
+      v.null(),
+    )),
+  },
+  handler: async (ctx, args) => {
+    const table = args.table ?? "crawled_pages";
+    const counts = { ...(args.counts ?? {}) };
+    const paginationOpts = { numItems: RECONCILE_BATCH_SIZE, cursor: args.cursor ?? null };
+    let batch: { page: unknown[]; continueCursor: string; isDone: boolean };
+    // 数えている途中のsourceUrl（バッチをまたいで引き継ぐ）
+    let source: SourceVersion | null = args.source ? { ...args.source } : null;
+
+    if (table === "crawled_pages") {
+      const pages = await ctx.db.query("crawled_pages").paginate(paginationOpts);
+      for (const [name, delta] of Object.entries(pageCounterDeltas(pages.page.map((page) => page.status), 1))) {
+        counts[name] = (counts[name] || 0) + delta;
+      }
+      batch = pages;
+    } else {
+      const documents = await ctx.db.query("documents").withIndex("by_source_url").paginate(paginationOpts);
+      counts[DOCUMENTS_TOTAL] = (counts[DOCUMENTS_TOTAL] || 0) + documents.page.length;
+      for (const doc of documents.page) {
+        if (source && source.sourceUrl === doc.sourceUrl) {
+          source.count += 1;
+          source.latestCreatedAt = Math.max(source.latestCreatedAt, doc.createdAt);
+          continue;
+        }
+        if (source) await writeSourceVersion(ctx, source);
+        source = { sourceUrl: doc.sourceUrl, count: 1, latestCreatedAt: doc.createdAt };
+      }
+      if (documents.isDone && source) await writeSourceVersion(ctx, source);
+      batch = documents;
+    }
+
+    if (!batch.isDone) {
+      await ctx.scheduler.runAfter(0, internal.stats.reconcileStats, {
+        table,
+        cursor: batch.continueCursor,
+        counts,
+        source,
+      });
+      return { table, counted: batch.page.length, isDone: false };
+    }
+    if (table === "crawled_pages") {
+      await ctx.scheduler.runAfter(0, internal.stats.reconcileStats, { table: "documents", cursor: null, counts });
+      return { table, counted: batch.page.length, isDone: false };
+    }
+
+    // 数えた値との差分を加える（存在しなくなったstatusのカウンタは0になる）
+    const current = await readCounters(ctx);
+    const deltas: Record<string, number> = {};
+    for (const name of new Set([...Object.keys(current), ...Object.keys(counts)])) {
+      if (name === RECONCILED_AT) continue;
+      deltas[name] = (counts[name] || 0) - (current[name] || 0);
+    }
+    await adjustCounters(ctx, deltas);
+
+    const marker = await ctx.db
+      .query("stats_counters")
+      .withIndex("by_name_shard", (q) => q.eq("name", RECONCILED_AT).eq("shard", 0))
+      .first();
+    if (marker) {
+      await ctx.db.patch(marker._id, { value: Date.now() });
+    } else {
+      await ctx.db.insert("stats_counters", { name: RECONCILED_AT, shard: 0, value: Date.now() });
+    }
+
+    const drift = Object.fromEntries(Object.entries(deltas).filter(([, delta]) => delta !== 0));
+    if (Object.keys(drift).length > 0) {
+      console.log(`[WARN] reconcileStats: corrected counter drift ${JSON.stringify(drift)}`);
+    }
+    return { table, counted: batch.page.length, isDone: true, drift };
+  },
+});
+
+// 数え直しを開始する（ずれが疑われるときに手動で実行）
+export const startStatsReconcile = mutation({
+  handler: async (ctx) => {
+    await ctx.scheduler.runAfter(0, internal.stats.reconcileStats, {});
+    return { scheduledAt: Date.now() };
+  },
+});
+
+// まだ一度も数え直していなければ数え直しを開始する（npm run build でデプロイの直後に実行し、既存の行を数えさせる）
+export const seedStatsCounters = mutation({
+  handler: async (ctx) => {
+    const marker = await ctx.db
+      .query("stats_counters")
+      .withIndex("by_name_shard", (q) => q.eq("name", RECONCILED_AT).eq("shard", 0))
+      .first();
+    if (marker) {
+      return { scheduled: false, reconciledAt: marker.value };
+    }
+    await ctx.scheduler.runAfter(0, internal.stats.reconcileStats, {});
+    return { scheduled: true, reconciledAt: null };
+  },
+});
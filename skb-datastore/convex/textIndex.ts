@@ -0,0 +1,292 @@
+import { internalMutation, mutation, MutationCtx, QueryCtx } from "./_generated/server";
+import { internal } from "./_generated/api";
+import { Doc, Id } from "./_generated/dataModel";
+import { v } from "convex/values";
+
+// 文字bigramの転置インデックス（searchByText用）
+// Convexの searchIndex は空白・句読点で単語分割するため、分かち書きのない日本語の部分一致には使えない。
+// 各documentの小文字化したテキストの bigram ごとに text_index へ (gram, docId) を1行保存する。
+// 1チャンクで数百行になるため、documentsの追加・削除とは別のmutationでスケジュールして更新する。
+// 更新が追いつくまでの間も、検索結果は本文で確認するので誤った結果は返さない（未反映の追加分が漏れるだけ）。
+
+// これより多くのdocumentに現れるbigramは絞り込みに使わない（「です」「ます」など）
+export const MAX_POSTINGS_PER_GRAM = 1000;
+// 1回の検索でpostingを読むbigramの上限。長い質問でも読み取りが (MAX_POSTINGS_PER_GRAM + 1) × この数に収まるよう、
+// 検索語のbigramから間隔をあけて選ぶ（候補は本文で確認するので、読まないbigramがあっても誤った結果は返さない）
+export const MAX_PROBED_GRAMS = 6;
+// 候補がこの件数以下に絞れたら、残りのbigramは読まない
+const ENOUGH_CANDIDATES = 20;
+// 1回の検索で本文を確認するdocumentの上限（documentsは埋め込みを含み、クエリの読み取り上限に達しやすい）
+// 上限に達したら continueCursor を返し、続きは次の呼び出しで確認する
+export const MAX_VERIFIED_DOCUMENTS = 500;
+// 1回のmutationで書き込むpostingの上限（mutationの書き込み件数の上限対策）
+const MAX_POSTING_WRITES = 4000;
+// 既存の documents からの構築で1回に予約するdocument数
+const BACKFILL_BATCH_SIZE = 5;
+// 構築の進捗がこの時間更新されていなければ、止まったものとして保存済みの位置から再開する
+const BACKFILL_STALE_MS = 10 * 60 * 1000;
+
+export function toBigrams(text: string): string[] {
+  const chars = Array.from(text.toLowerCase());
+  const grams = new Set<string>();
+  for (let i = 0; i + 1 < chars.length; i++) {
+    const gram = chars[i] + chars[i + 1];
+    if (gram.trim().length === 2) {
+      grams.add(gram);
+    }
+  }
+  return [...grams];
+}
+
+// documentsの追加・削除後にインデックスの更新を予約する（knowledge.ts・admin.ts の各mutationから）
+export async function scheduleIndexDocuments(ctx: MutationCtx, ids: Id<"documents">[]) {
+  if (ids.length > 0) {
+    await ctx.scheduler.runAfter(0, internal.textIndex.indexDocuments, { ids });
+  }
+}
+
+export async function scheduleUnindexDocuments(ctx: MutationCtx, ids: Id<"documents">[]) {
+  if (ids.length > 0) {
+    await ctx.scheduler.runAfter(0, internal.textIndex.unindexDocuments, { ids });
+  }
+}
+
+// 指定したdocumentのpostingを追加（書き込み上限を超える分は続きとして再スケジュール）
+export const indexDocuments = internalMutation({
+  args: { ids: v.array(v.id("documents")) },
+  handler: async (ctx, args) => {
+    let written = 0;
+
+    for (let i = 0; i < args.ids.length; i++) {
+      const doc = await ctx.db.get(args.ids[i]);
+      if (!doc) continue; // 索引前に削除された
+
+      const grams = toBigrams(doc.text);
+      if (written > 0 && written + grams.length > MAX_POSTING_WRITES) {
+        await scheduleIndexDocuments(ctx, args.ids.slice(i));
+        break;
+      }
+      for (const gram of grams) {
+        await ctx.db.insert("text_index", { gram, docId: doc._id });
+      }
+      written += grams.length;
+    }
+
+    return written;
+  },
+});
+
+// 削除したdocumentのpostingを削除（書き込み上限を超える分は続きとして再スケジュール）
+export const unindexDocuments = internalMutation({
+  args: { ids: v.array(v.id("documents")) },
+  handler: async (ctx, args) => {
+    let deleted = 0;
+
+    for (let i = 0; i < args.ids.length; i++) {
+      const postings = await ctx.db
+        .query("text_index")
+        .withIndex("by_doc", (q) => q.eq("docId", args.ids[i]))
+        .take(MAX_POSTING_WRITES - deleted);
+
+      for (const posting of postings) {
+        await ctx.db.delete(posting._id);
+      }
+      deleted += postings.length;
+
+      if (deleted >= MAX_POSTING_WRITES) {
+        await scheduleUnindexDocuments(ctx, args.ids.slice(i));
+        break;
+      }
+    }
+
+    return deleted;
+  },
+});
+
+export type TextSearchPage = {
+  results: Doc<"documents">[];
+  isDone: boolean;                // false なら continueCursor 以降に未確認のdocumentが残っている
+  continueCursor: string | null;
+  indexComplete: boolean;         // false なら構築前からある documents の索引が未完成で、一致するものが漏れうる
+};
+
+// 構築前からある documents を全て索引に予約済みか（1文字の検索語はインデックスを使わないので常に true）
+async function isIndexComplete(ctx: QueryCtx) {
+  const state = await ctx.db.query("text_index_state").first();
+  return state?.complete ?? false;
+}
+
+// 確認済みの位置（走査順の _creationTime と _id。候補の積集合を確認する場合は _id の順）
+type SearchPosition = { t: number; id: string };
+
+function spreadGrams(grams: string[], count: number): string[] {
+  if (grams.length <= count) return grams;
+  return Array.from({ length: count }, (_, i) => grams[Math.round((i * (grams.length - 1)) / (count - 1))]);
+}
+
+// 部分一致するdocumentを、インデックスで候補を絞ってから本文で確認して返す
+// limit 件そろうか MAX_VERIFIED_DOCUMENTS 件を確認した時点で止め、続きの位置を continueCursor で返す
+export async function searchTextIndex(
+  ctx: QueryCtx,
+  searchText: string,
+  limit: number,
+  cursor: string | null = null,
+): Promise<TextSearchPage> {
+  const needle = searchText.toLowerCase();
+  const grams = toBigrams(needle);
+  const after: SearchPosition | null = cursor ? JSON.parse(cursor) : null;
+  const isAfter = (t: number, id: string) => !after || t > after.t || (t === after.t && id > after.id);
+
+  const results: Doc<"documents">[] = [];
+  const seen = new Set<Id<"documents">>();
+  let position = after;
+  const verify = async (docId: Id<"documents">) => {
+    if (seen.has(docId)) return; // 索引の再構築中は同じpostingが重複しうる
+    seen.add(docId);
+    const doc = await ctx.db.get(docId);
+    if (doc && doc.text.toLowerCase().includes(needle)) {
+      results.push(doc);
+    }
+  };
+  const full = () => results.length >= limit || seen.size >= MAX_VERIFIED_DOCUMENTS;
+  const indexComplete = grams.length === 0 || await isIndexComplete(ctx);
+  const page = (isDone: boolean): TextSearchPage => ({
+    results,
+    isDone,
+    continueCursor: isDone ? null : JSON.stringify(position),
+    indexComplete,
+  });
+
+  if (grams.length === 0) {
+    // 1文字の検索語はインデックスを使えないので、作成順に確認する
+    const documents = ctx.db
+      .query("documents")
+      .withIndex("by_creation_time", (q) => q.gte("_creationTime", after?.t ?? 0));
+    for await (const doc of documents) {
+      if (!isAfter(doc._creationTime, doc._id)) continue;
+      position = { t: doc._creationTime, id: doc._id };
+      seen.add(doc._id);
+      if (doc.text.toLowerCase().includes(needle)) results.push(doc);
+      if (full()) return page(false);
+    }
+    return page(true);
+  }
+
+  // 出現documentが少ないbigramだけで候補を積集合にする（候補が十分に絞れたら残りのbigramは読まない）
+  let candidates: Set<Id<"documents">> | null = null;
+  for (const gram of spreadGrams(grams, MAX_PROBED_GRAMS)) {
+    const postings = await ctx.db
+      .query("text_index")
+      .withIndex("by_gram", (q) => q.eq("gram", gram))
+      .take(MAX_POSTINGS_PER_GRAM + 1);
+
+    if (postings.length === 0) {
+      return page(true);
+    }
+    if (postings.length > MAX_POSTINGS_PER_GRAM) continue;
+
+    const previous: Set<Id<"documents">> | null = candidates;
+    const ids = postings.map((posting) => posting.docId);
+    candidates = new Set(previous ? ids.filter((id) => previous.has(id)) : ids);
+    if (candidates.size <= ENOUGH_CANDIDATES) break;
+  }
+
+  if (candidates) {
+    for (const docId of [...candidates].sort()) {
+      if (!isAfter(0, docId)) continue;
+      position = { t: 0, id: docId };
+      await verify(docId);
+      if (full()) return page(false);
+    }
+    return page(true);
+  }
+
+  // 全てのbigramがありふれている場合は一致する割合も高いので、先頭のbigramのpostingを順に確認する
+  const postings = ctx.db
+    .query("text_index")
+    .withIndex("by_gram", (q) => q.eq("gram", grams[0]).gte("_creationTime", after?.t ?? 0));
+  for await (const posting of postings) {
+    if (!isAfter(posting._creationTime, posting._id)) continue;
+    position = { t: posting._creationTime, id: posting._id };
+    await verify(posting.docId);
+    if (full()) return page(false);
+  }
+  return page(true);
+}
+
+// documents の1ページ分の既存postingを消して索引を予約する（何度実行しても同じ結果になる）
+async function reindexDocumentsPage(ctx: MutationCtx, cursor: string | null) {
+  const documents = await ctx.db.query("documents").paginate({
+    numItems: BACKFILL_BATCH_SIZE,
+    cursor,
+  });
+
+  for (const doc of documents.page) {
+    const postings = await ctx.db
+      .query("text_index")
+      .withIndex("by_doc", (q) => q.eq("docId", doc._id))
+      .collect();
+    for (const posting of postings) {
+      await ctx.db.delete(posting._id);
+    }
+  }
+  await scheduleIndexDocuments(ctx, documents.page.map((doc) => doc._id));
+  return documents;
+}
+
+// 既存のdocumentsからインデックスを構築（手動で、isDone になるまでcursorを渡して繰り返す）
+export const buildTextIndexBatch = mutation({
+  args: { cursor: v.union(v.string(), v.null()) },
+  handler: async (ctx, args) => {
+    const documents = await reindexDocumentsPage(ctx, args.cursor);
+
+    return {
+      scheduledDocuments: documents.page.length,
+      continueCursor: documents.continueCursor,
+      isDone: documents.isDone,
+    };
+  },
+});
+
+// 既存のdocumentsからの構築を1ページ進め、続きを自分自身として予約する（最後まで進んだら complete にする）
+export const backfillTextIndex = internalMutation({
+  args: { cursor: v.union(v.string(), v.null()) },
+  handler: async (ctx, args) => {
+    const documents = await reindexDocumentsPage(ctx, args.cursor);
+    const cursor = documents.isDone ? null : documents.continueCursor;
+
+    const state = await ctx.db.query("text_index_state").first();
+    const fields = { cursor, complete: documents.isDone, updatedAt: Date.now() };
+    if (state) {
+      await ctx.db.patch(state._id, fields);
+    } else {
+      await ctx.db.insert("text_index_state", fields);
+    }
+    if (!documents.isDone) {
+      await ctx.scheduler.runAfter(0, internal.textIndex.backfillTextIndex, { cursor });
+    }
+    return { scheduledDocuments: documents.page.length, isDone: documents.isDone };
+  },
+});
+
+// まだ構築が済んでいなければ既存のdocumentsからの構築を開始する
+// npm run build でデプロイの直後に実行する。構築中なら何もせず、進捗が止まっていれば保存済みの位置から再開する
+export const startTextIndexBackfill = mutation({
+  handler: async (ctx) => {
+    const state = await ctx.db.query("text_index_state").first();
+    if (state?.complete) {
+      return { scheduled: false, complete: true };
+    }
+    if (state && Date.now() - state.updatedAt < BACKFILL_STALE_MS) {
+      return { scheduled: false, complete: false };
+    }
+    const cursor = state?.cursor ?? null;
+    if (state) {
+      await ctx.db.patch(state._id, { updatedAt: Date.now() });
+    } else {
+      await ctx.db.insert("text_index_state", { cursor, complete: false, updatedAt: Date.now() });
+    }
+    await ctx.scheduler.runAfter(0, internal.textIndex.backfillTextIndex, { cursor });
+    return { scheduled: true, complete: false };
+  },
+});
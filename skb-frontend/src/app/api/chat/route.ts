@@ -30,6 +30,181 @@ function checkRateLimit(clientId: string): boolean {
   return true;
 }
 
+// Semantic answer cache - in-memory per instance, like the rate limit store
+// 質問の埋め込みが近い過去の回答を再利用する（言い換えた同じ質問で翻訳・検索・生成を省略）
+const SEMANTIC_CACHE_TTL = Number(process.env.SEMANTIC_CACHE_TTL_MS || 10 * 60 * 1000); // 10 minutes
+const SEMANTIC_CACHE_MAX_ENTRIES = Number(process.env.SEMANTIC_CACHE_MAX_ENTRIES || 500);
+const SEMANTIC_CACHE_THRESHOLD = Number(process.env.SEMANTIC_CACHE_THRESHOLD || 0.95);
+
+type SourceVersion = { sourceUrl: string; count: number; latestCreatedAt: number };
+
+type CachedAnswer = {
+  embedding: number[];
+  norm: number;
+  answer: string;
+  relevantDocuments: number;
+  translatedQuestion?: string;
+  sourceVersions: SourceVersion[];
+  expiresAt: number;
+};
+
+// Mapは挿入順を保持するので、ヒット時に入れ直すことでLRUとして使う
+const answerCache = new Map<string, CachedAnswer>();
+let answerCacheSeq = 0;
+
+function vectorNorm(vector: number[]): number {
+  return Math.sqrt(vector.reduce((sum, x) => sum + x * x, 0));
+}
+
+function findCachedAnswer(embedding: number[]): { key: string; entry: CachedAnswer; similarity: number } | null {
+  const now = Date.now();
+  const norm = vectorNorm(embedding) || 1;
+  let best: { key: string; entry: CachedAnswer; similarity: number } | null = null;
+
+  for (const [key, entry] of answerCache) {
+    if (entry.expiresAt <= now) {
+      answerCache.delete(key);
+      continue;
+    }
+    let dot = 0;
+    for (let i = 0; i < embedding.length; i++) {
+      dot += embedding[i] * entry.embedding[i];
+    }
+    const similarity = dot / (norm * (entry.norm || 1));
+    if (similarity >= SEMANTIC_CACHE_THRESHOLD && (!best || similarity > best.similarity)) {
+      best = { key, entry, similarity };
+    }
+  }
+
+  if (best) {
+    answerCache.delete(best.key);
+    answerCache.set(best.key, best.entry);
+  }
+  return best;
+}
+
+function storeCachedAnswer(entry: Omit<CachedAnswer, 'norm' | 'expiresAt'>) {
+  while (answerCache.size >= SEMANTIC_CACHE_MAX_ENTRIES) {
+    const oldest = answerCache.keys().next().value;
+    if (oldest === undefined) break;
+    answerCache.delete(oldest);
+  }
+  answerCache.set(String(answerCacheSeq++), {
+    ...entry,
+    norm: vectorNorm(entry.embedding),
+    expiresAt: Date.now() + SEMANTIC_CACHE_TTL,
+  });
+}
+
+// 回答の根拠になったsourceUrlのdocumentsが追加・削除されていればキャッシュを無効とする
+async function getSourceVersions(client: ConvexHttpClient, sourceUrls: string[]): Promise<SourceVersion[]> {
+  if (sourceUrls.length === 0) return [];
+  const result = await (client as any).query('knowledge:getSourceVersions', { sourceUrls });
+  return result?.value || result || [];
+}
+
+function sameSourceVersions(a: SourceVersion[], b: SourceVersion[]): boolean {
+  return a.length === b.length && a.every((version, i) =>
+    version.sourceUrl === b[i]?.sourceUrl &&
+    version.count === b[i]?.count &&
+    version.latestCreatedAt === b[i]?.latestCreatedAt
+  );
+}
+
+// Query caches - translations and query embeddings, bounded LRU per instance
+// 同じ質問（完全一致）なら翻訳のLLM呼び出しと埋め込みを省略する。値にはPromiseを入れるので、
+// 同時に届いた同じ質問も1回の呼び出しを共有する（失敗したPromiseはすぐに取り除く）
+const QUERY_CACHE_MAX_ENTRIES = Number(process.env.QUERY_CACHE_MAX_ENTRIES || 1000);
+
+class LruCache<V> {
+  private readonly entries = new Map<string, V>();
+
+  constructor(private readonly maxEntries: number) {}
+
+  get(key: string): V | undefined {
+    const value = this.entries.get(key);
+    if (value !== undefined) {
+      this.entries.delete(key);
+      this.entries.set(key, value);
+    }
+    return value;
+  }
+
+  set(key: string, value: V) {
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    while (this.entries.size > this.maxEntries) {
+      const oldest = this.entries.keys().next().value;
+      if (oldest === undefined) break;
+      this.entries.delete(oldest);
+    }
+  }
+
+  delete(key: string) {
+    this.entries.delete(key);
+  }
+}
+
+const translationCache = new LruCache<Promise<string>>(QUERY_CACHE_MAX_ENTRIES);
+const queryEmbeddingCache = new LruCache<Promise<number[]>>(QUERY_CACHE_MAX_ENTRIES);
+
+function cached<V>(cache: LruCache<Promise<V>>, key: string, load: () => Promise<V>): Promise<V> {
+  let promise = cache.get(key);
+  if (!promise) {
+    promise = load();
+    cache.set(key, promise);
+    promise.catch(() => cache.delete(key));
+  }
+  return promise;
+}
+
+type SearchResult = { id: string; text: string; sourceUrl: string; score: number };
+
+// 元の質問と翻訳後の質問の検索結果を、同じdocumentは高い方のスコアで1件にまとめる
+function mergeSearchResults(resultSets: SearchResult[][], limit: number): SearchResult[] {
+  const merged = new Map<string, SearchResult>();
+  for (const results of resultSets) {
+    for (const result of results) {
+      const existing = merged.get(result.id);
+      if (!existing || result.score > existing.score) {
+        merged.set(result.id, result);
+      }
+    }
+  }
+  return [...merged.values()].sort((a, b) => b.score - a.score).slice(0, limit);
+}
+
+// Per-stage timing - exposed as a Server-Timing header and in the response body
+// 回答が遅いときに、翻訳・検索・生成のどこで時間を使ったかを quality_verification.py で集計する
+class StageTimer {
+  private readonly start = performance.now();
+  readonly stages: Record<string, number> = {};
+
+  async time<T>(stage: string, fn: () => Promise<T>): Promise<T> {
+    const started = performance.now();
+    try {
+      return await fn();
+    } finally {
+      this.stages[stage] = (this.stages[stage] || 0) + performance.now() - started;
+    }
+  }
+
+  summary(): Record<string, number> {
+    const rounded: Record<string, number> = {};
+    for (const [stage, ms] of Object.entries(this.stages)) {
+      rounded[stage] = Math.round(ms * 10) / 10;
+    }
+    rounded.total = Math.round((performance.now() - this.start) * 10) / 10;
+    return rounded;
+  }
+
+  header(): string {
+    return Object.entries(this.summary())
+      .map(([stage, ms]) => `${stage};dur=${ms}`)
+      .join(', ');
+  }
+}
+
 // Input sanitization
 function sanitizeInput(input: string): string {
   return input
@@ -48,11 +223,58 @@ async function getSystemStats(convexUrl: string) {
 }
 
 // RAG質問回答機能
-async function answerQuestionFromDocs(question: string, convexUrl: string, googleApiKey: string) {
+async function answerQuestionFromDocs(question: string, convexUrl: string, googleApiKey: string, timer: StageTimer) {
   console.log(`[INFO] RAG: Starting pipeline for question: "${question}"`);
 
   try {
-    // Step 1: 質問を日本語→英語に翻訳
+    const client = new ConvexHttpClient(convexUrl);
+    const embeddings = new GoogleGenerativeAIEmbeddings({
+      modelName: 'embedding-001',
+      apiKey: googleApiKey,
+    });
+
+    const embedQuery = (text: string) => cached(queryEmbeddingCache, text, async () => {
+      const embedding = await embeddings.embedQuery(text);
+      if (embedding.length !== 768) {
+        throw new Error(`Invalid embedding dimension: ${embedding.length}, expected 768`);
+      }
+      return embedding;
+    });
+    const search = async (embedding: number[]): Promise<SearchResult[]> => {
+      const searchResults = await (client as any).action('search:searchByEmbedding', { embedding, limit: 5 });
+      return searchResults?.value || searchResults || [];
+    };
+
+    // Step 0: 元の質問の埋め込みで回答キャッシュを検索（ヒットすれば翻訳・検索・生成を省略）
+    // この埋め込みは Step 1 の元の質問での検索にも使う
+    let cacheEmbedding: number[] | null = null;
+    try {
+      const queryEmbedding = await timer.time('cache_embed', () => embedQuery(question));
+      cacheEmbedding = queryEmbedding;
+      const cachedAnswer = findCachedAnswer(queryEmbedding);
+      if (cachedAnswer) {
+        const currentVersions = await timer.time('cache_check', () =>
+          getSourceVersions(client, cachedAnswer.entry.sourceVersions.map(v => v.sourceUrl))
+        );
+        if (sameSourceVersions(cachedAnswer.entry.sourceVersions, currentVersions)) {
+          console.log(`[INFO] RAG: Semantic cache hit (similarity ${cachedAnswer.similarity.toFixed(3)})`);
+          return {
+            success: true,
+            answer: cachedAnswer.entry.answer,
+            relevantDocuments: cachedAnswer.entry.relevantDocuments,
+            translatedQuestion: cachedAnswer.entry.translatedQuestion,
+            cached: true,
+          };
+        }
+        console.log('[INFO] RAG: Semantic cache entry invalidated (source documents changed)');
+        answerCache.delete(cachedAnswer.key);
+      }
+    } catch (cacheError) {
+      // キャッシュの失敗は回答生成を妨げない
+      console.error(`[WARN] RAG: Semantic cache lookup failed: ${cacheError instanceof Error ? cacheError.message : cacheError}`);
+    }
+
+    // Step 1: 質問を日本語→英語に翻訳し、その間に元の質問の埋め込みで先に検索しておく
     const genAI = new GoogleGenerativeAI(googleApiKey);
     const model = genAI.getGenerativeModel({ model: 'gemini-1.5-pro-latest' });
 
@@ -63,30 +285,59 @@ Provide only the English translation, no additional text or explanation.
 Japanese question: ${question}
 `;
 
-    const translationResult = await model.generateContent(translationPrompt);
-    const translatedQuestion = translationResult.response.text().trim();
-    console.log(`[INFO] RAG: Translated question: "${translatedQuestion}"`);
-
-    // Step 2: 翻訳された質問をベクトル化
-    const embeddings = new GoogleGenerativeAIEmbeddings({
-      modelName: 'embedding-001',
-      apiKey: googleApiKey,
-    });
-
-    const questionEmbedding = await embeddings.embedQuery(translatedQuestion);
-
-    if (questionEmbedding.length !== 768) {
-      throw new Error(`Invalid embedding dimension: ${questionEmbedding.length}, expected 768`);
+    const translation = timer.time('translate', () => cached(translationCache, question, async () => {
+      const translationResult = await model.generateContent(translationPrompt);
+      return translationResult.response.text().trim();
+    }));
+    // 元の質問での検索は、回答キャッシュの照会で得た埋め込みがあるときだけ翻訳と並行して先に行う
+    // 追加のコストはベクトル検索1回（埋め込みは再利用）で翻訳を待つ間に終わり、日本語のままのチャンクも拾える。
+    // 埋め込みがないときは先行せず、翻訳できなかったときだけ元の質問を埋め込んで検索する
+    const searchOriginal = () => timer.time('search_original', async () =>
+      search(cacheEmbedding || await embedQuery(question))
+    );
+    let originalSearch: Promise<SearchResult[]> | undefined = cacheEmbedding ? searchOriginal() : undefined;
+    // 翻訳が失敗したときに先行検索の失敗が未処理のrejectionにならないようにする（結果は Step 3 で受け取る）
+    originalSearch?.catch(() => undefined);
+
+    // 翻訳に失敗しても元の質問での検索で回答できるので、リクエスト全体は失敗させない
+    let translatedQuestion: string | undefined;
+    try {
+      translatedQuestion = await translation;
+      console.log(`[INFO] RAG: Translated question: "${translatedQuestion}"`);
+    } catch (translationError) {
+      console.error(`[WARN] RAG: Translation failed, using the original-language search only: ${translationError instanceof Error ? translationError.message : translationError}`);
     }
 
-    // Step 3: ベクトル類似度検索
-    const client = new ConvexHttpClient(convexUrl);
-    const searchResults = await (client as any).action('search:searchByEmbedding', {
-      embedding: questionEmbedding,
-      limit: 5,
-    });
-
-    const results = searchResults?.value || searchResults || [];
+    // Step 2: 翻訳された質問をベクトル化して検索（翻訳が元の質問と同じか失敗したときは元の質問での検索だけを使う）
+    const useTranslation = translatedQuestion !== undefined && translatedQuestion !== question;
+    if (!useTranslation) {
+      originalSearch ??= searchOriginal();
+    }
+    const translatedSearch = useTranslation
+      ? timer.time('embed', () => embedQuery(translatedQuestion as string))
+          .then((questionEmbedding) => timer.time('search', () => search(questionEmbedding)))
+      : Promise.resolve<SearchResult[]>([]);
+
+    // Step 3: 両方の検索結果をまとめる。片方が失敗しても、もう片方の結果で回答する（両方失敗したときだけ失敗させる）
+    const [originalOutcome, translatedOutcome] = await Promise.allSettled([
+      originalSearch ?? Promise.resolve<SearchResult[]>([]),
+      translatedSearch,
+    ]);
+    if (originalOutcome.status === 'rejected' && (translatedOutcome.status === 'rejected' || !useTranslation)) {
+      throw originalOutcome.reason;
+    }
+    if (translatedOutcome.status === 'rejected' && !originalSearch) {
+      throw translatedOutcome.reason;
+    }
+    for (const [label, outcome] of [['Original-language', originalOutcome], ['Translated', translatedOutcome]] as const) {
+      if (outcome.status === 'rejected') {
+        console.error(`[WARN] RAG: ${label} search failed, using the other search only: ${outcome.reason instanceof Error ? outcome.reason.message : outcome.reason}`);
+      }
+    }
+    const results = mergeSearchResults([
+      originalOutcome.status === 'fulfilled' ? originalOutcome.value : [],
+      translatedOutcome.status === 'fulfilled' ? translatedOutcome.value : [],
+    ], 5);
     console.log(`[DEBUG] RAG: Raw search results:`, results.length);
     if (results.length > 0) {
       console.log(`[DEBUG] RAG: First result score:`, results[0]?.score);
@@ -96,7 +347,7 @@ Japanese question: ${question}
     // スコア閾値を0.5に下げて試す
     const filteredResults = results
       .filter((result: {score: number}) => result.score >= 0.5)
-      .map((result: {id: string, text: string, sourceUrl: string, score: number}) => ({
+      .map((result: SearchResult) => ({
         id: result.id,
         text: result.text,
         sourceUrl: result.sourceUrl,
@@ -137,11 +388,27 @@ ${context}
 **回答:**
 `;
 
-    const answerResult = await model.generateContent(answerPrompt);
+    const answerResult = await timer.time('generate', () => model.generateContent(answerPrompt));
     const answer = answerResult.response.text().trim();
 
     console.log(`[SUCCESS] RAG: Generated answer (${answer.length} chars)`);
 
+    // 翻訳に失敗したときの回答は先行検索だけによるものなので、回答キャッシュには保存しない
+    if (cacheEmbedding && translatedQuestion !== undefined) {
+      try {
+        const sourceUrls = [...new Set<string>(filteredResults.map((result: {sourceUrl: string}) => result.sourceUrl))];
+        storeCachedAnswer({
+          embedding: cacheEmbedding,
+          answer,
+          relevantDocuments: filteredResults.length,
+          translatedQuestion,
+          sourceVersions: await timer.time('cache_store', () => getSourceVersions(client, sourceUrls)),
+        });
+      } catch (cacheError) {
+        console.error(`[WARN] RAG: Failed to store semantic cache entry: ${cacheError instanceof Error ? cacheError.message : cacheError}`);
+      }
+    }
+
     return {
       success: true,
       answer,
@@ -161,6 +428,8 @@ ${context}
 }
 
 export async function POST(request: NextRequest) {
+  const timer = new StageTimer();
+
   try {
     const body = await request.json();
     const { message, action = 'system_check' } = body;
@@ -204,47 +473,49 @@ export async function POST(request: NextRequest) {
 
     if (action === 'system_check') {
       // システム状態確認
-      const stats = await getSystemStats(convexUrl);
+      const stats = await timer.time('stats', () => getSystemStats(convexUrl));
 
       // Google AIでレスポンス生成
       process.env.GOOGLE_GENERATIVE_AI_API_KEY = googleApiKey;
       const model = google('gemini-1.5-pro-latest');
 
-      const { text } = await generateText({
+      const { text } = await timer.time('generate', () => generateText({
         model,
         prompt: `システム状態を報告してください。データベース統計: ${JSON.stringify(stats, null, 2)}`
-      });
+      }));
 
       return NextResponse.json({
         success: true,
         action: 'system_check',
         stats: stats,
         aiResponse: text,
-        message: 'System check completed successfully'
-      });
+        message: 'System check completed successfully',
+        timings: timer.summary(),
+      }, { headers: { 'Server-Timing': timer.header() } });
 
     } else if (action === 'simple_chat') {
       // シンプルなチャット機能
       process.env.GOOGLE_GENERATIVE_AI_API_KEY = googleApiKey;
       const model = google('gemini-1.5-pro-latest');
 
-      const { text } = await generateText({
+      const { text } = await timer.time('generate', () => generateText({
         model,
         prompt: `ユーザーからの質問: ${sanitizedMessage}\n\n簡潔に答えてください。`
-      });
+      }));
 
       return NextResponse.json({
         success: true,
         action: 'simple_chat',
         userMessage: sanitizedMessage,
-        aiResponse: text
-      });
+        aiResponse: text,
+        timings: timer.summary(),
+      }, { headers: { 'Server-Timing': timer.header() } });
 
     } else if (action === 'rag_search') {
       // RAG検索・回答生成
       console.log('RAG search requested for:', sanitizedMessage);
 
-      const ragResult = await answerQuestionFromDocs(sanitizedMessage, convexUrl, googleApiKey);
+      const ragResult = await answerQuestionFromDocs(sanitizedMessage, convexUrl, googleApiKey, timer);
 
       return NextResponse.json({
         success: ragResult.success,
@@ -253,8 +524,10 @@ export async function POST(request: NextRequest) {
         aiResponse: ragResult.answer,
         relevantDocuments: ragResult.relevantDocuments,
         translatedQuestion: ragResult.translatedQuestion,
+        cached: ragResult.cached || false,
         error: ragResult.error,
-      });
+        timings: timer.summary(),
+      }, { headers: { 'Server-Timing': timer.header() } });
 
     } else {
       return NextResponse.json({
@@ -270,6 +543,6 @@ export async function POST(request: NextRequest) {
       success: false,
       error: 'Chat API failed',
       details: error instanceof Error ? error.message : 'Unknown error'
-    }, { status: 500 });
+    }, { status: 500, headers: { 'Server-Timing': timer.header() } });
   }
 }
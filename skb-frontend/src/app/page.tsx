@@ -227,7 +227,7 @@ export default function Home() {
                       </svg>
                     </div>
                     <div className="ml-3">
-                      <p className="text-sm text-red-800 dark:text-red-200">
+                      <p data-testid="error" className="text-sm text-red-800 dark:text-red-200">
                         {error}
                       </p>
                     </div>
@@ -236,7 +236,7 @@ export default function Home() {
               )}
 
               {processingStep && (
-                <div className="bg-blue-50 dark:bg-blue-900/20 border border-blue-200 dark:border-blue-800 rounded-md p-3">
+                <div data-testid="loading" className="bg-blue-50 dark:bg-blue-900/20 border border-blue-200 dark:border-blue-800 rounded-md p-3">
                   <div className="flex items-center">
                     <svg className="animate-spin -ml-1 mr-3 h-5 w-5 text-blue-500" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24">
                       <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4"></circle>
@@ -316,7 +316,7 @@ export default function Home() {
                 )}
               </div>
               <div className="prose dark:prose-invert max-w-none">
-                <p className="whitespace-pre-wrap text-gray-700 dark:text-gray-300">
+                <p data-testid="response" className="whitespace-pre-wrap text-gray-700 dark:text-gray-300">
                   {response}
                 </p>
               </div>
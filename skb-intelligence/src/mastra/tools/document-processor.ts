@@ -1,7 +1,7 @@
 import { createTool } from '@mastra/core/tools';
 import { z } from 'zod';
 import { RecursiveCharacterTextSplitter } from '@langchain/textsplitters';
-import { GoogleGenerativeAIEmbeddings } from '@langchain/google-genai';
+import { EmbeddingScheduler, googleBatchEmbedder } from '../../utils/embedding-scheduler';
 
 // ConvexClient utility
 const ConvexClient = {
@@ -50,6 +50,9 @@ const ConvexClient = {
   },
 };
 
+// Convex HTTP APIのレスポンス（{status, value}）から値を取り出す
+const unwrap = (result: any) => (result && typeof result === 'object' && 'value' in result ? result.value : result);
+
 // pending状態のドキュメントを処理するツール
 export const processPendingDocuments = createTool({
   id: 'process_pending_documents',
@@ -57,7 +60,13 @@ export const processPendingDocuments = createTool({
   inputSchema: z.object({
     chunkSize: z.number().min(100).max(2000).default(1000).describe('テキストチャンクのサイズ（文字数）'),
     chunkOverlap: z.number().min(0).max(500).default(200).describe('チャンク間のオーバーラップ（文字数）'),
-    batchSize: z.number().min(1).max(10).default(5).describe('一度に処理するページ数'),
+    batchSize: z.number().min(1).max(100).default(5).describe('一度に処理するページ数（streaming でなければ、リースを取れた先頭の batchSize 件だけ処理する）'),
+    embeddingConcurrency: z.number().min(1).max(16).default(4).describe('同時に送信する埋め込みリクエスト数'),
+    embeddingRequestsPerMinute: z.number().min(1).default(150).describe('埋め込みAPIのリクエスト数クォータ（1分あたり）'),
+    streaming: z.boolean().default(false).describe('pendingページをcursorで batchSize 件ずつ読み、リースを取って全て処理する（複数ワーカーでの並行実行・中断後の再開に対応。失敗してpendingに戻したページがあった回は、次回を先頭から読み直す）'),
+    workerId: z.string().default('default').describe('ワーカー名（リースの持ち主名と、streaming時の再開位置の保存先）'),
+    leaseMinutes: z.number().min(1).max(120).default(10).describe('ページのリース期間（分）'),
+    maxPages: z.number().min(1).optional().describe('streaming時に1回の実行で処理するページ数の上限'),
   }),
   outputSchema: z.object({
     success: z.boolean(),
@@ -75,9 +84,19 @@ export const processPendingDocuments = createTool({
     })),
   }),
   execute: async ({ context }) => {
-    const { chunkSize, chunkOverlap, batchSize } = context;
-
-    console.log(`[INFO] process_pending_documents: Starting document processing (chunkSize: ${chunkSize}, overlap: ${chunkOverlap}, batch: ${batchSize})`);
+    const {
+      chunkSize,
+      chunkOverlap,
+      batchSize,
+      embeddingConcurrency,
+      embeddingRequestsPerMinute,
+      streaming,
+      workerId,
+      leaseMinutes,
+      maxPages,
+    } = context;
+
+    console.log(`[INFO] process_pending_documents: Starting document processing (chunkSize: ${chunkSize}, overlap: ${chunkOverlap}, batch: ${batchSize}, streaming: ${streaming})`);
 
     const errors: string[] = [];
     const processingDetails: Array<{pageId: string; url: string; chunksCreated: number; status: string}> = [];
@@ -85,45 +104,44 @@ export const processPendingDocuments = createTool({
     let savedDocuments = 0;
 
     try {
-      // 1. pending状態のページを取得
-      console.log('[INFO] process_pending_documents: Fetching pending pages');
-      const pendingPagesResult = await ConvexClient.query('pages:getPendingPages');
-      const pendingPages = pendingPagesResult?.value || pendingPagesResult || [];
-
-      if (pendingPages.length === 0) {
-        console.log('[INFO] process_pending_documents: No pending pages found');
-        return {
-          success: true,
-          processedPages: 0,
-          totalChunks: 0,
-          savedDocuments: 0,
-          skippedPages: 0,
-          errors: [],
-          message: 'No pending pages to process',
-          processingDetails: [],
-        };
-      }
-
-      console.log(`[INFO] process_pending_documents: Found ${pendingPages.length} pending pages`);
-
-      // 2. LangChain Text Splitter初期化
+      // 1. LangChain Text Splitter初期化
       const textSplitter = new RecursiveCharacterTextSplitter({
         chunkSize,
         chunkOverlap,
         separators: ['\n\n', '\n', ' ', ''],
       });
 
-      // 3. Google Embeddings初期化
-      const embeddings = new GoogleGenerativeAIEmbeddings({
-        modelName: 'embedding-001',
-        apiKey: process.env.GOOGLE_GENERATIVE_AI_API_KEY,
+      // 2. 埋め込みスケジューラ初期化（チャンクを複数入力のリクエストにまとめ、同時実行数とレートを制限）
+      const scheduler = new EmbeddingScheduler(googleBatchEmbedder(), {
+        maxInFlight: embeddingConcurrency,
+        requestsPerMinute: embeddingRequestsPerMinute,
       });
 
-      // 4. バッチ処理
-      const pagesToProcess = pendingPages.slice(0, batchSize);
-      console.log(`[INFO] process_pending_documents: Processing ${pagesToProcess.length} pages in this batch`);
+      // ページごとの埋め込みは並行に進め、Convexへの保存は順に行う（あるページの保存中に次のページの埋め込みが進む）
+      let writeQueue: Promise<void> = Promise.resolve();
+
+      // どちらのモードでもリースを取れたページだけを処理する（streaming のワーカーと同時に実行しても重複しない）
+      const leaseOwner = `${workerId}-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`;
+      const leaseMs = leaseMinutes * 60 * 1000;
+
+      // リースを持つページのドキュメント保存とstatus更新を1回のmutationで行う
+      // 保存できたら true、リースを失っていて保存しなかったら false を返す
+      const saveClaimed = async (page: any, documents: Array<{text: string; embedding: number[]; sourceUrl: string}>) => {
+        const result = unwrap(await ConvexClient.mutation('pages:completeClaimedPage', {
+          id: page._id,
+          workerId: leaseOwner,
+          status: 'processed',
+          documents,
+        }));
+        return Boolean(result?.completed);
+      };
+
+      const processPage = async (page: any): Promise<string> => {
+        const record = (chunksCreated: number, status: string) => {
+          processingDetails.push({ pageId: page._id, url: page.url, chunksCreated, status });
+          return status;
+        };
 
-      for (const page of pagesToProcess) {
         try {
           console.log(`[INFO] process_pending_documents: Processing page ${page.url} (ID: ${page._id})`);
 
@@ -133,93 +151,138 @@ export const processPendingDocuments = createTool({
 
           if (chunks.length === 0) {
             console.log(`[WARN] process_pending_documents: No chunks created for ${page.url}, skipping`);
-            processingDetails.push({
-              pageId: page._id,
-              url: page.url,
-              chunksCreated: 0,
-              status: 'skipped_no_chunks',
-            });
-            continue;
+            return record(0, 'skipped_no_chunks');
           }
 
-          // 各チャンクをベクトル化
-          const documents: Array<{text: string; embedding: number[]; sourceUrl: string}> = [];
-
-          for (let i = 0; i < chunks.length; i++) {
-            const chunk = chunks[i];
-            console.log(`[INFO] process_pending_documents: Embedding chunk ${i + 1}/${chunks.length} for ${page.url}`);
-
-            try {
-              const embeddingVector = await embeddings.embedQuery(chunk);
-
-              // 768次元チェック
-              if (embeddingVector.length !== 768) {
-                throw new Error(`Invalid embedding dimension: ${embeddingVector.length}, expected 768`);
-              }
-
-              documents.push({
-                text: chunk,
-                embedding: embeddingVector,
-                sourceUrl: page.url,
-              });
-
-            } catch (embeddingError) {
-              const errorMsg = embeddingError instanceof Error ? embeddingError.message : 'Unknown embedding error';
-              console.error(`[ERROR] process_pending_documents: Embedding failed for chunk ${i + 1} of ${page.url}: ${errorMsg}`);
-              errors.push(`Embedding failed for chunk ${i + 1} of ${page.url}: ${errorMsg}`);
-            }
+          // ページの全チャンクをまとめてベクトル化
+          let vectors: number[][];
+          try {
+            vectors = await scheduler.embed(chunks);
+          } catch (embeddingError) {
+            const errorMsg = embeddingError instanceof Error ? embeddingError.message : 'Unknown embedding error';
+            console.error(`[ERROR] process_pending_documents: Embedding failed for ${page.url}: ${errorMsg}`);
+            errors.push(`Embedding failed for ${page.url}: ${errorMsg}`);
+            return record(chunks.length, 'failed_embeddings');
           }
 
-          if (documents.length === 0) {
-            console.log(`[WARN] process_pending_documents: No valid embeddings created for ${page.url}`);
-            processingDetails.push({
-              pageId: page._id,
-              url: page.url,
-              chunksCreated: chunks.length,
-              status: 'failed_embeddings',
-            });
-            continue;
-          }
+          const documents = chunks.map((chunk, i) => ({
+            text: chunk,
+            embedding: vectors[i],
+            sourceUrl: page.url,
+          }));
 
-          // 5. Convexにドキュメントを一括保存
-          console.log(`[INFO] process_pending_documents: Saving ${documents.length} documents for ${page.url}`);
-          const saveResult = await ConvexClient.mutation('knowledge:addDocuments', { documents });
+          // Convexにドキュメントを一括保存（前のページの保存が終わってから）
+          const write = writeQueue.then(async () => {
+            console.log(`[INFO] process_pending_documents: Saving ${documents.length} documents for ${page.url}`);
+            return saveClaimed(page, documents);
+          });
+          writeQueue = write.then(() => undefined, () => undefined);
+          if (!(await write)) {
+            console.log(`[WARN] process_pending_documents: Lease lost for ${page.url}, skipping (another worker owns it)`);
+            return record(0, 'skipped_lease_lost');
+          }
 
           savedDocuments += documents.length;
           totalChunks += chunks.length;
-
-          // 6. 元ページのステータスを"processed"に更新
-          await ConvexClient.mutation('pages:updatePageStatus', {
-            id: page._id,
-            status: 'processed',
-          });
-
           console.log(`[SUCCESS] process_pending_documents: Processed ${page.url} - ${documents.length} documents saved`);
-
-          processingDetails.push({
-            pageId: page._id,
-            url: page.url,
-            chunksCreated: documents.length,
-            status: 'success',
-          });
+          return record(documents.length, 'success');
 
         } catch (pageError) {
           const errorMsg = pageError instanceof Error ? pageError.message : 'Unknown page processing error';
           console.error(`[ERROR] process_pending_documents: Failed to process page ${page.url}: ${errorMsg}`);
           errors.push(`Failed to process page ${page.url}: ${errorMsg}`);
+          return record(0, 'error');
+        }
+      };
 
-          processingDetails.push({
-            pageId: page._id,
-            url: page.url,
-            chunksCreated: 0,
-            status: 'error',
-          });
+      // リースを取れたページを処理し、pending に戻したページ数を返す
+      const processClaimed = async (claimed: any[]): Promise<number> => {
+        let released = 0;
+        await Promise.all(claimed.map(async (page: any) => {
+          const status = await processPage(page);
+          if (status === 'success' || status === 'skipped_lease_lost') return;
+          // 失敗したページはリースを返して次回の実行で再試行する（チャンクを作れないページは error にする）
+          const nextStatus = status === 'skipped_no_chunks' ? 'error' : 'pending';
+          try {
+            await ConvexClient.mutation('pages:completeClaimedPage', {
+              id: page._id,
+              workerId: leaseOwner,
+              status: nextStatus,
+            });
+          } catch (releaseError) {
+            // 返却に失敗してもリースが切れれば pending に戻る
+            console.error(`[WARN] process_pending_documents: Failed to release ${page.url}: ${releaseError instanceof Error ? releaseError.message : releaseError}`);
+          }
+          if (nextStatus === 'pending') released++;
+        }));
+        return released;
+      };
+
+      const claimListed = async (listing: { page: Array<{ _id: string }> }) => {
+        const ids = listing.page.map((page) => page._id);
+        const claimed = ids.length > 0
+          ? unwrap(await ConvexClient.mutation('pages:claimPages', { ids, workerId: leaseOwner, leaseMs }))
+          : [];
+        console.log(`[INFO] process_pending_documents: Claimed ${claimed.length}/${ids.length} pending pages`);
+        return claimed;
+      };
+
+      if (streaming) {
+        // 3. pendingページの一覧をcursorで batchSize 件ずつ読み、リースを取れたページだけ本文ごと処理する
+        // メモリに載るのは batchSize ページ分だけ。一覧を1ページ処理し終えるごとにcursorを保存する
+        const checkpoint = unwrap(await ConvexClient.query('pages:getIngestCheckpoint', { name: workerId }));
+        let cursor: string | null = checkpoint?.cursor ?? null;
+        let claimedPages = 0;
+        let releasedPages = 0;
+        console.log(`[INFO] process_pending_documents: Streaming as ${leaseOwner} from ${cursor ? 'checkpoint' : 'the beginning'}`);
+
+        for (;;) {
+          const listing = unwrap(await ConvexClient.query('pages:getPendingPagesPage', { cursor, numItems: batchSize }));
+          const claimed = await claimListed(listing);
+          releasedPages += await processClaimed(claimed);
+          claimedPages += claimed.length;
+
+          cursor = listing.isDone ? null : listing.continueCursor;
+          // pending に戻したページは保存済みのcursorより前にあるため、その回は再開位置を先頭に戻す
+          await ConvexClient.mutation('pages:saveIngestCheckpoint', { name: workerId, cursor: releasedPages > 0 ? null : cursor });
+          if (listing.isDone || (maxPages !== undefined && claimedPages >= maxPages)) break;
+        }
+        if (releasedPages > 0) {
+          console.log(`[INFO] process_pending_documents: Released ${releasedPages} pages to pending, next run starts from the beginning`);
         }
+
+      } else {
+        // 3. 先頭の batchSize 件の pending ページを取得し、リースを取れたページだけ処理する
+        console.log('[INFO] process_pending_documents: Fetching pending pages');
+        const listing = unwrap(await ConvexClient.query('pages:getPendingPagesPage', { cursor: null, numItems: batchSize }));
+
+        if (listing.page.length === 0) {
+          console.log('[INFO] process_pending_documents: No pending pages found');
+          return {
+            success: true,
+            processedPages: 0,
+            totalChunks: 0,
+            savedDocuments: 0,
+            skippedPages: 0,
+            errors: [],
+            message: 'No pending pages to process',
+            processingDetails: [],
+          };
+        }
+
+        // 4. バッチ処理（ドキュメントの保存と status の "processed" への更新は completeClaimedPage で1回に行う）
+        const claimed = await claimListed(listing);
+        console.log(`[INFO] process_pending_documents: Processing ${claimed.length} pages in this batch`);
+        await processClaimed(claimed);
       }
 
+      const { requests, retries, rateLimited } = scheduler.stats;
+      console.log(`[INFO] process_pending_documents: Embedding requests: ${requests} (retries: ${retries}, rate limited: ${rateLimited})`);
+
       const processedPages = processingDetails.filter(detail => detail.status === 'success').length;
       const skippedPages = processingDetails.filter(detail => detail.status.startsWith('skipped') || detail.status === 'failed_embeddings').length;
-      const success = processedPages > 0 && errors.length === 0;
+      // streaming は pending ページが残っていなければ処理0件でも成功とする
+      const success = (processedPages > 0 || streaming) && errors.length === 0;
 
       const message = success
         ? `Successfully processed ${processedPages} pages, created ${savedDocuments} documents from ${totalChunks} chunks`
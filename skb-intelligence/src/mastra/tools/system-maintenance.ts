@@ -151,12 +151,15 @@ export const getSystemStats = createTool({
       pages: z.object({
         total: z.number(),
         pending: z.number(),
+        processing: z.number(),
         processed: z.number(),
         error: z.number(),
       }),
       documents: z.object({
         total: z.number(),
       }),
+      countersInitialized: z.boolean(),
+      reconciledAt: z.number().nullable(),
       lastUpdated: z.number(),
     }).optional(),
     message: z.string(),
@@ -174,6 +177,16 @@ export const getSystemStats = createTool({
 
       console.log(`[SUCCESS] get_system_stats: Retrieved stats - Pages: ${pagesTotal}, Documents: ${documentsTotal}`);
 
+      // 集計カウンタが一度も数え直されていなければ、導入前からある行が含まれていない
+      if (!stats?.countersInitialized) {
+        console.warn('[WARN] get_system_stats: Stats counters are not initialized yet (run stats:seedStatsCounters)');
+        return {
+          success: true,
+          stats,
+          message: 'Stats counters are not initialized yet; counts may be too low until stats:seedStatsCounters completes',
+        };
+      }
+
       return {
         success: true,
         stats,
@@ -0,0 +1,224 @@
+/**
+ * 埋め込みリクエストのスケジューラ
+ * 複数ページのチャンクを複数入力のリクエスト（batchEmbedContents）にまとめ、
+ * トークンバケットでレート制限を守りながら同時実行数を制限して送信する。
+ * 429・5xx・通信エラーは指数バックオフ（Retry-Afterがあればそれに従う）で再試行する。
+ */
+
+const GOOGLE_EMBEDDING_API_BASE = 'https://generativelanguage.googleapis.com/v1beta';
+const EMBEDDING_DIMENSION = 768;
+
+export type EmbedBatch = (texts: string[]) => Promise<number[][]>;
+
+export interface EmbeddingSchedulerOptions {
+  batchSize?: number;          // 1リクエストあたりの最大入力数（batchEmbedContentsは100まで）
+  maxInFlight?: number;        // 同時に送信するリクエスト数
+  lingerMs?: number;           // 入力が batchSize に満たないとき、他の呼び出しの入力を待つ時間
+  requestsPerMinute?: number;  // プロバイダのリクエスト数クォータ
+  maxRetries?: number;
+  baseDelayMs?: number;
+  maxDelayMs?: number;
+}
+
+export class EmbeddingRequestError extends Error {
+  constructor(message: string, public status?: number, public retryAfterMs?: number) {
+    super(message);
+    this.name = 'EmbeddingRequestError';
+  }
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * トークンバケット（1分あたりのリクエスト数を平準化する）
+ */
+export class TokenBucket {
+  private tokens: number;
+  private lastRefill = Date.now();
+  private readonly ratePerMs: number;
+
+  constructor(perMinute: number, private capacity = Math.max(1, Math.ceil(perMinute / 60))) {
+    this.ratePerMs = perMinute / 60000;
+    this.tokens = capacity;
+  }
+
+  async take() {
+    for (;;) {
+      const now = Date.now();
+      this.tokens = Math.min(this.capacity, this.tokens + (now - this.lastRefill) * this.ratePerMs);
+      this.lastRefill = now;
+      if (this.tokens >= 1) {
+        this.tokens -= 1;
+        return;
+      }
+      await sleep((1 - this.tokens) / this.ratePerMs);
+    }
+  }
+
+  // 429を受けたときに溜まったトークンを捨て、しばらく送信を止める
+  drain() {
+    this.tokens = Math.min(this.tokens, 0);
+  }
+}
+
+function isRetryable(error: unknown): boolean {
+  if (error instanceof EmbeddingRequestError) {
+    return error.status === undefined || error.status === 429 || error.status >= 500;
+  }
+  return true; // fetch自体の失敗（接続断・タイムアウト）
+}
+
+type PendingText = {
+  text: string;
+  resolve: (vector: number[]) => void;
+  reject: (error: unknown) => void;
+};
+
+export class EmbeddingScheduler {
+  private readonly batchSize: number;
+  private readonly maxInFlight: number;
+  private readonly lingerMs: number;
+  private readonly maxRetries: number;
+  private readonly baseDelayMs: number;
+  private readonly maxDelayMs: number;
+  private readonly bucket: TokenBucket;
+  private queue: PendingText[] = [];
+  private inFlight = 0;
+  private flushTimer?: ReturnType<typeof setTimeout>;
+
+  // 統計（処理の最後にログ出力する）
+  stats = { requests: 0, texts: 0, retries: 0, rateLimited: 0 };
+
+  constructor(private embedBatch: EmbedBatch, options: EmbeddingSchedulerOptions = {}) {
+    this.batchSize = options.batchSize ?? 100;
+    this.maxInFlight = options.maxInFlight ?? 4;
+    this.lingerMs = options.lingerMs ?? 20;
+    this.maxRetries = options.maxRetries ?? 5;
+    this.baseDelayMs = options.baseDelayMs ?? 500;
+    this.maxDelayMs = options.maxDelayMs ?? 30000;
+    this.bucket = new TokenBucket(options.requestsPerMinute ?? 150);
+  }
+
+  /**
+   * テキストを埋め込む（入力と同じ順序でベクトルを返す）
+   * 複数のページから同時に呼んでよく、各ページのチャンクは同じリクエストにまとめて送られる
+   */
+  embed(texts: string[]): Promise<number[][]> {
+    const vectors = Promise.all(texts.map((text) =>
+      new Promise<number[]>((resolve, reject) => this.queue.push({ text, resolve, reject }))
+    ));
+
+    if (this.queue.length >= this.batchSize) {
+      this.pump();
+    } else if (!this.flushTimer) {
+      // 少しだけ待って、他のページのチャンクと同じリクエストにまとめる
+      this.flushTimer = setTimeout(() => this.pump(), this.lingerMs);
+    }
+    return vectors;
+  }
+
+  private pump() {
+    clearTimeout(this.flushTimer);
+    this.flushTimer = undefined;
+    while (this.inFlight < this.maxInFlight && this.queue.length > 0) {
+      this.inFlight++;
+      void this.runLane();
+    }
+  }
+
+  // レートの枠を得てからキューの先頭をまとめて送る（枠を待つ間に届いたチャンクも同じリクエストに入る）
+  private async runLane() {
+    try {
+      await this.bucket.take();
+      const batch = this.queue.splice(0, this.batchSize);
+      if (batch.length === 0) return;
+
+      try {
+        const vectors = await this.send(batch.map((item) => item.text));
+        batch.forEach((item, i) => item.resolve(vectors[i]));
+      } catch (error) {
+        batch.forEach((item) => item.reject(error));
+      }
+    } finally {
+      this.inFlight--;
+      if (this.queue.length > 0) {
+        this.pump();
+      }
+    }
+  }
+
+  private async send(texts: string[]): Promise<number[][]> {
+    for (let attempt = 0; ; attempt++) {
+      try {
+        if (attempt > 0) {
+          await this.bucket.take();
+        }
+        this.stats.requests++;
+        const vectors = await this.embedBatch(texts);
+        this.stats.texts += texts.length;
+        return vectors;
+      } catch (error) {
+        if (attempt >= this.maxRetries || !isRetryable(error)) {
+          throw error;
+        }
+        const retryAfterMs = error instanceof EmbeddingRequestError ? error.retryAfterMs : undefined;
+        if (error instanceof EmbeddingRequestError && error.status === 429) {
+          this.stats.rateLimited++;
+          this.bucket.drain();
+        }
+        const backoff = Math.min(this.maxDelayMs, this.baseDelayMs * 2 ** attempt);
+        const delay = retryAfterMs ?? backoff / 2 + Math.random() * backoff / 2;
+        this.stats.retries++;
+        console.log(`[WARN] EmbeddingScheduler: Retrying batch of ${texts.length} in ${Math.round(delay)}ms (attempt ${attempt + 1}/${this.maxRetries}): ${error instanceof Error ? error.message : error}`);
+        await sleep(delay);
+      }
+    }
+  }
+}
+
+/**
+ * Google Generative AI の batchEmbedContents を呼ぶ EmbedBatch
+ * GOOGLE_EMBEDDING_API_BASE でエンドポイントを差し替えられる（ローカルの代替サーバーでの計測用）
+ */
+export function googleBatchEmbedder(apiKey?: string, modelName = 'embedding-001'): EmbedBatch {
+  const key = apiKey || process.env.GOOGLE_GENERATIVE_AI_API_KEY;
+  const base = process.env.GOOGLE_EMBEDDING_API_BASE || GOOGLE_EMBEDDING_API_BASE;
+  if (!key) {
+    throw new Error('GOOGLE_GENERATIVE_AI_API_KEY is required');
+  }
+
+  return async (texts: string[]) => {
+    const response = await fetch(`${base}/models/${modelName}:batchEmbedContents?key=${key}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        requests: texts.map((text) => ({
+          model: `models/${modelName}`,
+          content: { parts: [{ text }] },
+        })),
+      }),
+    });
+
+    if (!response.ok) {
+      const retryAfter = Number(response.headers.get('retry-after'));
+      const errorText = await response.text();
+      throw new EmbeddingRequestError(
+        `Embedding request failed: ${response.status} ${errorText.slice(0, 200)}`,
+        response.status,
+        retryAfter > 0 ? retryAfter * 1000 : undefined,
+      );
+    }
+
+    const result = await response.json();
+    const vectors: number[][] = result.embeddings.map((embedding: { values: number[] }) => embedding.values);
+    if (vectors.length !== texts.length) {
+      throw new EmbeddingRequestError(`Embedding count mismatch: ${vectors.length}, expected ${texts.length}`);
+    }
+    for (const vector of vectors) {
+      if (vector.length !== EMBEDDING_DIMENSION) {
+        throw new EmbeddingRequestError(`Invalid embedding dimension: ${vector.length}, expected ${EMBEDDING_DIMENSION}`, 400);
+      }
+    }
+    return vectors;
+  };
+}
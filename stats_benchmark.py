@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+admin:getStats のベンチマーク（全件collect vs 集計カウンタ）
+変更前の admin.ts は crawled_pages と documents（768次元の埋め込みを含む）を全件 collect して
+件数を数えていたため、統計1回のコストがコーパス全体に比例していた。Convex代替サーバーで
+stats="scan"（変更前と同じく全行を読み出す）と "counters"（stats.ts の集計カウンタを読む）を、
+コーパスを段階的に増やしながら比較する。
+
+あわせて、各段階で次を確認する:
+  - カウンタの値が実データを数えた値と一致すること（追加・status変更・削除を経たあと）
+  - カウンタを通さずに行を消したときのずれを stats:startStatsReconcile が補正すること
+
+使い方:
+  python stats_benchmark.py                              # documents 500〜8000件
+  python stats_benchmark.py --sizes 1000 10000 --repeats 50
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+import requests
+
+from convex_stub_server import EMBEDDING_DIM, STATS_MODES, start_convex_stub
+from latency_histogram import LatencyHistogram
+
+DEFAULT_SIZES = [500, 2000, 8000]
+DOCUMENTS_PER_PAGE = 5
+
+
+class ConvexCaller:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def __call__(self, kind, path, args=None):
+        response = self.session.post(f"{self.base_url}/api/{kind}", json={"path": path, "args": args or {}},
+                                     timeout=120)
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"{path} failed: {body.get('errorMessage')}")
+        return body["value"]
+
+
+def grow_corpus(call, rng, documents, dim=EMBEDDING_DIM):
+    """ページの追加→チャンクの追加→statusの更新を、取り込みと同じ関数で documents 件分行う"""
+    page_ids = []
+    for start in range(0, documents, DOCUMENTS_PER_PAGE * 20):
+        batch = []
+        for offset in range(start, min(start + DOCUMENTS_PER_PAGE * 20, documents), DOCUMENTS_PER_PAGE):
+            url = f"https://example.com/page/{offset // DOCUMENTS_PER_PAGE}-{rng.random():.6f}"
+            page_id = call("mutation", "pages:addPage", {"url": url, "text": "攻略情報"})
+            page_ids.append(page_id)
+            count = min(DOCUMENTS_PER_PAGE, documents - offset)
+            vectors = rng.standard_normal((count, dim)).astype(np.float32)
+            batch.extend({"text": f"チャンク{offset + i}", "embedding": vectors[i].tolist(), "sourceUrl": url}
+                         for i in range(count))
+        call("mutation", "knowledge:addDocuments", {"documents": batch})
+    for page_id in page_ids:
+        status = rng.choice(["processed"] * 8 + ["error", "pending"])
+        if status != "pending":
+            call("mutation", "pages:updatePageStatus", {"id": page_id, "status": status})
+    return page_ids
+
+
+def measure(call, server, repeats):
+    results = {}
+    for mode in STATS_MODES:
+        server.update_profile({"stats": mode})
+        latency = LatencyHistogram()
+        for _ in range(repeats):
+            started = time.perf_counter()
+            stats = call("query", "admin:getStats")
+            latency.record((time.perf_counter() - started) * 1000)
+        results[mode] = {"stats": {key: stats[key] for key in ("pages", "documents")}, **latency.summary()}
+    server.update_profile({"stats": "counters"})
+    return results
+
+
+def check_reconcile(call, server, rng):
+    """カウンタを通さずにdocumentsを消し、数え直しでずれが補正されることを確かめる"""
+    store = server.store
+    with store.lock:
+        for doc_id in rng.sample(sorted(store.tables["documents"]), 3):
+            store.tables["documents"].pop(doc_id)
+            store.index.remove(doc_id)
+            store.text_index.remove(doc_id)
+    before = call("query", "admin:getStats")["documents"]["total"]
+    result = call("mutation", "stats:startStatsReconcile")
+    after = call("query", "admin:getStats")["documents"]["total"]
+    return {"before": before, "after": after, "drift": result["drift"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="admin:getStats: 全件collect vs 集計カウンタ")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="計測するdocumentsの件数")
+    parser.add_argument("--repeats", type=int, default=30, help="各サイズ・方式ごとの getStats の回数")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    server, base_url = start_convex_stub()
+    call = ConvexCaller(base_url)
+    rng = np.random.default_rng(0)
+    report = []
+    consistent = True
+    try:
+        print(f"{'documents':>10} {'pages':>7} {'scan p50':>10} {'scan p95':>10} {'counters p50':>13} {'counters p95':>13}")
+        total = 0
+        for size in sorted(args.sizes):
+            grow_corpus(call, rng, size - total)
+            total = size
+            # 削除とstatus変更もカウンタに反映されることを確かめるため、1ページ分を消してから計測する
+            url = next(iter(server.store.tables["crawled_pages"].values()))["url"]
+            call("mutation", "knowledge:deleteDocumentsBySourceUrl", {"sourceUrl": url})
+            result = {"documents": size, **measure(call, server, args.repeats)}
+            if result["scan"]["stats"] != result["counters"]["stats"]:
+                consistent = False
+                print(f"❌ カウンタが実データと一致しません: {result['counters']['stats']} != {result['scan']['stats']}")
+            report.append(result)
+            print(f"{result['counters']['stats']['documents']['total']:>10} {result['counters']['stats']['pages']['total']:>7} "
+                  f"{result['scan']['p50']:>8.2f}ms {result['scan']['p95']:>8.2f}ms "
+                  f"{result['counters']['p50']:>11.2f}ms {result['counters']['p95']:>11.2f}ms")
+        reconcile = check_reconcile(call, server, random.Random(0))
+    finally:
+        server.shutdown()
+
+    if len(report) > 1:
+        first, last = report[0], report[-1]
+        growth = last["documents"] / first["documents"]
+        print(f"\n📈 コーパス{growth:.0f}倍で scan p50 {last['scan']['p50'] / first['scan']['p50']:.1f}倍, "
+              f"counters p50 {last['counters']['p50'] / first['counters']['p50']:.1f}倍")
+    print(f"{'✅' if consistent else '❌'} カウンタと実データの一致: {'全サイズで一致' if consistent else '不一致あり'}")
+    print(f"🔧 数え直し: documents {reconcile['before']} → {reconcile['after']} (補正 {reconcile['drift']})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"sizes": report, "reconcile": reconcile}, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
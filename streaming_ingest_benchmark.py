@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+process_pending_documents のストリーミング取り込みの検証とベンチマーク
+変更前は pages:getPendingPages が pending ページを本文ごと全件返し、1回の実行で batchSize 件だけ処理していたため、
+大きなクロールでは実行のたびに残り全件の本文を読み直し、途中で止まるとその回の進捗が失われた。
+document-processor.ts の streaming モードと同じ手順（getPendingPagesPage でcursorごとに読む→claimPages でリースを取る→
+completeClaimedPage で保存とstatus更新を1回で行う→saveIngestCheckpoint で再開位置を保存）をPythonで再現し、
+Convex代替サーバーに対して次を確かめる:
+
+  1. 従来の手順との比較: 全ページを取り込むまでにConvexから読んだバイト数・最大のレスポンス（クライアントが
+     一度に抱えるページ本文の量）・所要時間
+  2. 複数ワーカーの並行実行: 全ページがちょうど1回ずつ取り込まれること（documentsの重複・欠落がないこと）
+  3. 中断と再開: 途中で止めたワーカーがチェックポイントから再開し、リースの切れたページも
+     releaseExpiredLeases のあとに取り込まれ、重複が出ないこと
+  4. streaming でない実行（先頭の batchSize 件だけリースを取って処理する）を streaming のワーカーと同時に
+     繰り返しても重複しないこと
+  5. 埋め込みに失敗して pending に戻したページが、次の実行（チェックポイントを先頭に戻す）で取り込まれること
+
+使い方:
+  python streaming_ingest_benchmark.py                        # 600ページ・4ワーカー
+  python streaming_ingest_benchmark.py --pages 2000 --workers 8 --batch-size 10 --embed-ms 50
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from chunking_benchmark import recursive_character_split, synthesize_pages
+from convex_stub_server import start_convex_stub
+from local_embedder import LocalEmbedder
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class WorkerCrashed(Exception):
+    """中断のシミュレーション（リースを返さずに止まる）"""
+
+
+class EmbeddingFailed(Exception):
+    """埋め込みAPIの失敗のシミュレーション"""
+
+
+class ConvexCaller:
+    """Convex HTTP API の呼び出し（スレッドごとのセッション、読んだバイト数を数える）"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.bytes_received = 0
+        self.max_response_bytes = 0
+
+    def __call__(self, kind, path, args=None):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.post(f"{self.base_url}/api/{kind}", json={"path": path, "args": args or {}}, timeout=120)
+        with self._lock:
+            self.bytes_received += len(response.content)
+            self.max_response_bytes = max(self.max_response_bytes, len(response.content))
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"{path} failed: {body.get('errorMessage')}")
+        return body["value"]
+
+    def reset(self):
+        with self._lock:
+            self.bytes_received = 0
+            self.max_response_bytes = 0
+
+
+class PageEmbedder:
+    """チャンク分割とローカルの代替モデルでの埋め込み（埋め込みAPIの往復時間を embed_ms で再現）"""
+
+    def __init__(self, embed_ms=0.0, fail_once=()):
+        self.embed_ms = embed_ms
+        self.embedder = LocalEmbedder()
+        self.fail_once = set(fail_once)  # 最初の1回だけ埋め込みに失敗するページのURL
+        self._lock = threading.Lock()
+
+    def documents(self, page):
+        chunks = recursive_character_split(page["text"], CHUNK_SIZE, CHUNK_OVERLAP)
+        if self.embed_ms:
+            time.sleep(self.embed_ms / 1000)
+        with self._lock:
+            if page["url"] in self.fail_once:
+                self.fail_once.discard(page["url"])
+                raise EmbeddingFailed(page["url"])
+        vectors = self.embedder.embed_documents(chunks) if chunks else []
+        return [{"text": chunk, "embedding": [round(float(x), 6) for x in vector], "sourceUrl": page["url"]}
+                for chunk, vector in zip(chunks, vectors)]
+
+
+def run_legacy_mode(call, embedder, batch_size):
+    """変更前の手順（リースなし）を、pending がなくなるまで繰り返し実行する"""
+    runs = 0
+    while True:
+        pending = call("query", "pages:getPendingPages")
+        if not pending:
+            return {"runs": runs}
+        runs += 1
+
+        def process(page):
+            call("mutation", "knowledge:addDocuments", {"documents": embedder.documents(page)})
+            call("mutation", "pages:updatePageStatus", {"id": page["_id"], "status": "processed"})
+
+        with ThreadPoolExecutor(batch_size) as executor:
+            list(executor.map(process, pending[:batch_size]))
+
+
+class StreamingWorker:
+    """document-processor.ts と同じ手順のワーカー（run が streaming モード、run_batch が streaming でない実行）"""
+
+    def __init__(self, call, embedder, worker_id, batch_size=5, lease_ms=10 * 60 * 1000, crash_after=None):
+        self.call = call
+        self.embedder = embedder
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_ms = lease_ms
+        self.crash_after = crash_after  # この件数を保存したら、次のページの途中で止まる
+        self.stats = {"listed": 0, "claimed": 0, "processed": 0, "lease_lost": 0, "released": 0,
+                      "resumed_from_checkpoint": False}
+        self._lock = threading.Lock()
+
+    def _process(self, lease_owner, page):
+        try:
+            documents = self.embedder.documents(page)
+        except EmbeddingFailed:
+            # 失敗したページはリースを返して次回の実行で再試行する
+            self.call("mutation", "pages:completeClaimedPage", {"id": page["_id"], "workerId": lease_owner,
+                                                                 "status": "pending"})
+            with self._lock:
+                self.stats["released"] += 1
+            return
+        with self._lock:
+            if self.crash_after is not None and self.stats["processed"] >= self.crash_after:
+                raise WorkerCrashed(self.worker_id)
+        status = "processed" if documents else "error"
+        result = self.call("mutation", "pages:completeClaimedPage", {"id": page["_id"], "workerId": lease_owner,
+                                                                      "status": status, "documents": documents})
+        with self._lock:
+            self.stats["processed" if result["completed"] else "lease_lost"] += 1
+
+    def _claim_and_process(self, executor, lease_owner, listing):
+        ids = [page["_id"] for page in listing["page"]]
+        claimed = self.call("mutation", "pages:claimPages", {"ids": ids, "workerId": lease_owner,
+                                                             "leaseMs": self.lease_ms}) if ids else []
+        self.stats["listed"] += len(ids)
+        self.stats["claimed"] += len(claimed)
+        list(executor.map(lambda page: self._process(lease_owner, page), claimed))
+
+    def run_batch(self):
+        """streaming でない実行: 先頭の batchSize 件のうちリースを取れたページだけ処理する。pending がなければ False"""
+        lease_owner = f"{self.worker_id}-{uuid.uuid4().hex[:8]}"
+        listing = self.call("query", "pages:getPendingPagesPage", {"cursor": None, "numItems": self.batch_size})
+        if not listing["page"]:
+            return False
+        with ThreadPoolExecutor(self.batch_size) as executor:
+            self._claim_and_process(executor, lease_owner, listing)
+        return True
+
+    def run(self, max_pages=None):
+        lease_owner = f"{self.worker_id}-{uuid.uuid4().hex[:8]}"
+        checkpoint = self.call("query", "pages:getIngestCheckpoint", {"name": self.worker_id})
+        cursor = checkpoint["cursor"] if checkpoint else None
+        self.stats["resumed_from_checkpoint"] = cursor is not None
+
+        with ThreadPoolExecutor(self.batch_size) as executor:
+            while True:
+                listing = self.call("query", "pages:getPendingPagesPage",
+                                    {"cursor": cursor, "numItems": self.batch_size})
+                self._claim_and_process(executor, lease_owner, listing)
+
+                cursor = None if listing["isDone"] else listing["continueCursor"]
+                # pending に戻したページは保存済みのcursorより前にあるため、その回は再開位置を先頭に戻す
+                saved = None if self.stats["released"] else cursor
+                self.call("mutation", "pages:saveIngestCheckpoint", {"name": self.worker_id, "cursor": saved})
+                if listing["isDone"] or (max_pages is not None and self.stats["claimed"] >= max_pages):
+                    return self.stats
+
+
+def seed_pages(call, count, seed=0):
+    pages = synthesize_pages(count, seed=seed)
+    for page in pages:
+        call("mutation", "pages:addPage", {"url": page["url"], "text": page["text"]})
+    return pages
+
+
+def check_exactly_once(store, pages):
+    """各ページのdocuments数がチャンク数と一致し、全ページが processed になっていることを確かめる"""
+    with store.lock:
+        per_url = {}
+        for doc in store.tables["documents"].values():
+            per_url[doc["sourceUrl"]] = per_url.get(doc["sourceUrl"], 0) + 1
+        statuses = {}
+        for page in store.tables["crawled_pages"].values():
+            statuses[page["status"]] = statuses.get(page["status"], 0) + 1
+    expected = {page["url"]: len(recursive_character_split(page["text"], CHUNK_SIZE, CHUNK_OVERLAP)) for page in pages}
+    return {
+        "duplicated_pages": sum(1 for url, count in expected.items() if per_url.get(url, 0) > count),
+        "missing_pages": sum(1 for url, count in expected.items() if per_url.get(url, 0) < count),
+        "statuses": statuses,
+    }
+
+
+def fresh_stub(pages_count, latency_ms):
+    server, base_url = start_convex_stub(latency_ms=latency_ms)
+    call = ConvexCaller(base_url)
+    pages = seed_pages(call, pages_count)
+    call.reset()
+    return server, call, pages
+
+
+def run_batch_mode(call, embedder, batch_size):
+    """streaming でない実行を、pending がなくなるまで繰り返す"""
+    worker = StreamingWorker(call, embedder, "batch", batch_size)
+    runs = 0
+    while worker.run_batch():
+        runs += 1
+    return {"runs": runs}
+
+
+def compare_modes(args, embedder):
+    report = {}
+    for mode in ("legacy", "batch", "streaming"):
+        server, call, pages = fresh_stub(args.pages, args.latency_ms)
+        try:
+            started = time.perf_counter()
+            if mode == "legacy":
+                result = run_legacy_mode(call, embedder, args.batch_size)
+            elif mode == "batch":
+                result = run_batch_mode(call, embedder, args.batch_size)
+            else:
+                result = StreamingWorker(call, embedder, "single", args.batch_size).run()
+            report[mode] = {
+                **result,
+                "seconds": round(time.perf_counter() - started, 2),
+                "bytes_received": call.bytes_received,
+                "max_response_bytes": call.max_response_bytes,
+                **check_exactly_once(server.store, pages),
+            }
+        finally:
+            server.shutdown()
+    return report
+
+
+def run_parallel_workers(args, embedder):
+    server, call, pages = fresh_stub(args.pages, args.latency_ms)
+    try:
+        started = time.perf_counter()
+        workers = [StreamingWorker(call, embedder, f"worker{i}", args.batch_size) for i in range(args.workers)]
+        with ThreadPoolExecutor(args.workers) as executor:
+            stats = list(executor.map(lambda worker: worker.run(), workers))
+        return {
+            "workers": args.workers,
+            "seconds": round(time.perf_counter() - started, 2),
+            "claimed_per_worker": [s["claimed"] for s in stats],
+            "listed_total": sum(s["listed"] for s in stats),
+            "lease_lost": sum(s["lease_lost"] for s in stats),
+            **check_exactly_once(server.store, pages),
+        }
+    finally:
+        server.shutdown()
+
+
+def run_batch_alongside_streaming(args, embedder):
+    """streaming でない実行を、streaming のワーカーと同時に pending がなくなるまで繰り返す"""
+    server, call, pages = fresh_stub(args.pages, args.latency_ms)
+    try:
+        batch = StreamingWorker(call, embedder, "batch", args.batch_size)
+        streaming = [StreamingWorker(call, embedder, f"worker{i}", args.batch_size) for i in range(max(1, args.workers - 1))]
+        with ThreadPoolExecutor(len(streaming) + 1) as executor:
+            batch_runs = executor.submit(lambda: sum(1 for _ in iter(batch.run_batch, False)))
+            stats = list(executor.map(lambda worker: worker.run(), streaming))
+            runs = batch_runs.result()
+        return {
+            "batch_runs": runs,
+            "claimed_by_batch": batch.stats["claimed"],
+            "claimed_by_streaming": sum(s["claimed"] for s in stats),
+            "lease_lost": batch.stats["lease_lost"] + sum(s["lease_lost"] for s in stats),
+            **check_exactly_once(server.store, pages),
+        }
+    finally:
+        server.shutdown()
+
+
+def run_failure_and_retry(args):
+    """埋め込みに失敗したページを pending に戻し、チェックポイントを先頭に戻した次の実行で取り込む"""
+    server, call, pages = fresh_stub(args.pages, args.latency_ms)
+    try:
+        # 一覧の前半で失敗させる（cursorより前に取り残されるページ）
+        failing = [page["url"] for page in pages[: args.pages // 2: max(1, args.pages // 20)]]
+        embedder = PageEmbedder(args.embed_ms, fail_once=failing)
+        # 最後まで読まずに止める（止めた位置のcursorを保存すると、失敗したページは次の実行で読まれない）
+        first = StreamingWorker(call, embedder, "retrying", args.batch_size).run(max_pages=args.pages * 3 // 4)
+        checkpoint = call("query", "pages:getIngestCheckpoint", {"name": "retrying"})
+        second = StreamingWorker(call, embedder, "retrying", args.batch_size).run()
+        return {
+            "failed_pages": len(failing),
+            "released_to_pending": first["released"],
+            "checkpoint_after_release": checkpoint["cursor"] if checkpoint else None,
+            "processed_on_retry": second["processed"],
+            **check_exactly_once(server.store, pages),
+        }
+    finally:
+        server.shutdown()
+
+
+def run_crash_and_resume(args, embedder, lease_ms=300):
+    server, call, pages = fresh_stub(args.pages, args.latency_ms)
+    try:
+        crash_after = args.pages // 3
+        crashed = StreamingWorker(call, embedder, "resumable", args.batch_size, lease_ms, crash_after=crash_after)
+        try:
+            crashed.run()
+        except WorkerCrashed:
+            pass
+        with server.store.lock:
+            held = sum(1 for page in server.store.tables["crawled_pages"].values() if page["status"] == "processing")
+
+        resumed = StreamingWorker(call, embedder, "resumable", args.batch_size, lease_ms)
+        first = resumed.run()
+        time.sleep(lease_ms / 1000 * 2)
+        released = call("mutation", "pages:releaseExpiredLeases")
+        second = StreamingWorker(call, embedder, "resumable", args.batch_size, lease_ms).run()
+        return {
+            "processed_before_crash": crashed.stats["processed"],
+            "leases_held_by_crashed_worker": held,
+            "resumed_from_checkpoint": first["resumed_from_checkpoint"],
+            "listed_after_resume": first["listed"],
+            "processed_after_resume": first["processed"],
+            "released_leases": released,
+            "processed_after_release": second["processed"],
+            **check_exactly_once(server.store, pages),
+        }
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストリーミング取り込み（cursor・リース・チェックポイント）の検証")
+    parser.add_argument("--pages", type=int, default=600, help="pending ページ数")
+    parser.add_argument("--batch-size", type=int, default=5, help="一度に処理するページ数（document-processor.ts の batchSize）")
+    parser.add_argument("--workers", type=int, default=4, help="並行実行するワーカー数")
+    parser.add_argument("--embed-ms", type=float, default=20.0, help="1ページの埋め込みにかかる時間")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Convexへのリクエスト1回あたりの遅延")
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    embedder = PageEmbedder(args.embed_ms)
+    print(f"🧪 pending {args.pages}ページ, batchSize {args.batch_size}, 埋め込み {args.embed_ms:.0f}ms/ページ")
+    report = {"modes": compare_modes(args, embedder)}
+    for mode, result in report["modes"].items():
+        print(f"  {mode:>9}: {result['seconds']:>6.1f}秒  読み込み {result['bytes_received'] / 1e6:>8.1f}MB  "
+              f"最大レスポンス {result['max_response_bytes'] / 1e3:>8.1f}KB  重複 {result['duplicated_pages']}  "
+              f"欠落 {result['missing_pages']}")
+
+    report["parallel"] = parallel = run_parallel_workers(args, embedder)
+    print(f"\n👥 {parallel['workers']}ワーカー: {parallel['seconds']:.1f}秒, 取得 {parallel['claimed_per_worker']}, "
+          f"重複 {parallel['duplicated_pages']}, 欠落 {parallel['missing_pages']}, status {parallel['statuses']}")
+
+    report["resume"] = resume = run_crash_and_resume(args, embedder)
+    print(f"\n🔁 中断前に{resume['processed_before_crash']}ページ保存（リース保持 {resume['leases_held_by_crashed_worker']}）"
+          f" → 再開 {'チェックポイントから' if resume['resumed_from_checkpoint'] else '先頭から'}"
+          f"（一覧 {resume['listed_after_resume']}件, 保存 {resume['processed_after_resume']}）"
+          f" → リース解放 {resume['released_leases']}件 → 保存 {resume['processed_after_release']}")
+    print(f"   重複 {resume['duplicated_pages']}, 欠落 {resume['missing_pages']}, status {resume['statuses']}")
+
+    report["mixed"] = mixed = run_batch_alongside_streaming(args, embedder)
+    print(f"\n🔀 streaming でない実行 {mixed['batch_runs']}回（取得 {mixed['claimed_by_batch']}）と streaming ワーカー"
+          f"（取得 {mixed['claimed_by_streaming']}）を同時実行: 重複 {mixed['duplicated_pages']}, "
+          f"欠落 {mixed['missing_pages']}, status {mixed['statuses']}")
+
+    report["retry"] = retry = run_failure_and_retry(args)
+    print(f"\n♻️ 埋め込み失敗 {retry['failed_pages']}ページ → pending に戻した {retry['released_to_pending']}件"
+          f"（チェックポイント {'先頭' if retry['checkpoint_after_release'] is None else '途中'}）"
+          f" → 次の実行で保存 {retry['processed_on_retry']}")
+    print(f"   重複 {retry['duplicated_pages']}, 欠落 {retry['missing_pages']}, status {retry['statuses']}")
+
+    ok = all(result["duplicated_pages"] == 0 and result["missing_pages"] == 0
+             for result in [*report["modes"].values(), parallel, resume, mixed, retry])
+    print(f"\n{'✅ 全ての取り込みで重複・欠落なし' if ok else '❌ 重複または欠落があります'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
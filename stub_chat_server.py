@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+/api/chat のローカルスタブサーバー
+本番のskb-frontendの代わりに負荷試験・検証スクリプトの動作確認に使う
+--convex-url を指定すると、本番と同様に1リクエストごとにConvexの search:searchByEmbedding を呼ぶ
+"""
+
+import json
+import random
+import argparse
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """skb-frontend の /api/chat（rag_search）と同じ形のJSONを返すハンドラ"""
+
+    protocol_version = "HTTP/1.1"  # Keep-Aliveを有効にする
+
+    def setup(self):
+        super().setup()
+        # ヘッダーと本文を別々に書き込むため、Nagleアルゴリズムと遅延ACKによる約40msの待ちを避ける
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, timings=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if timings is not None:
+            # route.ts の StageTimer と同じ形式（段階ごとの処理時間と total）
+            self.send_header("Server-Timing", ", ".join(f"{stage};dur={duration:.1f}"
+                                                        for stage, duration in timings.items()))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+
+        if self.path != "/api/chat":
+            self._send_json(404, {"success": False, "error": "Not found"})
+            return
+
+        started = time.perf_counter()
+        timings = {}
+        profile = self.server.profile
+        delay_ms = profile["latency_ms"] + random.uniform(0, profile["jitter_ms"])
+        time.sleep(delay_ms / 1000)
+        timings["generate"] = delay_ms
+
+        if random.random() < profile["error_rate"]:
+            timings["total"] = (time.perf_counter() - started) * 1000
+            self._send_json(500, {"success": False, "error": "Chat API failed", "details": "stub fault"}, timings)
+            return
+
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            self._send_json(500, {"success": False, "error": "Chat API failed"})
+            return
+
+        message = body.get("message", "")
+        relevant_documents = 3
+        if profile.get("convex_url"):
+            search_started = time.perf_counter()
+            try:
+                relevant_documents = len(self._search_convex(profile["convex_url"], message))
+            except (requests.RequestException, ValueError) as e:
+                self._send_json(500, {"success": False, "error": "Chat API failed", "details": str(e)})
+                return
+            timings["search"] = (time.perf_counter() - search_started) * 1000
+
+        timings["total"] = (time.perf_counter() - started) * 1000
+
+        self._send_json(200, {
+            "success": True,
+            "action": body.get("action", "rag_search"),
+            "userMessage": message,
+            "aiResponse": f"スタブ回答: 「{message}」に関する情報はドキュメントに記載されています。",
+            "relevantDocuments": relevant_documents,
+            "timings": timings,
+        }, timings)
+
+    def _search_convex(self, convex_url, message):
+        """route.ts と同じく search:searchByEmbedding を呼ぶ（embeddingはローカルの代替モデル）"""
+        from local_embedder import embed
+
+        session = getattr(_sessions, "session", None)
+        if session is None:
+            session = _sessions.session = requests.Session()
+        response = session.post(f"{convex_url}/api/action", json={
+            "path": "search:searchByEmbedding",
+            "args": {"embedding": embed(message).tolist(), "limit": 5},
+        }, timeout=30)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("status") != "success":
+            raise ValueError(result.get("errorMessage", "Convex action failed"))
+        return result["value"]
+
+
+_sessions = threading.local()  # ハンドラスレッドごとのKeep-Aliveセッション
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency_ms=200, jitter_ms=50, error_rate=0.0, convex_url=None):
+    """スタブサーバーをバックグラウンドスレッドで起動し、(server, base_url) を返す"""
+    server = ThreadingHTTPServer((host, port), StubChatHandler)
+    server.daemon_threads = True
+    server.profile = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+                      "convex_url": convex_url}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/api/chat ローカルスタブサーバー")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--convex-url", help="検索に使うConvex（convex_stub_server.py など）のURL")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(port=args.port, latency_ms=args.latency_ms,
+                                         jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                         convex_url=args.convex_url)
+    print(f"🧪 スタブサーバー起動: {base_url}/api/chat")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
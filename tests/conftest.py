@@ -0,0 +1,5 @@
+import os
+import sys
+
+# スクリプト群はリポジトリ直下のモジュールとして import する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
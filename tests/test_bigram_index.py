@@ -0,0 +1,60 @@
+from convex_stub_server import BigramIndex
+from text_search_benchmark import paged_search, scan_search
+
+
+def build(documents):
+    index = BigramIndex()
+    for doc_id, text in documents.items():
+        index.add(doc_id, text)
+    return index
+
+
+def corpus(size=1500):
+    # 「共通の本文」のbigramは MAX_POSTINGS_PER_GRAM を超えるので、積集合に使われない
+    return {i: "共通の本文" + (" 特別な語" if i % 7 == 0 else "") for i in range(1, size + 1)}
+
+
+def test_paged_search_matches_scan():
+    documents = corpus()
+    index = build(documents)
+
+    for query in ("特別な語", "共通の本文", "本文 特別"):
+        found, stats = paged_search(index, documents, query, len(documents))
+        assert found == scan_search(documents, query, len(documents))
+        assert stats["max_postings"] <= (BigramIndex.MAX_POSTINGS_PER_GRAM + 1) * BigramIndex.MAX_PROBED_GRAMS
+
+
+def test_cursor_resumes_after_verification_cap():
+    documents = corpus()
+    index = build(documents)
+
+    ids, is_done, cursor = index.search("共通の本文", len(documents), documents.get, iter(documents))
+    assert len(ids) == BigramIndex.MAX_VERIFIED_DOCUMENTS
+    assert not is_done
+    assert cursor == ids[-1]
+
+    rest, _, _ = index.search("共通の本文", len(documents), documents.get, iter(documents), cursor)
+    assert rest[0] == cursor + 1
+    assert not set(ids) & set(rest)
+
+
+def test_limit_pages_do_not_repeat():
+    documents = corpus(200)
+    index = build(documents)
+
+    first, is_done, cursor = index.search("特別な語", 5, documents.get, iter(documents))
+    second, _, _ = index.search("特別な語", 5, documents.get, iter(documents), cursor)
+    assert not is_done
+    assert first == [7, 14, 21, 28, 35]
+    assert second == [42, 49, 56, 63, 70]
+
+
+def test_missing_gram_and_deleted_documents():
+    documents = {1: "検索対象の文書", 2: "検索対象の文書"}
+    index = build(documents)
+
+    assert index.search("存在しない", 10, documents.get, iter(documents)) == ([], True, None)
+
+    index.remove(1)
+    del documents[1]
+    assert index.search("対象", 10, documents.get, iter(documents)) == ([2], True, None)
@@ -0,0 +1,53 @@
+import pytest
+
+from latency_histogram import LatencyHistogram
+
+
+def test_percentiles_within_relative_error():
+    hist = LatencyHistogram(relative_error=0.01)
+    for value in range(1, 1001):
+        hist.record(value)
+
+    assert hist.count == 1000
+    for p, expected in ((50, 500), (90, 900), (99, 990)):
+        assert hist.percentile(p) == pytest.approx(expected, rel=0.02)
+
+
+def test_percentile_is_clamped_to_observed_range():
+    hist = LatencyHistogram()
+    hist.record(120.0, count=3)
+
+    assert hist.percentile(0) == pytest.approx(120.0, rel=0.01)
+    assert hist.percentile(100) == pytest.approx(120.0, rel=0.01)
+    assert hist.min <= hist.percentile(50) <= hist.max
+
+
+def test_zero_values_and_empty_histogram():
+    hist = LatencyHistogram()
+    assert hist.percentile(50) is None
+    assert hist.summary()["count"] == 0
+
+    hist.record(0)
+    hist.record(-5)
+    hist.record(10)
+    assert hist.zero_count == 2
+    assert hist.percentile(50) == 0
+
+
+def test_merge_combines_counts():
+    left, right = LatencyHistogram(), LatencyHistogram()
+    for value in range(1, 101):
+        left.record(value)
+    for value in range(101, 201):
+        right.record(value)
+
+    left.merge(right)
+    assert left.count == 200
+    assert left.max == 200
+    assert left.percentile(50) == pytest.approx(100, rel=0.02)
+    assert left.mean == pytest.approx(100.5, rel=0.01)
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        LatencyHistogram(relative_error=0.01).merge(LatencyHistogram(relative_error=0.05))
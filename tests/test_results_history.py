@@ -0,0 +1,105 @@
+import pytest
+
+import results_history
+
+STUB_URL = "http://127.0.0.1:3210"
+PROD_URL = "https://example.convex.cloud"
+
+
+def make_results(p95, error_rate=0.0):
+    return {
+        "performance": [{
+            "test_name": "負荷試験",
+            "metrics": {"latency_ms": {"p50": p95 / 2, "p95": p95, "p99": p95 * 1.2}, "error_rate": error_rate},
+        }],
+        "functionality": [{"test_name": "ページ読み込み", "metrics": {"load_time_ms": 999}}],
+    }
+
+
+def record_series(conn, values, deploy_url=STUB_URL, **kwargs):
+    for i, value in enumerate(values):
+        results_history.record_run(conn, make_results(value, **kwargs), deploy_url,
+                                   recorded_at=f"2026-01-01T00:00:{i:02d}")
+
+
+def findings_by_metric(findings):
+    return {finding["metric"]: finding for finding in findings}
+
+
+@pytest.fixture
+def conn():
+    with results_history.connect(":memory:") as connection:
+        yield connection
+
+
+def test_extract_run_metrics_tracks_performance_only():
+    results = make_results(200, error_rate=0.05)
+    results["functionality"].append({"test_name": "RAG回答_挨拶", "metrics": {"error_rate": 0.5}})
+    results["summary"] = {"latency": {"by_test": {"RAG回答_挨拶": {"response_time_ms": {"p50": 800, "p95": None}}}}}
+
+    metrics = results_history.extract_run_metrics(results)
+    assert metrics == {
+        "負荷試験.latency_ms.p50": 100,
+        "負荷試験.latency_ms.p95": 200,
+        "負荷試験.latency_ms.p99": 240,
+        "負荷試験.error_rate": 0.05,
+        "RAG回答_挨拶.error_rate": 0.5,
+        "RAG回答_挨拶.response_time_ms.p50": 800,
+    }
+
+
+def test_detects_latency_regression(conn):
+    record_series(conn, [200, 205, 198, 202, 201, 400])
+
+    latest_id, findings = results_history.detect_regressions(conn)
+    finding = findings_by_metric(findings)["負荷試験.latency_ms.p95"]
+    assert latest_id == 6
+    assert finding["regression"]
+    assert finding["baseline_runs"] == 5
+    assert finding["baseline_median"] == 201
+
+
+def test_noise_is_not_a_regression(conn):
+    record_series(conn, [200, 205, 198, 202, 201, 210])
+
+    _, findings = results_history.detect_regressions(conn)
+    assert not any(finding["regression"] for finding in findings)
+
+
+def test_min_runs_skips_short_history(conn):
+    record_series(conn, [200, 201, 400])
+
+    _, findings = results_history.detect_regressions(conn, min_runs=3)
+    assert findings == []
+
+
+def test_baseline_is_scoped_to_latest_deploy_url(conn):
+    # 本番の遅い実行はスタブのベースラインに混ざらない
+    record_series(conn, [2000, 2100, 2050], deploy_url=PROD_URL)
+    record_series(conn, [200, 205, 198, 202])
+
+    _, findings = results_history.detect_regressions(conn)
+    finding = findings_by_metric(findings)["負荷試験.latency_ms.p95"]
+    assert finding["baseline_runs"] == 3
+    assert finding["baseline_median"] == 200
+
+    _, findings = results_history.detect_regressions(conn, deploy_url=PROD_URL)
+    assert findings == []
+
+
+def test_rate_floor_with_zero_baseline(conn):
+    record_series(conn, [200, 200, 200], error_rate=0.0)
+    results_history.record_run(conn, make_results(200, error_rate=0.005), STUB_URL, recorded_at="2026-01-02")
+
+    _, findings = results_history.detect_regressions(conn)
+    finding = findings_by_metric(findings)["負荷試験.error_rate"]
+    assert finding["change"] == float("inf")
+    assert not finding["regression"]
+
+    results_history.record_run(conn, make_results(200, error_rate=0.05), STUB_URL, recorded_at="2026-01-03")
+    _, findings = results_history.detect_regressions(conn)
+    assert findings_by_metric(findings)["負荷試験.error_rate"]["regression"]
+
+
+def test_empty_history(conn):
+    assert results_history.detect_regressions(conn) == (None, [])
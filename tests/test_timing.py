@@ -0,0 +1,47 @@
+from async_http import parse_server_timing
+from quality_verification import split_request_timing
+
+
+def test_parse_server_timing():
+    header = 'translate;dur=812.3, search;desc="vector";dur=95, cache;desc=hit, bad;dur=abc, quoted;dur="1.5"'
+    assert parse_server_timing(header) == {"translate": 812.3, "search": 95.0, "quoted": 1.5}
+
+
+def test_parse_server_timing_empty():
+    assert parse_server_timing(None) == {}
+    assert parse_server_timing("") == {}
+    assert parse_server_timing(";dur=10") == {}
+
+
+def test_split_request_timing_new_connection():
+    timing = {
+        "startTime": 1700000000000.0,
+        "domainLookupStart": 0.5, "domainLookupEnd": 10.5,
+        "connectStart": 10.5, "secureConnectionStart": 30.0, "connectEnd": 60.25,
+        "requestStart": 60.5, "responseStart": 460.5, "responseEnd": 500.0,
+    }
+    assert split_request_timing(timing) == {
+        "total_ms": 500.0,
+        "dns_ms": 10.0,
+        "connect_ms": 49.8,
+        "ssl_ms": 30.2,
+        "request_ms": 60.5,
+        "ttfb_ms": 400.0,
+        "receive_ms": 39.5,
+    }
+
+
+def test_split_request_timing_reused_connection():
+    # 接続を再利用した場合、DNS・接続・TLSの区間は -1（未計測）になる
+    timing = {
+        "domainLookupStart": -1, "domainLookupEnd": -1,
+        "connectStart": -1, "secureConnectionStart": -1, "connectEnd": -1,
+        "requestStart": 1.0, "responseStart": 301.0, "responseEnd": -1,
+    }
+    split = split_request_timing(timing)
+    assert split["dns_ms"] is None
+    assert split["connect_ms"] is None
+    assert split["ssl_ms"] is None
+    assert split["ttfb_ms"] == 300.0
+    assert split["total_ms"] is None
+    assert split["receive_ms"] is None
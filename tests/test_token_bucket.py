@@ -0,0 +1,54 @@
+import types
+
+import embedding_benchmark
+from embedding_benchmark import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+def fake_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(embedding_benchmark, "time", types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+def test_burst_up_to_capacity_then_waits(monkeypatch):
+    clock = fake_time(monkeypatch)
+    bucket = TokenBucket(per_minute=120)  # 2件/秒、容量2
+
+    bucket.take()
+    bucket.take()
+    assert clock.slept == []
+
+    bucket.take()
+    assert clock.slept == [0.5]
+
+
+def test_refill_is_capped_at_capacity(monkeypatch):
+    clock = fake_time(monkeypatch)
+    bucket = TokenBucket(per_minute=120)
+
+    clock.now += 60  # 長く空いても容量を超えて貯まらない
+    for _ in range(3):
+        bucket.take()
+    assert clock.slept == [0.5]
+
+
+def test_drain_forces_wait(monkeypatch):
+    clock = fake_time(monkeypatch)
+    bucket = TokenBucket(per_minute=60)
+
+    bucket.drain()  # 429を受けたら残りの枠を捨てる
+    bucket.take()
+    assert clock.slept == [1.0]
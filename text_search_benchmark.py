@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+searchByText のベンチマーク（全件走査 vs 文字bigram転置インデックス）
+従来の search.ts は documents を全件 collect して toLowerCase().includes() で絞り込んでいたため、
+検索1回のコストがコーパス全体に比例していた。textIndex.ts と同じ手順の BigramIndex
+（convex_stub_server.py）と従来の走査を、コーパスを段階的に増やしながら比較する。
+
+計測項目（コーパスの各サイズごと）:
+  - 検索レイテンシ p50/p95（走査・インデックス。インデックスは searchByTextPage と同じく isDone になるか limit 件そろうまで
+    continueCursor で呼び直した合計）
+  - 本文を確認したdocument数と、1回の呼び出しで読んだposting数の最大（Convexではクエリの読み取り量に相当し、
+    長い質問でも MAX_PROBED_GRAMS × (MAX_POSTINGS_PER_GRAM + 1) 以下に収まる）
+  - インデックスへの追加スループットとposting数（text_index の行数）
+  - 走査と同じ結果を返した割合（continueCursor で続きを読むので100%になるはず）
+
+使い方:
+  python text_search_benchmark.py                                   # 合成コーパスで 1000〜20000件
+  python text_search_benchmark.py --sizes 10000 100000 --queries 200
+  python text_search_benchmark.py --documents documents.jsonl       # documentsのエクスポートで計測
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+from chunking_benchmark import recursive_character_split, synthesize_pages
+from convex_stub_server import BigramIndex
+from embedding_store import iter_documents
+from latency_histogram import LatencyHistogram
+
+DEFAULT_SIZES = [1000, 5000, 20000]
+SEARCH_LIMIT = 10  # searchByText の既定値
+
+
+def synthetic_chunks(seed=0):
+    """合成ページを document-processor.ts と同じ設定でチャンク化したテキストを無限に返す"""
+    for batch in itertools.count():
+        for page in synthesize_pages(50, seed=seed + batch):
+            yield from recursive_character_split(page["text"], 1000, 200)
+
+
+def build_queries(texts, count=100, seed=1):
+    """種類の異なる検索語を作る: コーパス中の珍しい部分文字列、長い文（質問文そのままの検索）、よく出る語、
+    存在しない語、1文字"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            text = rng.choice(texts)
+            length = rng.randint(4, 12) if kind < 0.4 else rng.randint(30, 45)
+            start = rng.randrange(max(1, len(text) - length))
+            queries.append(("rare" if kind < 0.4 else "long", text[start:start + length]))
+        elif kind < 0.8:
+            queries.append(("common", rng.choice(["強化石", "ドロップ率", "限界突破", "北の洞窟", "攻撃力"])))
+        elif kind < 0.95:
+            queries.append(("missing", rng.choice(["存在しない語句", "転生システム", "ギルド対抗戦"])))
+        else:
+            queries.append(("single", rng.choice(["炎", "石", "%"])))
+    return queries
+
+
+def scan_search(documents, search_text, limit):
+    """従来の searchByText: 全件を読んで部分一致したものの先頭 limit 件を返す"""
+    needle = search_text.lower()
+    return [doc_id for doc_id, text in documents.items() if needle in text.lower()][:limit]
+
+
+def paged_search(index, documents, query, limit):
+    """searchByTextPage の呼び出し側の手順: isDone になるか limit 件そろうまで continueCursor で続きを検索する"""
+    found, cursor, reads, max_postings, calls = [], None, 0, 0, 0
+    while True:
+        ids, is_done, cursor = index.search(query, limit - len(found), documents.get, iter(documents), cursor)
+        calls += 1
+        reads += index.last_reads
+        max_postings = max(max_postings, index.last_posting_reads)
+        found.extend(ids)
+        if is_done or len(found) >= limit:
+            return found, {"reads": reads, "max_postings": max_postings, "calls": calls}
+
+
+def measure(documents, index, queries, limit=SEARCH_LIMIT):
+    scan_latency = LatencyHistogram()
+    index_latency = LatencyHistogram()
+    reads = 0
+    calls = 0
+    max_postings = 0
+    agree = 0
+    for _, query in queries:
+        started = time.perf_counter()
+        expected = scan_search(documents, query, limit)
+        scan_latency.record((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        found, usage = paged_search(index, documents, query, limit)
+        index_latency.record((time.perf_counter() - started) * 1000)
+        reads += usage["reads"]
+        calls += usage["calls"]
+        max_postings = max(max_postings, usage["max_postings"])
+        agree += found == expected
+    return {
+        "scan_ms": scan_latency.summary(),
+        "index_ms": index_latency.summary(),
+        "scan_reads_per_query": len(documents),
+        "index_reads_per_query": round(reads / len(queries), 1),
+        "index_calls_per_query": round(calls / len(queries), 2),
+        "max_postings_per_call": max_postings,
+        "same_results": agree / len(queries),
+    }
+
+
+def run_benchmark(texts, sizes=DEFAULT_SIZES, query_count=100, limit=SEARCH_LIMIT):
+    documents = {}
+    index = BigramIndex()
+    report = []
+    for size in sorted(sizes):
+        started = time.perf_counter()
+        added = 0
+        for text in itertools.islice(texts, size - len(documents)):
+            doc_id = f"d{len(documents):08d}"
+            documents[doc_id] = text
+            index.add(doc_id, text)
+            added += 1
+        elapsed = time.perf_counter() - started
+        if len(documents) < size:
+            print(f"⚠️ コーパスが{len(documents)}件しかないため、{size}件の計測を打ち切ります")
+            size = len(documents)
+            if report and report[-1]["documents"] == size:
+                break
+
+        queries = build_queries(list(documents.values()), query_count)
+        result = {
+            "documents": size,
+            "postings": sum(len(posting) for posting in index.postings.values()),
+            "grams": len(index.postings),
+            "index_adds_per_s": round(added / elapsed, 1) if elapsed else None,
+            **measure(documents, index, queries, limit),
+        }
+        by_kind = {}
+        for kind, query in queries:
+            started = time.perf_counter()
+            paged_search(index, documents, query, limit)
+            by_kind.setdefault(kind, LatencyHistogram()).record((time.perf_counter() - started) * 1000)
+        result["index_ms_by_kind"] = {kind: histogram.summary() for kind, histogram in by_kind.items()}
+        report.append(result)
+        yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="searchByText: 全件走査 vs bigram転置インデックス")
+    parser.add_argument("--documents", help="documentsのエクスポート（JSON/JSONL、省略時は合成コーパス）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="計測するコーパスの件数")
+    parser.add_argument("--queries", type=int, default=100, help="各サイズで実行する検索の数")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    parser.add_argument("--output", help="レポートの保存先（JSON）")
+    args = parser.parse_args()
+
+    if args.documents:
+        texts = (doc.get("text", "") for doc in iter_documents(args.documents))
+    else:
+        texts = synthetic_chunks()
+
+    report = []
+    print(f"{'件数':>8} {'走査p50':>9} {'走査p95':>9} {'索引p50':>9} {'索引p95':>9} {'確認件数':>8} {'posting最大':>11} {'一致率':>6} {'posting数':>11}")
+    for result in run_benchmark(texts, args.sizes, args.queries, args.limit):
+        report.append(result)
+        print(f"{result['documents']:>8} {result['scan_ms']['p50']:>8.2f}ms {result['scan_ms']['p95']:>8.2f}ms "
+              f"{result['index_ms']['p50']:>8.3f}ms {result['index_ms']['p95']:>8.3f}ms "
+              f"{result['index_reads_per_query']:>8} {result['max_postings_per_call']:>11} "
+              f"{result['same_results'] * 100:>5.0f}% {result['postings']:>11}")
+
+    if len(report) > 1:
+        first, last = report[0], report[-1]
+        growth = last["documents"] / first["documents"]
+        print(f"\n📈 コーパス{growth:.0f}倍で 走査p50 {last['scan_ms']['p50'] / first['scan_ms']['p50']:.1f}倍, "
+              f"索引p50 {last['index_ms']['p50'] / first['index_ms']['p50']:.1f}倍")
+        print(f"   posting数は1documentあたり約{last['postings'] / last['documents']:.0f}行"
+              f"（text_index への書き込み量の目安）")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 レポートを{args.output}に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
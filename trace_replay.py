@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+ネットワークトレース（HAR）のオフライン再生
+quality_verification.py --trace-dir で記録した /api/chat の応答を、記録時のTTFB・本文転送時間どおりに
+ローカルのモックサーバーから返し、回答検出・タイミング計測ロジックを本番環境なしで決定的にベンチマークする。
+
+使い方:
+  python trace_replay.py traces/ --repeat 5      # 再生ベンチマーク
+  python trace_replay.py traces/ --serve         # モックサーバーのみ起動
+  python trace_replay.py traces/ --untagged      # data-testid を付ける前のデプロイのマークアップで再生
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from latency_histogram import LatencyHistogram
+from stub_chat_server import StubChatHandler
+
+# skb-frontend/src/app/page.tsx と同じDOM構造のチャット画面（クラス名・要素の出し入れ・ボタンの並びを揃えている）
+# 回答・エラー・処理中の表示は page.tsx と同じく、状態が変わったときにだけ要素ごと描画する
+REPLAY_PAGE_HTML = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>SmartKnowledgeBot (replay)</title></head>
+<body>
+<div class="min-h-screen bg-gradient-to-br from-blue-50 to-indigo-100">
+  <div class="container mx-auto px-4 py-8">
+    <div class="max-w-4xl mx-auto">
+      <header class="text-center mb-8">
+        <h1 class="text-4xl font-bold text-gray-900 mb-4">SmartKnowledgeBot</h1>
+        <p class="text-lg text-gray-600">AI-powered knowledge search and question answering system</p>
+      </header>
+      <div class="bg-white rounded-lg shadow-lg p-6 mb-6">
+        <div class="flex justify-between items-center mb-4">
+          <h2 class="text-lg font-semibold text-gray-900">質問入力</h2>
+          <div class="flex gap-2">
+            <button type="button" class="text-sm bg-gray-100 px-3 py-1 rounded-md">履歴 (0)</button>
+          </div>
+        </div>
+        <form id="chat-form" class="space-y-4">
+          <div>
+            <label for="question" class="block text-sm font-medium text-gray-700 mb-2">質問を入力してください</label>
+            <textarea id="question" rows="4" class="w-full px-3 py-2 border border-gray-300 rounded-md" maxlength="500"></textarea>
+            <div class="mt-1 text-sm text-gray-500" id="counter">0/500文字</div>
+          </div>
+          <div id="status-slot"></div>
+          <button type="submit" id="submit" class="w-full bg-blue-600 text-white font-medium py-2 px-4 rounded-md flex items-center justify-center">質問する</button>
+        </form>
+      </div>
+      <div id="answer-slot"></div>
+    </div>
+  </div>
+</div>
+<script>
+const SPINNER = '<svg class="animate-spin -ml-1 mr-3 h-5 w-5" viewBox="0 0 24 24"><circle class="opacity-25" cx="12" cy="12" r="10"></circle></svg>';
+const question = document.getElementById('question');
+const submit = document.getElementById('submit');
+const statusSlot = document.getElementById('status-slot');
+const answerSlot = document.getElementById('answer-slot');
+const escape = (text) => text.replace(/[&<>]/g, (c) => ({'&': '&amp;', '<': '&lt;', '>': '&gt;'}[c]));
+question.addEventListener('input', () => {
+  document.getElementById('counter').textContent = `${question.value.length}/500文字`;
+});
+const showProcessing = (step) => {
+  statusSlot.innerHTML = `<div data-testid="loading" class="bg-blue-50 border border-blue-200 rounded-md p-3">
+    <div class="flex items-center">${SPINNER}<p class="text-sm text-blue-800">${step}</p></div></div>`;
+};
+const showError = (message) => {
+  statusSlot.innerHTML = `<div class="bg-red-50 border border-red-200 rounded-md p-3"><div class="flex">
+    <div class="ml-3"><p data-testid="error" class="text-sm text-red-800">${escape(message)}</p></div></div></div>`;
+};
+const showAnswer = (text, relevantDocs) => {
+  const badge = relevantDocs > 0
+    ? `<span class="inline-flex items-center px-3 py-1 rounded-full text-sm font-medium">📚 ${relevantDocs}件の関連ドキュメント</span>` : '';
+  answerSlot.innerHTML = `<div class="bg-white rounded-lg shadow-lg p-6">
+    <div class="flex items-center justify-between mb-4"><h3 class="text-lg font-semibold text-gray-900">回答</h3>${badge}</div>
+    <div class="prose max-w-none"><p data-testid="response" class="whitespace-pre-wrap text-gray-700">${escape(text)}</p></div></div>`;
+};
+document.getElementById('chat-form').addEventListener('submit', async (event) => {
+  event.preventDefault();
+  statusSlot.innerHTML = '';
+  answerSlot.innerHTML = '';
+  question.disabled = true;
+  submit.disabled = true;
+  submit.innerHTML = `${SPINNER}回答中...`;
+  showProcessing('AIエージェントに接続中...');
+  try {
+    const res = await fetch('/api/chat', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({message: question.value, action: 'rag_search'}),
+    });
+    if (!res.ok) {
+      throw new Error(`サーバーエラー (${res.status}): ${await res.text()}`);
+    }
+    showProcessing('回答を生成中...');
+    const data = await res.json();
+    if (!data.success) {
+      throw new Error(data.error || 'Unknown error occurred');
+    }
+    showAnswer(data.aiResponse, data.relevantDocuments || 0);
+    statusSlot.innerHTML = '';
+  } catch (error) {
+    showError(`エラー: ${error.message}`);
+  } finally {
+    question.disabled = false;
+    submit.disabled = false;
+    submit.textContent = '質問する';
+  }
+});
+</script>
+</body>
+</html>
+"""
+
+REPLAY_CHUNKS = 8  # 本文転送時間を再現するための分割数
+
+
+def replay_page_html(tagged=True):
+    """再生用のページ。tagged=False では data-testid を付ける前のデプロイと同じマークアップにする"""
+    if tagged:
+        return REPLAY_PAGE_HTML
+    return re.sub(r' data-testid="[^"]*"', "", REPLAY_PAGE_HTML)
+
+
+def load_chat_traces(paths):
+    """HARファイル群から /api/chat のエントリを抽出する"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.har"))))
+        else:
+            files.append(path)
+
+    traces = []
+    for file_path in files:
+        with open(file_path, encoding="utf-8") as f:
+            har = json.load(f)
+        for entry in har["log"]["entries"]:
+            if "/api/chat" not in entry["request"]["url"] or entry["request"]["method"] != "POST":
+                continue
+            content = entry["response"]["content"]
+            if "text" not in content:
+                continue
+            try:
+                message = json.loads(entry["request"]["postData"]["text"]).get("message", "")
+            except (KeyError, ValueError):
+                message = ""
+            timings = entry["timings"]
+            traces.append({
+                "file": os.path.basename(file_path),
+                "message": message,
+                "status": entry["response"]["status"],
+                "body": content["text"].encode("utf-8"),
+                "wait_ms": max(0, timings.get("wait", 0)),
+                "receive_ms": max(0, timings.get("receive", 0)),
+            })
+    return traces
+
+
+class ReplayHandler(StubChatHandler):
+    """記録済みトレースを記録時のタイミングで返すハンドラ"""
+
+    def do_GET(self):
+        body = replay_page_html(self.server.tagged).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+        if self.path != "/api/chat":
+            self._send_json(404, {"success": False, "error": "Not found"})
+            return
+
+        try:
+            message = json.loads(raw).get("message", "")
+        except ValueError:
+            message = ""
+        trace = self.server.next_trace(message)
+        speed = self.server.speed
+
+        # TTFB（サーバー処理時間）を再現
+        time.sleep(trace["wait_ms"] / 1000 / speed)
+        self.send_response(trace["status"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # 本文転送時間を再現するため、分割して間隔をあけて送信する
+        body = trace["body"]
+        chunk_size = max(1, -(-len(body) // REPLAY_CHUNKS))
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        interval = trace["receive_ms"] / 1000 / speed / max(1, len(chunks))
+        for chunk in chunks:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, traces, speed=1.0, tagged=True):
+        super().__init__(address, ReplayHandler)
+        self.traces = traces
+        self.speed = speed
+        self.tagged = tagged
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._by_message = {}
+        for trace in traces:
+            self._by_message.setdefault(trace["message"], []).append(trace)
+
+    def next_trace(self, message):
+        """質問文が一致するトレースを優先し、なければ順番に返す"""
+        with self._lock:
+            candidates = self._by_message.get(message) or self.traces
+            trace = candidates[self._cursor % len(candidates)]
+            self._cursor += 1
+            return trace
+
+
+def start_replay_server(traces, host="127.0.0.1", port=0, speed=1.0, tagged=True):
+    """再生サーバーをバックグラウンドで起動し、(server, base_url) を返す"""
+    server = ReplayServer((host, port), traces, speed, tagged)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def run_replay_benchmark(traces, repeat=3, speed=1.0, tagged=True):
+    """全トレースを repeat 回ずつ再生し、検出ロジックの計測値を集計する"""
+    from playwright.sync_api import sync_playwright
+    from quality_verification import find_submit_button, wait_for_rag_answer
+
+    server, base_url = start_replay_server(traces, speed=speed, tagged=tagged)
+    histograms = {
+        "response_time_ms": LatencyHistogram(),
+        "api_time_ms": LatencyHistogram(),
+        "detection_overhead_ms": LatencyHistogram(),
+        "first_token_ms": LatencyHistogram(),
+        "final_text_ms": LatencyHistogram(),
+    }
+    misses = 0
+    not_rendered = 0  # /api/chat は回答を返したが、画面の回答表示を検出できなかった回数（タイムラインが None になる）
+
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            page = browser.new_page()
+            page.goto(base_url)
+            for _ in range(repeat):
+                for trace in traces:
+                    page.locator("textarea").fill(trace["message"])
+                    answer = wait_for_rag_answer(page, find_submit_button(page))
+                    if not answer["answered"]:
+                        misses += 1
+                        continue
+                    histograms["response_time_ms"].record(answer["response_time_ms"])
+                    if not answer["rendered"]:
+                        not_rendered += 1
+                    else:
+                        histograms["first_token_ms"].record(answer["first_token_ms"])
+                        histograms["final_text_ms"].record(answer["final_text_ms"])
+                    if answer["api_time_ms"] is not None:
+                        histograms["api_time_ms"].record(answer["api_time_ms"])
+                        histograms["detection_overhead_ms"].record(
+                            max(0.0, answer["response_time_ms"] - answer["api_time_ms"]))
+            browser.close()
+    finally:
+        server.shutdown()
+
+    return {
+        "traces": len(traces),
+        "repeat": repeat,
+        "speed": speed,
+        "markup": "tagged" if tagged else "untagged",
+        "misses": misses,
+        "not_rendered": not_rendered,
+        "timings": {name: histogram.summary() for name, histogram in histograms.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ネットワークトレースのオフライン再生")
+    parser.add_argument("paths", nargs="+", help="HARファイルまたはディレクトリ")
+    parser.add_argument("--repeat", type=int, default=3, help="各トレースの再生回数")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度倍率（2で記録の半分の時間）")
+    parser.add_argument("--serve", action="store_true", help="モックサーバーのみ起動")
+    parser.add_argument("--port", type=int, default=3200)
+    parser.add_argument("--untagged", action="store_true",
+                        help="data-testid を付ける前のデプロイと同じマークアップで再生する")
+    args = parser.parse_args()
+
+    traces = load_chat_traces(args.paths)
+    if not traces:
+        raise SystemExit("/api/chat のトレースが見つかりません")
+    print(f"🧾 {len(traces)}件のトレースを読み込みました")
+
+    if args.serve:
+        server, base_url = start_replay_server(traces, port=args.port, speed=args.speed,
+                                               tagged=not args.untagged)
+        print(f"🧪 再生サーバー起動: {base_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        report = run_replay_benchmark(traces, args.repeat, args.speed, not args.untagged)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if report["not_rendered"]:
+            print(f"❌ {report['not_rendered']}件の回答で画面表示を検出できず、初回表示・表示完了の時刻が記録されませんでした")
+            raise SystemExit(1)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+常駐型の検証デーモン（ウォーム済みブラウザプール）
+ブラウザとコンテキストを起動したまま保持し、ローカルソケット経由のチェック要求を処理する。
+起動コストは初回のみで、定期的な合成監視（毎分のチェックなど）を軽量に実行できる。
+
+使い方:
+  python verification_daemon.py serve --workers 2            # デーモン起動
+  python verification_daemon.py check --question "こんにちは"  # チェック要求（失敗時は終了コード1）
+  python verification_daemon.py stats                         # プール統計
+"""
+
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from playwright.sync_api import sync_playwright
+
+from quality_verification import BASE_URL, CONTEXT_OPTIONS, find_submit_button, wait_for_rag_answer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class CheckJob:
+    """ワーカーへ渡すチェック要求と、その完了通知"""
+
+    def __init__(self, request):
+        self.request = request
+        self.result = None
+        self.done = threading.Event()
+
+    def complete(self, result):
+        self.result = result
+        self.done.set()
+
+
+class BrowserWorker(threading.Thread):
+    """専用ブラウザを保持してチェックを処理するワーカー
+
+    コンテキストは max_context_uses 回、ブラウザは max_browser_uses 回使ったら作り直す。
+    ブラウザが切断された場合も次のチェックで再起動する。
+    起動に失敗した場合は startup_error に例外を保持して終了する（ready は必ずセットする）。
+    """
+
+    def __init__(self, worker_id, jobs, stats, headless=True, warm_url=None,
+                 max_context_uses=20, max_browser_uses=200):
+        super().__init__(daemon=True)
+        self.worker_id = worker_id
+        self.jobs = jobs
+        self.stats = stats
+        self.headless = headless
+        self.warm_url = warm_url
+        self.max_context_uses = max_context_uses
+        self.max_browser_uses = max_browser_uses
+        self.ready = threading.Event()
+        self.startup_error = None
+        self._playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.context_uses = 0
+        self.browser_uses = 0
+        self.browser_launches = 0  # このワーカーが起動したブラウザの数（コールド判定はワーカーごとに行う）
+
+    def run(self):
+        try:
+            with sync_playwright() as p:
+                self._playwright = p
+                try:
+                    self._launch_browser()
+                    self._new_context()
+                except Exception as e:
+                    # Chromium未インストールなど: プールの start() で再送出する
+                    self.startup_error = e
+                    self._close_browser()
+                    return
+                finally:
+                    self.ready.set()
+
+                if self.warm_url:
+                    # ウォームアップ: DNS・TLS・HTTPキャッシュを温めておく
+                    try:
+                        self.page.goto(self.warm_url, wait_until="networkidle", timeout=30000)
+                    except Exception as e:
+                        print(f"⚠️ ワーカー{self.worker_id}: ウォームアップ失敗: {str(e)}")
+
+                while True:
+                    job = self.jobs.get()
+                    if job is None:
+                        break
+                    job.complete(self._run_check(job.request))
+
+                self._close_browser()
+        except Exception as e:
+            # sync_playwright() 自体の起動失敗（ドライバが見つからないなど）
+            if self.ready.is_set():
+                raise
+            self.startup_error = e
+        finally:
+            self.ready.set()
+
+    def _launch_browser(self):
+        self.browser = self._playwright.chromium.launch(headless=self.headless)
+        self.browser_uses = 0
+        self.browser_launches += 1
+        self.stats.increment("browser_launches")
+
+    def _new_context(self):
+        if self.context is not None:
+            self.context.close()
+        self.context = self.browser.new_context(**CONTEXT_OPTIONS)
+        self.page = self.context.new_page()
+        self.context_uses = 0
+        self.stats.increment("context_creations")
+
+    def _close_browser(self):
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except Exception:
+            pass
+        self.browser = None
+        self.context = None
+        self.page = None
+
+    def _prepare(self):
+        """使用回数の上限と接続状態に応じてブラウザ・コンテキストを再生成する"""
+        if self.browser is None or not self.browser.is_connected() or self.browser_uses >= self.max_browser_uses:
+            self._close_browser()
+            self._launch_browser()
+            self._new_context()
+        elif self.context_uses >= self.max_context_uses or self.page.is_closed():
+            self._new_context()
+
+    def _run_check(self, request):
+        started = time.perf_counter()
+        cold = False
+        try:
+            # プール全体のカウンタは他のワーカーの起動でも増えるため、このワーカーの起動回数で判定する
+            launches_before = self.browser_launches
+            self._prepare()
+            cold = self.browser_launches != launches_before
+            self.context_uses += 1
+            self.browser_uses += 1
+
+            base_url = request.get("base_url") or BASE_URL
+            load_start = time.perf_counter()
+            response = self.page.goto(base_url, wait_until="networkidle", timeout=30000)
+            result = {
+                "http_status": response.status if response else None,
+                "load_time_ms": round((time.perf_counter() - load_start) * 1000, 1),
+            }
+            status = "pass" if response and response.status == 200 else "fail"
+
+            question = request.get("question")
+            if status == "pass" and question:
+                self.page.locator('input[type="text"], textarea').first.fill(question)
+                answer = wait_for_rag_answer(self.page, find_submit_button(self.page))
+                result["answer"] = answer
+                if not answer["answered"]:
+                    status = "fail"
+        except Exception as e:
+            status = "fail"
+            result = {"error": str(e)}
+            # 異常終了したコンテキストは再利用しない
+            self.context_uses = self.max_context_uses
+
+        check_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.stats.record_check(status, check_ms, cold)
+        result.update({"status": status, "check_ms": check_ms, "worker": self.worker_id, "cold_start": cold})
+        return result
+
+
+class PoolStats:
+    """プール全体の統計（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"browser_launches": 0, "context_creations": 0, "checks": 0,
+                          "passed": 0, "failed": 0, "cold_checks": 0, "total_check_ms": 0.0}
+        self.started_at = time.time()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name):
+        with self._lock:
+            return self._counters[name]
+
+    def record_check(self, status, check_ms, cold):
+        with self._lock:
+            self._counters["checks"] += 1
+            self._counters["passed" if status == "pass" else "failed"] += 1
+            self._counters["cold_checks"] += 1 if cold else 0
+            self._counters["total_check_ms"] += check_ms
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        checks = counters["checks"]
+        counters["mean_check_ms"] = round(counters["total_check_ms"] / checks, 1) if checks else None
+        counters["uptime_s"] = round(time.time() - self.started_at, 1)
+        return counters
+
+
+class VerificationPool:
+    """ウォーム済みブラウザワーカーのプール"""
+
+    def __init__(self, workers=2, headless=True, warm_url=None, max_context_uses=20, max_browser_uses=200):
+        self.jobs = queue.Queue()
+        self.stats = PoolStats()
+        self.workers = [
+            BrowserWorker(i, self.jobs, self.stats, headless, warm_url, max_context_uses, max_browser_uses)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        for worker in self.workers:
+            worker.ready.wait()
+
+        failed = [worker for worker in self.workers if worker.startup_error is not None]
+        if failed:
+            self.shutdown()
+            raise RuntimeError(
+                f"{len(failed)}/{len(self.workers)}ワーカーの起動に失敗しました: {failed[0].startup_error}"
+            ) from failed[0].startup_error
+
+    def submit(self, request, timeout=120):
+        job = CheckJob(request)
+        self.jobs.put(job)
+        if not job.done.wait(timeout):
+            return {"status": "fail", "error": "チェックがタイムアウトしました"}
+        return job.result
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=30)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """1行1リクエストのJSONプロトコル: {"command": "check"|"stats"|"shutdown", ...}"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self._reply({"error": "invalid json"})
+                continue
+
+            command = request.get("command", "check")
+            if command == "check":
+                self._reply(self.server.pool.submit(request))
+            elif command == "stats":
+                self._reply(self.server.pool.stats.snapshot())
+            elif command == "shutdown":
+                self._reply({"status": "shutting down"})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            else:
+                self._reply({"error": f"unknown command: {command}"})
+
+    def _reply(self, payload):
+        self.wfile.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, pool):
+        super().__init__(address, DaemonRequestHandler)
+        self.pool = pool
+
+
+def send_request(payload, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=180):
+    """デーモンへリクエストを送り、レスポンスを返す"""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常駐型検証デーモン")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="デーモンを起動")
+    serve_parser.add_argument("--workers", type=int, default=2, help="ウォーム状態で保持するブラウザ数")
+    serve_parser.add_argument("--warm-url", default=BASE_URL, help="起動時にウォームアップで開くURL（空文字で無効）")
+    serve_parser.add_argument("--max-context-uses", type=int, default=20, help="コンテキストを作り直すまでのチェック数")
+    serve_parser.add_argument("--max-browser-uses", type=int, default=200, help="ブラウザを再起動するまでのチェック数")
+    serve_parser.add_argument("--headed", action="store_true", help="ブラウザを表示して実行")
+
+    check_parser = subparsers.add_parser("check", help="チェックを要求")
+    check_parser.add_argument("--base-url", default=BASE_URL)
+    check_parser.add_argument("--question", help="送信する質問（省略時はページロードのみ）")
+
+    subparsers.add_parser("stats", help="プール統計を表示")
+    subparsers.add_parser("shutdown", help="デーモンを停止")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        pool = VerificationPool(args.workers, not args.headed, args.warm_url or None,
+                                args.max_context_uses, args.max_browser_uses)
+        print(f"🔥 {args.workers}ワーカーをウォームアップ中...")
+        try:
+            pool.start()
+        except RuntimeError as e:
+            print(f"❌ {str(e)}")
+            return 1
+        server = DaemonServer((args.host, args.port), pool)
+        print(f"🚀 検証デーモン起動: {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            pool.shutdown()
+        return 0
+
+    if args.command == "check":
+        payload = {"command": "check", "base_url": args.base_url}
+        if args.question:
+            payload["question"] = args.question
+        result = send_request(payload, args.host, args.port)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0 if result.get("status") == "pass" else 1
+
+    result = send_request({"command": args.command}, args.host, args.port)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())